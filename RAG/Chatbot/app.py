@@ -1,19 +1,22 @@
-import os, sys
+import os, sys, json
 APP_DIR = os.path.dirname(os.path.abspath(__file__))
 PROJECT_ROOT = os.path.dirname(APP_DIR)
 if PROJECT_ROOT not in sys.path:
     sys.path.append(PROJECT_ROOT)
 
 from flask import Flask, render_template, request, jsonify, redirect, url_for, session, flash
+from flask import Response, stream_with_context
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import timedelta
 from functools import wraps
 
 from sqlalchemy import create_engine, Column, Integer, BigInteger, String, Text, Float, Enum, ForeignKey, TIMESTAMP, func, Boolean
+from sqlalchemy import inspect, text
 from sqlalchemy.orm import sessionmaker, declarative_base, relationship, scoped_session
 
-# === RAG function (tanpa CE) ===
-from query_rag_mistral import get_chatbot_response_with_metrics
+# === RAG (tanpa CE): di proses ini atau lewat model_server.py (RAG_MODEL_SERVER) ===
+from model_client import connect, ready_status, ModelServerError
+from scheduler import QueueFull, DeadlineExceeded
 
 # === ROUGE ===
 from rouge_score import rouge_scorer
@@ -66,6 +69,16 @@ class Query(Base):
     llm_answer = Column(Text)
     created_at = Column(TIMESTAMP, server_default=func.now())
 
+    # jawaban diambil dari cache jawaban semantik (tanpa LLM) dan kunci entrinya
+    cache_hit = Column(Boolean, default=False)
+    answer_cache_key = Column(String(32))
+    # waktu sampai potongan jawaban pertama (endpoint streaming), ms
+    ttft_ms = Column(Float)
+    # antrean inferensi: waktu tunggu, waktu layanan (ms) dan permintaan di depannya
+    queue_wait_ms = Column(Float)
+    service_ms = Column(Float)
+    queue_depth = Column(Integer)
+
     user = relationship("User", back_populates="queries")
 
     logs = relationship(
@@ -87,9 +100,15 @@ class RetrievalLog(Base):
     query_id = Column(BigInteger, ForeignKey("queries.id", ondelete="CASCADE"), nullable=False)
     rank_int = Column(Integer, nullable=False)
     cosine_score = Column(Float)
+    bm25_score = Column(Float)     # jalur entitas: BM25 relatif (0..1), bukan cosine
     content_preview = Column(Text)
     is_context_final = Column(Boolean, default=False)
 
+    # asal passage (buku, halaman PDF, bab)
+    source = Column(String(255))
+    page = Column(Integer)
+    chapter = Column(Integer)
+
     query = relationship("Query", back_populates="logs")
 
 class Evaluation(Base):
@@ -123,6 +142,26 @@ class Evaluation(Base):
 # Pastikan tabel tersedia
 Base.metadata.create_all(bind=engine)
 
+def ensure_columns():
+    # create_all tidak menambah kolom baru ke tabel yang sudah ada
+    insp = inspect(engine)
+    for table in Base.metadata.sorted_tables:
+        if not insp.has_table(table.name):
+            continue
+        existing = {c["name"] for c in insp.get_columns(table.name)}
+        for col in table.columns:
+            if col.name in existing:
+                continue
+            ddl = col.type.compile(dialect=engine.dialect)
+            with engine.begin() as conn:
+                conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {col.name} {ddl} NULL"))
+            print(f"[INFO] Kolom ditambahkan: {table.name}.{col.name}")
+
+ensure_columns()
+
+# pipeline RAG + antrean inferensi (lihat model_client.py / scheduler.py)
+models = connect()
+
 # =========================
 # Helpers
 # =========================
@@ -142,6 +181,18 @@ def admin_required(f):
         return f(*args, **kwargs)
     return wrapper
 
+def request_filters():
+    # filter metadata opsional dari form chat: kelas, semester, book
+    filters = {}
+    for key in ("kelas", "semester"):
+        val = (request.form.get(key) or "").strip()
+        if val.isdigit():
+            filters[key] = int(val)
+    book = (request.form.get("book") or "").strip()
+    if book:
+        filters["book"] = book
+    return filters
+
 # =========================
 # Routes: Auth
 # =========================
@@ -217,37 +268,103 @@ def home():
 def about():
     return render_template("about.html")
 
-@app.route("/get_response", methods=["POST"])
-def get_response():
-    user_message = request.form["user_message"]
-
-    # Panggil RAG + metrik (cosine only, tanpa CE)
-    rag = get_chatbot_response_with_metrics(user_message)
-    answer = rag["answer"]
-
-    # Simpan ke MySQL
+def save_query(user_id, user_message, rag):
+    # Simpan Query + semua kandidat RetrievalLog (hanya cosine & flag chosen)
     db = SessionLocal()
     try:
-        q = Query(user_id=session["user_id"], question=user_message, llm_answer=answer)
+        q = Query(user_id=user_id, question=user_message, llm_answer=rag["answer"],
+                  cache_hit=bool(rag.get("cache_hit")), answer_cache_key=rag.get("answer_cache_key"),
+                  ttft_ms=rag.get("ttft_ms"), queue_wait_ms=rag.get("queue_wait_ms"),
+                  service_ms=rag.get("service_ms"), queue_depth=rag.get("queue_depth"))
         db.add(q)
         db.flush()  # untuk dapat q.id
 
-        # simpan semua kandidat (hanya cosine & flag chosen)
         for c in rag["candidates"]:
             log = RetrievalLog(
                 query_id=q.id,
                 rank_int=int(c["rank"]),
                 cosine_score=float(c["cos"]) if c.get("cos") is not None else None,
+                bm25_score=float(c["bm25"]) if c.get("bm25") is not None else None,
                 content_preview=c.get("preview"),
-                is_context_final=bool(c.get("chosen"))
+                is_context_final=bool(c.get("chosen")),
+                source=c.get("source"),
+                page=c.get("page"),
+                chapter=c.get("chapter")
             )
             db.add(log)
 
         db.commit()
+        return q.id
     finally:
         db.close()
 
-    return jsonify({"response": answer})
+@app.route("/get_response", methods=["POST"])
+def get_response():
+    user_message = request.form["user_message"]
+    filters = request_filters()
+
+    # Panggil RAG + metrik (cosine only, tanpa CE) lewat antrean inferensi
+    try:
+        rag = models.answer(user_message, filters=filters)
+    except QueueFull as e:
+        return server_busy(e)
+    except DeadlineExceeded:
+        return jsonify({"error": "Waktu tunggu habis, coba lagi."}), 504
+    except ModelServerError as e:
+        print(f"[WARN] Model server: {e}")
+        return jsonify({"error": "Terjadi kesalahan server."}), 502
+    save_query(session["user_id"], user_message, rag)
+    return jsonify({"response": rag["answer"], **{k: rag.get(k) for k in TIMING_KEYS}})
+
+TIMING_KEYS = ("queue_wait_ms", "service_ms", "queue_depth")
+
+def server_busy(e):
+    # antrean penuh: tolak cepat dengan perkiraan kapan boleh mencoba lagi
+    resp = jsonify({"error": "Server sedang sibuk, coba lagi sebentar lagi.", "retry_after": e.retry_after})
+    resp.status_code = 503
+    resp.headers["Retry-After"] = str(e.retry_after)
+    return resp
+
+def sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.route("/get_response_stream", methods=["POST"])
+def get_response_stream():
+    # Server-Sent Events: "token" per potongan jawaban, "done" berisi jawaban
+    # akhir yang sudah dibersihkan; Query/RetrievalLog disimpan setelah selesai
+    if "user_id" not in session:
+        return jsonify({"error": "login"}), 401
+    user_id = session["user_id"]
+    user_message = request.form["user_message"]
+    filters = request_filters()
+    try:
+        stream = models.answer_stream(user_message, filters=filters)
+    except QueueFull as e:
+        return server_busy(e)
+    except ModelServerError as e:
+        print(f"[WARN] Model server: {e}")
+        return jsonify({"error": "Terjadi kesalahan server."}), 502
+
+    def events():
+        try:
+            for event, data in stream:
+                if event == "token":
+                    yield sse("token", {"text": data})
+                else:
+                    save_query(user_id, user_message, data)
+                    yield sse("done", {"response": data["answer"], "ttft_ms": data.get("ttft_ms"),
+                                       **{k: data.get(k) for k in TIMING_KEYS}})
+        except DeadlineExceeded:
+            yield sse("error", {"message": "Waktu tunggu habis, coba lagi."})
+        except Exception as e:
+            print(f"[WARN] Stream gagal: {e}")
+            yield sse("error", {"message": "Terjadi kesalahan server."})
+        finally:
+            # klien menutup koneksi -> generator ditutup -> generasi dihentikan
+            stream.close()
+
+    return Response(stream_with_context(events()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 # HISTORY SEDERHANA
 @app.route("/history")
@@ -594,10 +711,34 @@ def admin_query_detail(qid):
             flash("Evaluasi tersimpan.", "success")
             return redirect(url_for("admin_query_detail", qid=qid, uid=uid))
 
-        return render_template("admin_query_detail.html", q=q, logs=logs, eval_=eval_, back_url=back_url)
+        cache_entry = models.cache_entry(q.answer_cache_key) if q.answer_cache_key else None
+        return render_template("admin_query_detail.html", q=q, logs=logs, eval_=eval_, back_url=back_url,
+                               cache_entry=cache_entry)
     finally:
         db.close()
 
+@app.route("/admin/answer_cache/<key>/invalidate", methods=["POST"])
+@admin_required
+def admin_answer_cache_invalidate(key):
+    qid = request.args.get("qid", type=int)
+    uid = request.args.get("uid", type=int)
+    invalidated = models.invalidate_cache(key)
+    if invalidated is None:
+        flash("Cache jawaban tidak aktif.", "warning")
+    elif invalidated:
+        flash("Entri cache jawaban dihapus; pertanyaan serupa akan dijawab ulang oleh LLM.", "success")
+    else:
+        flash("Entri cache tidak ditemukan atau sudah di-invalidate.", "warning")
+    if qid:
+        return redirect(url_for("admin_query_detail", qid=qid, uid=uid))
+    return redirect(url_for("admin_users"))
+
+@app.route("/ready")
+def ready():
+    # status muat tiap komponen model (embedding, retrieval, LLM, warm-up) + waktu muat
+    status = models.readiness()
+    return jsonify(status), ready_status(status)
+
 @app.route("/whoami")
 def whoami():
     dbs = SessionLocal()
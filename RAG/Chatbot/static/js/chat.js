@@ -3,10 +3,12 @@
   const userInput = document.getElementById('userInput');
   const chatArea  = document.getElementById('chatArea');
   const submitBtn = document.getElementById('submitBtn');
+  const kelasSel  = document.getElementById('kelasFilter');
   const root      = document.getElementById('chatRoot');
 
   // Ambil konfigurasi dari data-attributes
   const GET_RESPONSE_URL = chatForm?.dataset?.endpoint || '/get_response';
+  const STREAM_URL       = chatForm?.dataset?.streamEndpoint || '';
   const LOGIN_URL        = chatForm?.dataset?.login || '/login';
   const USERNAME         = (root?.dataset?.username || 'User').trim();
 
@@ -57,6 +59,13 @@
     return row; // untuk dihapus/diganti nanti
   }
 
+  // pertanyaan + filter kelas (opsional)
+  function requestBody(text){
+    const params = new URLSearchParams({ user_message: text });
+    if (kelasSel && kelasSel.value) params.set('kelas', kelasSel.value);
+    return params.toString();
+  }
+
   function lockForm(){
     userInput.disabled = true;
     submitBtn.disabled = true;
@@ -70,6 +79,75 @@
     userInput.focus();
   }
 
+  // 503 (antrean penuh) / 504 (waktu habis): pesan dari server + saran tunggu
+  async function errorMessage(resp){
+    let data = {};
+    try { data = await resp.json(); } catch (_) {}
+    let msg = data.error || 'Terjadi kesalahan server.';
+    const wait = data.retry_after || resp.headers.get('Retry-After');
+    if (wait) msg += ` (sekitar ${wait} detik)`;
+    return msg;
+  }
+
+  // === Streaming (SSE lewat fetch POST) ===
+  // event "token": potongan jawaban ditambahkan ke bubble saat datang;
+  // event "done": jawaban akhir yang sudah dibersihkan server
+  async function streamAnswer(text, typingRow){
+    const resp = await fetch(STREAM_URL, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/x-www-form-urlencoded' },
+      body: requestBody(text)
+    });
+    if (resp.status === 401 || resp.redirected) {
+      window.location.href = LOGIN_URL;
+      return;
+    }
+    const bubble = typingRow.querySelector('.bubble');
+    if (!resp.ok || !resp.body) {
+      bubble.classList.remove('typing');
+      bubble.textContent = await errorMessage(resp);
+      return;
+    }
+
+    const reader  = resp.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let started = false;
+
+    function handle(block){
+      let event = 'message', data = '';
+      for (const line of block.split('\n')) {
+        if (line.startsWith('event:')) event = line.slice(6).trim();
+        else if (line.startsWith('data:')) data += line.slice(5).trim();
+      }
+      if (!data) return;
+      const payload = JSON.parse(data);
+      if (!started) {
+        // bubble typing dipakai ulang sebagai bubble jawaban
+        typingRow.classList.remove('typing-row');
+        bubble.classList.remove('typing');
+        bubble.textContent = '';
+        started = true;
+      }
+      if (event === 'token') bubble.textContent += payload.text;
+      else if (event === 'done') bubble.textContent = payload.response || '(kosong)';
+      else if (event === 'error') bubble.textContent = payload.message || 'Terjadi kesalahan server.';
+      chatArea.scrollTop = chatArea.scrollHeight;
+    }
+
+    while (true) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+      let sep;
+      while ((sep = buffer.indexOf('\n\n')) >= 0) {
+        handle(buffer.slice(0, sep));
+        buffer = buffer.slice(sep + 2);
+      }
+    }
+    if (buffer.trim()) handle(buffer);
+  }
+
   if (chatForm) {
     chatForm.addEventListener('submit', async (e)=>{
       e.preventDefault();
@@ -84,10 +162,15 @@
       lockForm();
 
       try{
+        if (STREAM_URL && window.ReadableStream && window.TextDecoder) {
+          await streamAnswer(text, typingRow);
+          return;
+        }
+
         const resp = await fetch(GET_RESPONSE_URL, {
           method: 'POST',
           headers: { 'Content-Type': 'application/x-www-form-urlencoded' },
-          body: `user_message=${encodeURIComponent(text)}`
+          body: requestBody(text)
         });
 
         // jika server redirect (mis. belum login), ikuti
@@ -100,7 +183,7 @@
         if (!resp.ok) {
           const b = typingRow.querySelector('.bubble');
           b.classList.remove('typing');
-          b.textContent = 'Terjadi kesalahan server.';
+          b.textContent = await errorMessage(resp);
           return;
         }
 
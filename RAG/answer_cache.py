@@ -0,0 +1,140 @@
+import os
+import json
+import hashlib
+import threading
+from datetime import datetime, timezone
+import numpy as np
+
+BASE_DIR         = os.path.dirname(os.path.abspath(__file__))
+ANSWER_CACHE_DIR = os.path.join(BASE_DIR, "answer_cache")
+ANSWER_SIM       = 0.95     # cosine minimum antar pertanyaan ternormalisasi
+
+# =========================
+# Cache jawaban semantik
+# =========================
+# Jawaban LLM deterministik (temperature=0, seed=42) untuk konteks yang sama.
+# Pertanyaan baru yang mirip (cosine >= ANSWER_SIM) DAN konteks akhirnya
+# (doc_id FINAL_TOPK, urutan sama) identik dengan entri lama memakai jawaban
+# tersimpan tanpa memanggil LLM. Entri juga menyimpan context_version (versi
+# index + pengaturan yang membentuk prompt); hit hanya bila versinya sama,
+# karena teks chunk bisa berubah di bawah doc_id yang sama setelah re-ingest.
+#
+# Penyimpanan append-only agar tahan restart tanpa menulis ulang semuanya:
+#   vectors.f32   -> baris vektor float32
+#   entries.jsonl -> satu entri per baris (urutan = baris vektor);
+#                    baris {"invalidate": key, "row": n} menonaktifkan entri
+# Indeksnya pencarian eksak atas matriks kecil (ribuan pertanyaan), cukup
+# satu perkalian matriks-vektor per pertanyaan.
+def entry_key(normalized_question, context_ids, context_version=""):
+    raw = "\x1f".join([normalized_question, *context_ids, context_version])
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+
+class AnswerCache:
+    def __init__(self, cache_dir=ANSWER_CACHE_DIR, threshold=ANSWER_SIM):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.vec_path = os.path.join(cache_dir, "vectors.f32")
+        self.entries_path = os.path.join(cache_dir, "entries.jsonl")
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self.entries = []       # entri per baris vektor
+        self.by_key = {}        # key -> baris
+        self.active = np.zeros(0, dtype=bool)
+        self.vectors = None
+        self.hits = 0
+        self.misses = 0
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.entries_path):
+            return
+        invalid = set()
+        with open(self.entries_path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                rec = json.loads(line)
+                if "invalidate" in rec:
+                    invalid.add(rec["row"])
+                else:
+                    self.by_key[rec["key"]] = len(self.entries)
+                    self.entries.append(rec)
+
+        vecs = np.fromfile(self.vec_path, dtype=np.float32) if os.path.exists(self.vec_path) else np.zeros(0, np.float32)
+        dim = self.entries[0]["dim"] if self.entries else 0
+        n = min(len(self.entries), len(vecs) // dim) if dim else 0
+        if len(vecs) > n * dim:
+            # proses berhenti setelah menulis vektor tetapi sebelum entrinya
+            os.truncate(self.vec_path, n * dim * 4)
+        self.entries = self.entries[:n]
+        self.vectors = vecs[:n * dim].reshape(n, dim) if n else None
+        self.by_key = {k: r for k, r in self.by_key.items() if r < n}
+        self.active = np.array([row not in invalid for row in range(n)], dtype=bool)
+        print(f"[INFO] Answer cache: {int(self.active.sum())} entri aktif dari {n}")
+
+    def lookup(self, vector, normalized_question, context_ids, context_version=""):
+        # Mengembalikan entri (dict) atau None
+        with self._lock:
+            if self.vectors is None or not self.active.any():
+                self.misses += 1
+                return None
+            q = np.asarray(vector, dtype=np.float32)
+            sims = self.vectors @ q
+            sims[~self.active] = -1.0
+            context_ids = list(context_ids)
+            for row in np.argsort(-sims):
+                if sims[row] < self.threshold:
+                    break
+                entry = self.entries[row]
+                if entry["context_ids"] == context_ids and entry.get("context_version", "") == context_version:
+                    self.hits += 1
+                    return {**entry, "similarity": float(sims[row])}
+            self.misses += 1
+            return None
+
+    def add(self, vector, normalized_question, context_ids, answer, context_version=""):
+        key = entry_key(normalized_question, context_ids, context_version)
+        vec = np.asarray(vector, dtype=np.float32).reshape(1, -1)
+        with self._lock:
+            if key in self.by_key and self.active[self.by_key[key]]:
+                return key
+            entry = {
+                "key": key,
+                "question": normalized_question,
+                "context_ids": list(context_ids),
+                "context_version": context_version,
+                "answer": answer,
+                "dim": vec.shape[1],
+                "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            }
+            # vektor ditulis dulu: vektor tanpa entri dipotong saat _load
+            with open(self.vec_path, "ab") as f:
+                f.write(vec.tobytes())
+            with open(self.entries_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self.by_key[key] = len(self.entries)
+            self.entries.append(entry)
+            self.vectors = vec if self.vectors is None else np.vstack([self.vectors, vec])
+            self.active = np.append(self.active, True)
+        return key
+
+    def invalidate(self, key):
+        with self._lock:
+            row = self.by_key.get(key)
+            if row is None or not self.active[row]:
+                return False
+            self.active[row] = False
+            with open(self.entries_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"invalidate": key, "row": row}) + "\n")
+        return True
+
+    def get(self, key):
+        row = self.by_key.get(key)
+        if row is None:
+            return None
+        return {**self.entries[row], "active": bool(self.active[row])}
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "size": int(self.active.sum()),
+                "hit_rate": self.hits / total if total else 0.0}
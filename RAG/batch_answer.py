@@ -0,0 +1,85 @@
+import os
+import sys
+import json
+import time
+import argparse
+from itertools import islice
+
+from onnx_encoder import load_questions
+
+BATCH_SIZE = 16   # pertanyaan per panggilan get_chatbot_responses_batch (= per checkpoint)
+
+# =========================
+# Checkpoint (file hasil JSONL)
+# =========================
+# Satu baris per pertanyaan yang selesai: {"index", "question", "answer", "chosen", ...}.
+# File hasil sekaligus checkpoint: saat dijalankan ulang, pertanyaan yang sudah
+# ada (index + teks sama) dilewati.
+def load_done(path):
+    done = {}
+    if not os.path.exists(path):
+        return done
+    good = 0
+    with open(path, "rb") as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                break   # baris terakhir terpotong (proses berhenti saat menulis)
+            done[rec["index"]] = rec["question"]
+            good += len(line)
+    if good < os.path.getsize(path):
+        os.truncate(path, good)
+        print(f"[WARN] Baris terpotong di {path} dibuang")
+    return done
+
+def batched(items, n):
+    it = iter(items)
+    while batch := list(islice(it, n)):
+        yield batch
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Jawab banyak pertanyaan sekaligus (kunci jawaban)")
+    parser.add_argument("questions", nargs="?", help="file teks, satu pertanyaan per baris")
+    parser.add_argument("--db-uri", help="ambil pertanyaan dari tabel queries (bila file tidak diberikan)")
+    parser.add_argument("--out", help="file hasil JSONL (default: <questions>.answers.jsonl)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--kelas", type=int, action="append", help="filter kelas (boleh berulang)")
+    parser.add_argument("--semester", type=int, action="append", help="filter semester (boleh berulang)")
+    parser.add_argument("--restart", action="store_true", help="abaikan hasil lama, mulai dari awal")
+    args = parser.parse_args(argv)
+    if not args.questions and not args.db_uri:
+        parser.error("berikan file pertanyaan atau --db-uri")
+
+    questions = load_questions(args.questions, args.db_uri)
+    out = args.out or f"{os.path.splitext(args.questions or 'queries')[0]}.answers.jsonl"
+    if args.restart and os.path.exists(out):
+        os.remove(out)
+    done = load_done(out)
+    todo = [(i, q) for i, q in enumerate(questions) if done.get(i) != q]
+    print(f"[INFO] {len(questions)} pertanyaan, {len(questions) - len(todo)} sudah selesai -> {out}")
+    if not todo:
+        return 0
+
+    filters = {"kelas": args.kelas, "semester": args.semester}
+    # ditunda agar --help dan resume kosong tetap cepat; model dimuat sebelum
+    # timer agar laju per menit tidak ikut menghitung waktu muat
+    from query_rag_mistral import get_chatbot_responses_batch, load_models
+    load_models()
+
+    t0 = time.perf_counter()
+    finished = 0
+    with open(out, "a", encoding="utf-8") as f:
+        for batch in batched(todo, args.batch_size):
+            results = get_chatbot_responses_batch([q for _, q in batch], filters=filters)
+            for (i, q), res in zip(batch, results):
+                f.write(json.dumps({"index": i, "question": q, **res}, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+            finished += len(batch)
+            rate = finished / max(time.perf_counter() - t0, 1e-9)
+            print(f"[BATCH] checkpoint {finished}/{len(todo)} ({rate * 60:.1f} pertanyaan/menit)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
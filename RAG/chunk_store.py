@@ -0,0 +1,296 @@
+import os
+import sys
+import json
+import mmap
+import struct
+import hashlib
+import argparse
+from collections import Counter
+import numpy as np
+
+# =========================
+# Format file .chunks
+# =========================
+# header (64 byte) | teks | indeks offset | tabel metadata | tabel ID terurut | string (JSON)
+#   teks     : per chunk u32 panjang + byte UTF-8
+#   offset   : u64 per baris -> posisi prefix panjang di file
+#   metadata : baris lebar tetap (META_DTYPE), -1 = tidak ada
+#   ID       : (kunci 14 byte, baris u32) diurutkan -> pencarian biner langsung di mmap;
+#              kunci = indeks buku (u16 big-endian) + 12 byte digest dari "<buku>-<24 hex>"
+#   string   : nama/judul buku, also_in dan provenance (jarang, hasil dedup)
+MAGIC       = b"RAGCHK01"
+VERSION     = 1
+HEADER      = struct.Struct("<8sII5Q")
+KEY_BYTES   = 14
+STORE_EXT   = ".chunks"
+CORPUS_FILE = "corpus.chunks"
+
+META_DTYPE = np.dtype([
+    ("seq", "<u4"), ("page", "<i4"), ("start", "<i4"), ("end", "<i4"),
+    ("chapter", "<i2"), ("book", "<u2"), ("kelas", "<i1"), ("semester", "<i1"), ("_pad", "<u2"),
+])
+ID_DTYPE = np.dtype([("key", f"S{KEY_BYTES}"), ("row", "<u4")])
+
+# =========================
+# ID chunk stabil
+# =========================
+def iter_stable_ids(book_name, chunks):
+    # ID = hash(buku, posisi, isi). "Posisi" adalah urutan kemunculan isi yang
+    # sama di dalam buku, sehingga menyisipkan satu chunk tidak menggeser ID
+    # chunk lain (yang berarti tidak perlu embed ulang seluruh buku).
+    seen = Counter()
+    for c in chunks:
+        content = c["content"]
+        content_key = hashlib.sha1(content.encode("utf-8")).digest()
+        occurrence = seen[content_key]
+        seen[content_key] += 1
+        digest = hashlib.sha1(f"{book_name}\x1f{occurrence}\x1f{content}".encode("utf-8")).hexdigest()
+        yield f"{book_name}-{digest[:24]}", c
+
+def _split_id(doc_id):
+    book_name, _, digest = doc_id.rpartition("-")
+    if not book_name or len(digest) != 24:
+        raise ValueError(f"doc_id tidak sesuai format <buku>-<24 hex>: {doc_id}")
+    return book_name, bytes.fromhex(digest)
+
+def store_path_for(json_path):
+    return os.path.splitext(json_path)[0] + STORE_EXT
+
+# =========================
+# Penulis (streaming)
+# =========================
+class ChunkStoreWriter:
+    def __init__(self, path):
+        self.path = path
+        self.tmp = path + ".tmp"
+        self.f = open(self.tmp, "wb")
+        self.f.write(b"\0" * HEADER.size)
+        self.offsets, self.meta, self.ids = [], [], []
+        self.books = {}     # nama -> indeks di tabel string
+        self.sources = []
+        self.also_in = {}
+        self.provenance = {}
+
+    def add(self, doc_id, chunk, book=None):
+        # book: BookConfig (nama, judul, kelas, semester); file chunk lama tidak
+        # menyimpan field tersebut per chunk
+        book_name, digest = _split_id(doc_id)
+        if book_name not in self.books:
+            self.books[book_name] = len(self.books)
+            self.sources.append((book.judul if book is not None else "") or book_name)
+
+        data = chunk["content"].encode("utf-8")
+        self.offsets.append(self.f.tell())
+        self.f.write(struct.pack("<I", len(data)))
+        self.f.write(data)
+
+        def num(key):
+            val = chunk.get(key)
+            if val is None and book is not None:
+                val = getattr(book, key, None)
+            return -1 if val is None else int(val)
+        self.meta.append((int(chunk.get("chunk_id", 0)), num("page"), num("start"), num("end"),
+                          num("chapter"), self.books[book_name], num("kelas"), num("semester"), 0))
+        if chunk.get("also_in"):
+            self.also_in[len(self.ids)] = chunk["also_in"]
+        if chunk.get("provenance"):
+            self.provenance[len(self.ids)] = list(chunk["provenance"])
+        self.ids.append(self.books[book_name].to_bytes(2, "big") + digest)
+
+    def close(self):
+        n = len(self.ids)
+        text_off = HEADER.size
+        offsets_off = self.f.tell()
+        self.f.write(np.asarray(self.offsets, dtype="<u8").tobytes())
+
+        meta_off = self.f.tell()
+        self.f.write(np.array(self.meta, dtype=META_DTYPE).tobytes())
+
+        ids_off = self.f.tell()
+        table = np.empty(n, dtype=ID_DTYPE)
+        table["key"] = self.ids
+        table["row"] = np.arange(n, dtype="<u4")
+        table.sort(order="key")
+        if n > 1 and (table["key"][1:] == table["key"][:-1]).any():
+            raise ValueError("doc_id ganda di chunk store")
+        self.f.write(table.tobytes())
+
+        strings_off = self.f.tell()
+        self.f.write(json.dumps({
+            "books": list(self.books), "sources": self.sources,
+            "also_in": {str(k): v for k, v in self.also_in.items()},
+            "provenance": {str(k): v for k, v in self.provenance.items()},
+        }, ensure_ascii=False).encode("utf-8"))
+
+        self.f.seek(0)
+        self.f.write(HEADER.pack(MAGIC, VERSION, n, text_off, offsets_off, meta_off, ids_off, strings_off))
+        self.f.close()
+        os.replace(self.tmp, self.path)
+
+    def abort(self):
+        self.f.close()
+        if os.path.exists(self.tmp):
+            os.remove(self.tmp)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+def write_chunk_store(path, rows, book=None):
+    # rows: [(doc_id, chunk)]
+    with ChunkStoreWriter(path) as w:
+        for doc_id, chunk in rows:
+            w.add(doc_id, chunk, book)
+    return len(w.ids)
+
+def tee_rows_to_store(rows, path, book=None):
+    # Versi streaming: baris diteruskan sambil ditulis; file baru muncul setelah selesai
+    with ChunkStoreWriter(path) as w:
+        for doc_id, chunk in rows:
+            w.add(doc_id, chunk, book)
+            yield doc_id, chunk
+
+# =========================
+# Pembaca (mmap, tanpa parsing)
+# =========================
+class ChunkStore:
+    def __init__(self, path):
+        self.path = path
+        self._f = open(path, "rb")
+        self._mm = mmap.mmap(self._f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, n, _, offsets_off, meta_off, ids_off, strings_off = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"Bukan chunk store v{VERSION}: {path}")
+        self.n = n
+        self.offsets = np.frombuffer(self._mm, dtype="<u8", count=n, offset=offsets_off)
+        self.meta = np.frombuffer(self._mm, dtype=META_DTYPE, count=n, offset=meta_off)
+        self._ids = np.frombuffer(self._mm, dtype=ID_DTYPE, count=n, offset=ids_off)
+        strings = json.loads(bytes(self._mm[strings_off:]).decode("utf-8"))
+        self.books = strings["books"]
+        self.sources = strings["sources"]
+        self.also_in = {int(k): v for k, v in strings["also_in"].items()}
+        # store lama (sebelum provenance) tidak punya kunci ini
+        self.provenance = {int(k): v for k, v in strings.get("provenance", {}).items()}
+        self._flag_rows = None
+        self._book_index = {b: i for i, b in enumerate(self.books)}
+        self._rows_by_row = None
+
+    def __len__(self):
+        return self.n
+
+    def text_view(self, row):
+        # memoryview ke mmap, tanpa salinan
+        off = int(self.offsets[row])
+        (length,) = struct.unpack_from("<I", self._mm, off)
+        return memoryview(self._mm)[off + 4:off + 4 + length]
+
+    def text(self, row):
+        return str(self.text_view(row), "utf-8")
+
+    def row_of(self, doc_id):
+        try:
+            book_name, digest = _split_id(doc_id)
+        except ValueError:
+            return -1
+        if book_name not in self._book_index:
+            return -1
+        key = np.array(self._book_index[book_name].to_bytes(2, "big") + digest, dtype=f"S{KEY_BYTES}")
+        keys = self._ids["key"]
+        i = int(np.searchsorted(keys, key))
+        if i < self.n and keys[i] == key:
+            return int(self._ids["row"][i])
+        return -1
+
+    def doc_id(self, row):
+        if self._rows_by_row is None:
+            # posisi tiap baris di tabel ID, dibangun sekali saat pertama dibutuhkan
+            self._rows_by_row = np.empty(self.n, dtype=np.int64)
+            self._rows_by_row[self._ids["row"]] = np.arange(self.n)
+        # byte mentah (atribut S14 membuang byte nol di akhir digest)
+        raw = self._ids.view(np.uint8).reshape(self.n, ID_DTYPE.itemsize)[self._rows_by_row[row]]
+        return f"{self.books[self.meta[row]['book']]}-{raw[2:KEY_BYTES].tobytes().hex()}"
+
+    def metadata(self, row):
+        # bentuknya sama dengan metadata Chroma (indexer.chunk_metadata)
+        m = self.meta[row]
+        meta = {
+            "doc_id": self.doc_id(row),
+            "book": self.books[m["book"]],
+            "source": self.sources[m["book"]],
+            "kelas": int(m["kelas"]),
+            "semester": int(m["semester"]),
+            "seq": int(m["seq"]),
+        }
+        for key in ("page", "chapter", "start", "end"):
+            if m[key] >= 0:
+                meta[key] = int(m[key])
+        if row in self.also_in:
+            meta["also_in"] = self.also_in[row]
+        for key in self.provenance.get(row, ()):
+            meta[key] = True
+        return meta
+
+    def flag_rows(self, key):
+        # baris yang punya metadata boolean key (in_<field>_<nilai>, lihat dedup.py)
+        if self._flag_rows is None:
+            rows = {}
+            for row, keys in self.provenance.items():
+                for k in keys:
+                    rows.setdefault(k, []).append(row)
+            self._flag_rows = {k: np.array(sorted(v), dtype=np.int64) for k, v in rows.items()}
+        return self._flag_rows.get(key, np.zeros(0, np.int64))
+
+    def chunk(self, row):
+        # bentuk chunk hasil ingest (lihat ingest.iter_chunks)
+        meta = self.metadata(row)
+        c = {"chunk_id": meta["seq"], "content": self.text(row)}
+        c.update((k, meta[k]) for k in ("book", "kelas", "semester", "page", "chapter", "start", "end")
+                 if k in meta)
+        if "also_in" in meta:
+            c["also_in"] = meta["also_in"]
+        if row in self.provenance:
+            c["provenance"] = list(self.provenance[row])
+        return c
+
+    def get(self, doc_id):
+        row = self.row_of(doc_id)
+        return None if row < 0 else self.chunk(row)
+
+    def iter_rows(self):
+        for row in range(self.n):
+            yield self.doc_id(row), self.chunk(row)
+
+    def close(self):
+        self.offsets = self.meta = self._ids = self._rows_by_row = None
+        self._mm.close()
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def main(argv=None):
+    from ingest import BOOKS_DIR, load_books
+
+    parser = argparse.ArgumentParser(description="Konversi clean_chunks*.json ke chunk store biner")
+    parser.add_argument("--book", action="append", help="nama buku (boleh berulang); default semua yang enabled")
+    parser.add_argument("--books-dir", default=BOOKS_DIR)
+    args = parser.parse_args(argv)
+
+    for book in load_books(args.book, args.books_dir):
+        with open(book.output_path, "r", encoding="utf-8") as f:
+            chunks = json.load(f)
+        n = write_chunk_store(book.store_path, iter_stable_ids(book.name, chunks), book)
+        print(f"[INFO] {book.output} ({os.path.getsize(book.output_path) / 1024:.0f} KB) -> "
+              f"{os.path.basename(book.store_path)} ({os.path.getsize(book.store_path) / 1024:.0f} KB, {n} chunk)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,215 @@
+import re
+import sys
+import string
+import time
+import argparse
+
+# =========================
+# Mesin aturan pembersihan
+# =========================
+# Aturan satu buku dikompilasi sekali: semua footer_patterns digabung menjadi
+# satu regex, daftar halaman menjadi set, dan pemeriksaan noise dilakukan
+# dengan operasi string bawaan (tanpa loop per karakter di Python).
+_PAGE_NUMBER = re.compile(r'^\d+$')
+_BAB         = re.compile(r'\bBAB\b', re.IGNORECASE)
+_ASCII_ALNUM = (string.ascii_letters + string.digits).encode("ascii")
+_WHITESPACE  = re.compile(r'\s+')
+_ACRONYM_DOT = re.compile(r'(?<=\b[A-Z])\.(?=[A-Z])')
+_ACRONYM_END = re.compile(r'\b([A-Z]{2,})\.(?=\s)')
+_CHAPTER     = re.compile(r'^\s*bab\s+([ivxlc]+|\d+)\b', re.IGNORECASE | re.MULTILINE)
+_ROMAN       = {"i": 1, "v": 5, "x": 10, "l": 50, "c": 100}
+
+def _roman_to_int(s):
+    total = 0
+    for ch, nxt in zip(s, s[1:] + " "):
+        v = _ROMAN[ch]
+        total += -v if _ROMAN.get(nxt, 0) > v else v
+    return total
+
+def detect_chapter(text):
+    # Nomor bab dari judul/running header "BAB 3" atau "Bab III" di awal baris
+    m = _CHAPTER.search(text or "")
+    if not m:
+        return None
+    num = m.group(1).lower()
+    return int(num) if num.isdigit() else _roman_to_int(num)
+
+class CleaningRules:
+    def __init__(self, judul_besar=(), hapus_footer_halaman=(), hapus_pdf_halaman=(),
+                 footer_patterns=(), hapus_titik_singkatan=False):
+        self.deleted_pdf_pages = frozenset(int(p) for p in hapus_pdf_halaman)
+        self.deleted_footers = frozenset(h.strip().lower() for h in hapus_footer_halaman)
+        self.hapus_titik_singkatan = hapus_titik_singkatan
+
+        titles = sorted({j.lower() for j in judul_besar}, key=len, reverse=True)
+        self.title_re = re.compile("|".join(map(re.escape, titles))) if titles else None
+        self.footer_re = (
+            re.compile("|".join(f"(?:{p})" for p in footer_patterns))
+            if footer_patterns else None
+        )
+
+    @classmethod
+    def from_book(cls, book):
+        return cls(
+            judul_besar=book.judul_besar,
+            hapus_footer_halaman=book.hapus_footer_halaman,
+            hapus_pdf_halaman=book.hapus_pdf_halaman,
+            footer_patterns=book.footer_patterns,
+            hapus_titik_singkatan=book.hapus_titik_singkatan,
+        )
+
+    def is_deleted_page(self, page_num, low_lines):
+        if page_num in self.deleted_pdf_pages:
+            return True
+        return any(line.strip() in self.deleted_footers for line in low_lines)
+
+    def is_irrelevant(self, low_text):
+        return self.title_re is not None and self.title_re.search(low_text) is not None
+
+    def is_footer_line(self, low_line):
+        return self.footer_re is not None and self.footer_re.search(low_line) is not None
+
+    @staticmethod
+    def is_noise_line(line, low_line=None):
+        if not line:
+            return True
+        low_line = line.lower() if low_line is None else low_line
+        if "bab" in low_line and _BAB.search(line):
+            return False
+        n = len(line)
+        if line.count('.') / n > 0.5:
+            return True
+        if line.isascii():
+            letters_digits = n - len(line.encode("ascii").translate(None, _ASCII_ALNUM))
+        else:
+            letters_digits = sum(map(str.isalnum, line))
+        return letters_digits / n < 0.3
+
+    def normalize_whitespace(self, text):
+        text = _WHITESPACE.sub(" ", text)
+        if self.hapus_titik_singkatan:
+            text = _ACRONYM_DOT.sub('', text)
+            text = _ACRONYM_END.sub(r'\1', text)
+        return text.strip()
+
+    def clean_page(self, page_num, text):
+        if not text:
+            return None
+        # lower() sekali untuk seluruh halaman; jumlah baris tetap sama
+        low_text = text.lower()
+        low_lines = low_text.split("\n")
+        if self.is_deleted_page(page_num, low_lines):
+            return None
+        if self.is_irrelevant(low_text):
+            return None
+
+        cleaned_lines = []
+        for raw_line, low_line in zip(text.split("\n"), low_lines):
+            line = raw_line.strip().replace("\t", " ")
+            if not line or _PAGE_NUMBER.match(line):
+                continue
+            low_line = low_line.strip().replace("\t", " ")
+            if self.is_footer_line(low_line) or self.is_noise_line(line, low_line):
+                continue
+            cleaned_lines.append(line)
+
+        return self.normalize_whitespace(" ".join(cleaned_lines)) or None
+
+# Cache aturan terkompilasi per buku (per proses worker)
+_compiled = {}
+
+def rules_for(book):
+    rules = _compiled.get(book.name)
+    if rules is None:
+        rules = _compiled[book.name] = CleaningRules.from_book(book)
+    return rules
+
+# =========================
+# Micro-benchmark per halaman
+# =========================
+def _legacy_clean_page(page_num, text, book):
+    # salinan logika skrip extract_and_chunk* lama, hanya untuk pembanding
+    if not text:
+        return None
+    if page_num in book.hapus_pdf_halaman:
+        return None
+    for line in text.split("\n"):
+        if line.strip().lower() in [h.lower() for h in book.hapus_footer_halaman]:
+            return None
+    if any(j.lower() in text.lower() for j in book.judul_besar):
+        return None
+
+    cleaned_lines = []
+    for line in text.split("\n"):
+        line = line.strip().replace("\t", " ")
+        if not line or re.match(r'^\d+$', line):
+            continue
+        if any(re.search(p, line.lower()) for p in book.footer_patterns):
+            continue
+        if re.search(r'\bBAB\b', line, re.IGNORECASE):
+            cleaned_lines.append(line)
+            continue
+        if line.count('.') / len(line) > 0.5:
+            continue
+        if sum(c.isalnum() for c in line) / len(line) < 0.3:
+            continue
+        cleaned_lines.append(line)
+
+    text = re.sub(r"\s+", " ", " ".join(cleaned_lines))
+    if book.hapus_titik_singkatan:
+        text = re.sub(r'(?<=\b[A-Z])\.(?=[A-Z])', '', text)
+        text = re.sub(r'\b([A-Z]{2,})\.(?=\s)', r'\1', text)
+    return text.strip() or None
+
+def _per_page_us(fn, pages, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for page_num, text in pages:
+            fn(page_num, text)
+        best = min(best, time.perf_counter() - t0)
+    return best / max(len(pages), 1) * 1e6
+
+def benchmark(book, repeat=5, max_pages=None):
+    from PyPDF2 import PdfReader
+    from ingest import list_pdf_files
+
+    pages = []
+    t0 = time.perf_counter()
+    for pdf_path in list_pdf_files(book.pdf_path):
+        for page_num, page in enumerate(PdfReader(pdf_path).pages, start=1):
+            if max_pages and len(pages) >= max_pages:
+                break
+            pages.append((page_num, page.extract_text() or ""))
+    extract_us = (time.perf_counter() - t0) / max(len(pages), 1) * 1e6
+
+    rules = CleaningRules.from_book(book)
+    legacy_us = _per_page_us(lambda n, t: _legacy_clean_page(n, t, book), pages, repeat)
+    engine_us = _per_page_us(rules.clean_page, pages, repeat)
+
+    mismatch = sum(rules.clean_page(n, t) != _legacy_clean_page(n, t, book) for n, t in pages)
+    print(f"[BENCH] {book.name}: {len(pages)} halaman")
+    print(f"  ekstraksi PyPDF2 : {extract_us:10.1f} us/halaman")
+    print(f"  cleaning lama    : {legacy_us:10.1f} us/halaman")
+    print(f"  cleaning engine  : {engine_us:10.1f} us/halaman ({legacy_us / max(engine_us, 1e-9):.1f}x lebih cepat)")
+    print(f"  porsi cleaning   : {engine_us / (extract_us + engine_us):.1%} dari waktu per halaman")
+    print(f"  hasil berbeda    : {mismatch} halaman")
+    return {"pages": len(pages), "extract_us": extract_us, "legacy_us": legacy_us,
+            "engine_us": engine_us, "mismatch": mismatch}
+
+def main(argv=None):
+    from ingest import BOOKS_DIR, load_books
+
+    parser = argparse.ArgumentParser(description="Micro-benchmark cleaning per halaman")
+    parser.add_argument("--book", action="append", help="nama buku (boleh berulang); default semua yang enabled")
+    parser.add_argument("--books-dir", default=BOOKS_DIR)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--max-pages", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    for book in load_books(args.book, args.books_dir):
+        benchmark(book, repeat=args.repeat, max_pages=args.max_pages)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,84 @@
+import re
+import threading
+from collections import OrderedDict
+import numpy as np
+
+SENT_MIN_SIM     = 0.80   # cosine minimum kalimat vs pertanyaan (e5, ternormalisasi)
+CTX_TOKEN_BUDGET = 160    # token konteks maksimal setelah kompresi
+SENT_CACHE_ITEMS = 4096   # vektor kalimat di LRU memori
+
+# akhir kalimat: . ! ? diikuti spasi dan huruf kapital/angka/kutip pembuka
+_SENT_END = re.compile(r'(?<=[.!?])\s+(?=["“(]?[A-Z0-9])')
+
+def split_sentences(text):
+    return [s.strip() for s in _SENT_END.split(text or "") if s.strip()]
+
+def approx_tokens(text):
+    # cadangan bila tokenizer LLM tidak tersedia (~4 karakter per token)
+    return max(1, len(text) // 4)
+
+# =========================
+# Cache vektor kalimat (LRU memori, terbatas)
+# =========================
+# Kalimat konteks berbeda di hampir tiap pertanyaan; menaruhnya di cache
+# embedding disk (khusus chunk korpus, tanpa eviction) membuatnya tumbuh terus.
+# Di sini hanya kalimat yang sering muncul lagi yang bertahan.
+class SentenceEmbedder:
+    def __init__(self, embed_documents, max_items=SENT_CACHE_ITEMS):
+        self.inner = embed_documents
+        self.max_items = max_items
+        self._mem = OrderedDict()
+        self._lock = threading.Lock()
+
+    def embed_documents(self, texts):
+        with self._lock:
+            found = {t: self._mem[t] for t in texts if t in self._mem}
+            for t in found:
+                self._mem.move_to_end(t)
+        missing = list(dict.fromkeys(t for t in texts if t not in found))
+        if missing:
+            fresh = self.inner(missing)
+            with self._lock:
+                for t, v in zip(missing, fresh):
+                    found[t] = self._mem[t] = v
+                while len(self._mem) > self.max_items:
+                    self._mem.popitem(last=False)
+        return [found[t] for t in texts]
+
+# =========================
+# Kompresi ekstraktif
+# =========================
+# Chunk konteks dipecah jadi kalimat, semua kalimat di-embed sekaligus dengan
+# encoder yang sama (satu panggilan batch), lalu kalimat dipilih dari yang
+# paling mirip dengan pertanyaan selama >= SENT_MIN_SIM dan muat di budget
+# token. Kalimat terbaik selalu ikut agar konteks tidak pernah kosong.
+# Urutan kalimat di dalam chunk dipertahankan.
+def compress_context(question_vector, texts, embed_documents, count_tokens=approx_tokens,
+                     min_sim=SENT_MIN_SIM, budget=CTX_TOKEN_BUDGET):
+    # Mengembalikan (teks per chunk; "" bila semua kalimatnya dibuang, statistik)
+    sentences = [(i, j, s) for i, t in enumerate(texts) for j, s in enumerate(split_sentences(t))]
+    before = sum(count_tokens(t) for t in texts)
+    if not sentences:
+        return list(texts), {"sentences": 0, "kept": 0, "tokens_before": before,
+                             "tokens_after": before, "tokens_saved": 0}
+
+    vecs = np.asarray(embed_documents([s for _, _, s in sentences]), dtype=np.float32)
+    sims = vecs @ np.asarray(question_vector, dtype=np.float32)
+
+    chosen, used = set(), 0
+    for k in np.argsort(-sims):
+        if chosen and sims[k] < min_sim:
+            break
+        cost = count_tokens(sentences[k][2])
+        if chosen and used + cost > budget:
+            continue
+        chosen.add(int(k))
+        used += cost
+
+    out = [[] for _ in texts]
+    for k in sorted(chosen):
+        out[sentences[k][0]].append(sentences[k][2])
+    compressed = [" ".join(parts) for parts in out]
+    after = sum(count_tokens(t) for t in compressed if t)
+    return compressed, {"sentences": len(sentences), "kept": len(chosen), "tokens_before": before,
+                        "tokens_after": after, "tokens_saved": before - after}
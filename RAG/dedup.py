@@ -0,0 +1,153 @@
+import re
+import zlib
+from collections import defaultdict
+import numpy as np
+
+# =========================
+# MinHash + LSH untuk chunk hampir-sama
+# =========================
+# Buku yang tumpang tindih (Kelas11Sem1 vs Kelas11Buku2, Kelas10 vs varian
+# tanpa pra-aksara) menghasilkan chunk yang nyaris identik tetapi tidak sama
+# persis, sehingga _doc_key di sisi query tidak bisa menyatukannya.
+NUM_PERM  = 128
+BANDS     = 16          # 16 band x 8 baris -> ambang LSH ~0.71
+SHINGLE   = 3           # shingle 3 kata
+THRESHOLD = 0.8         # Jaccard minimum agar dianggap duplikat
+SEED      = 42
+
+# Field filter/routing yang asal duplikatnya disimpan sebagai metadata boolean
+# in_<field>_<nilai> di chunk perwakilan (mis. in_book_kelas11_sem1 = True),
+# agar filter kelas/semester/buku dan partisi router tetap menemukan isinya.
+PROVENANCE_FIELDS = ("book", "kelas", "semester")
+
+_PRIME = (1 << 31) - 1
+_TOKEN = re.compile(r'\w+')
+
+def shingles(text, k=SHINGLE):
+    words = _TOKEN.findall((text or "").lower())
+    if len(words) <= k:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + k]) for i in range(len(words) - k + 1)}
+
+def _perms(num_perm=NUM_PERM, seed=SEED):
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, _PRIME, size=num_perm, dtype=np.uint64)
+    b = rng.integers(0, _PRIME, size=num_perm, dtype=np.uint64)
+    return a, b
+
+def minhash(shingle_set, perms):
+    a, b = perms
+    if not shingle_set:
+        return np.full(len(a), _PRIME, dtype=np.uint64)
+    x = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingle_set),
+                    dtype=np.uint64, count=len(shingle_set)) % _PRIME
+    # a, x < 2^31 sehingga a*x + b tidak overflow di uint64
+    return ((a[:, None] * x[None, :] + b[:, None]) % _PRIME).min(axis=1)
+
+class _UnionFind:
+    def __init__(self, n):
+        self.parent = list(range(n))
+
+    def find(self, i):
+        while self.parent[i] != i:
+            self.parent[i] = self.parent[self.parent[i]]
+            i = self.parent[i]
+        return i
+
+    def union(self, i, j):
+        ri, rj = self.find(i), self.find(j)
+        if ri != rj:
+            # akar = indeks terkecil -> chunk yang muncul lebih dulu yang dipertahankan
+            self.parent[max(ri, rj)] = min(ri, rj)
+
+def provenance_key(field, value):
+    return f"in_{field}_{value}"
+
+def near_duplicate_clusters(texts, threshold=THRESHOLD, num_perm=NUM_PERM, bands=BANDS):
+    if num_perm % bands:
+        raise ValueError("num_perm harus habis dibagi bands")
+    rows_per_band = num_perm // bands
+    perms = _perms(num_perm)
+
+    sets = [shingles(t) for t in texts]
+    sigs = np.stack([minhash(s, perms) for s in sets]) if sets else np.empty((0, num_perm), np.uint64)
+
+    buckets = defaultdict(list)
+    for i, sig in enumerate(sigs):
+        if not sets[i]:
+            continue
+        for band in range(bands):
+            key = (band, sig[band * rows_per_band:(band + 1) * rows_per_band].tobytes())
+            buckets[key].append(i)
+
+    uf = _UnionFind(len(texts))
+    checked = set()
+    for members in buckets.values():
+        if len(members) < 2:
+            continue
+        for pos, i in enumerate(members):
+            for j in members[pos + 1:]:
+                if (i, j) in checked or uf.find(i) == uf.find(j):
+                    continue
+                checked.add((i, j))
+                inter = len(sets[i] & sets[j])
+                if inter / (len(sets[i]) + len(sets[j]) - inter) >= threshold:
+                    uf.union(i, j)
+
+    clusters = defaultdict(list)
+    for i in range(len(texts)):
+        clusters[uf.find(i)].append(i)
+    return [members for members in clusters.values() if len(members) > 1]
+
+def dedup_rows(rows_by_book, threshold=THRESHOLD, book_fields=None):
+    # rows_by_book: {buku: [(doc_id, chunk), ...]} dengan urutan buku = prioritas.
+    # book_fields: {buku: {"kelas": .., "semester": ..}} untuk chunk yang tidak
+    # menyimpan field itu sendiri. Mengembalikan baris yang dipertahankan per buku
+    # (chunk perwakilan diberi "also_in" berisi asal duplikatnya untuk dibaca dan
+    # "provenance" berisi kunci in_<field>_<nilai> untuk filter) dan ringkasan.
+    book_fields = book_fields or {}
+    flat = [(book, doc_id, chunk) for book, rows in rows_by_book.items() for doc_id, chunk in rows]
+    clusters = near_duplicate_clusters([c["content"] for _, _, c in flat], threshold)
+
+    def field(book, chunk, name):
+        if name == "book":
+            return book
+        val = chunk.get(name)
+        return val if val is not None else book_fields.get(book, {}).get(name)
+
+    dropped = set()
+    also_in, provenance = {}, {}
+    for members in clusters:
+        keep, rest = members[0], members[1:]
+        dropped.update(rest)
+        origins, keys = [], set()
+        for i in rest:
+            book, _, chunk = flat[i]
+            origin = f"{book}:{chunk['page']}" if chunk.get("page") else book
+            if origin not in origins:
+                origins.append(origin)
+            for name in PROVENANCE_FIELDS:
+                val = field(book, chunk, name)
+                if val is not None:
+                    keys.add(provenance_key(name, val))
+        also_in[keep] = ";".join(origins)
+        provenance[keep] = sorted(keys)
+
+    kept = {book: [] for book in rows_by_book}
+    dropped_per_book = defaultdict(int)
+    for i, (book, doc_id, chunk) in enumerate(flat):
+        if i in dropped:
+            dropped_per_book[book] += 1
+            continue
+        if i in also_in:
+            chunk = {**chunk, "also_in": also_in[i], "provenance": provenance[i]}
+        kept[book].append((doc_id, chunk))
+
+    report = {
+        "before": len(flat),
+        "after": len(flat) - len(dropped),
+        "clusters": len(clusters),
+        "threshold": threshold,
+        "dropped_per_book": dict(dropped_per_book),
+    }
+    return kept, report
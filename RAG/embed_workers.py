@@ -0,0 +1,112 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+EMBED_MODEL   = "intfloat/multilingual-e5-large"
+EMBED_BATCH   = 32
+EMBED_WORKERS = 2
+
+# =========================
+# Worker embedding (satu model per proses)
+# =========================
+# Setiap proses memuat model sekali lalu hanya menerima batch teks. Jumlah
+# thread per proses dipatok agar workers x threads tidak melebihi jumlah core
+# (tanpa ini setiap proses torch/onnxruntime memakai semua core dan saling rebut).
+_encoder = None
+
+def _init_worker(backend, model_name, threads, normalize, onnx_path):
+    global _encoder
+    # OMP/MKL/OPENBLAS_NUM_THREADS tidak berguna di sini: numpy/torch sudah
+    # di-import (fork dari indexer.py, atau import ulang __main__ saat spawn) dan
+    # pool thread-nya sudah jadi. Batas thread lewat API: torch.set_num_threads
+    # dan intra_op_num_threads ONNX Runtime. Tokenizers membaca env ini saat dipakai.
+    os.environ["TOKENIZERS_PARALLELISM"] = "false"
+
+    if backend == "onnx":
+        from onnx_encoder import OnnxEncoder
+        enc = OnnxEncoder(onnx_path, threads=threads)
+        _encoder = lambda texts: enc.encode(texts, normalize, batch_size=len(texts))
+    else:
+        import torch
+        from sentence_transformers import SentenceTransformer
+        torch.set_num_threads(threads)
+        model = SentenceTransformer(model_name, device="cpu")
+        _encoder = lambda texts: model.encode(
+            texts, batch_size=len(texts), normalize_embeddings=normalize,
+            convert_to_numpy=True, show_progress_bar=False,
+        )
+
+def _encode_batch(texts):
+    return np.asarray(_encoder(texts), dtype=np.float32)
+
+def length_buckets(texts, batch_size=EMBED_BATCH):
+    # Urutkan berdasarkan panjang agar teks dalam satu batch seukuran
+    # (padding ke teks terpanjang di batch jadi minimal); kembalikan indeks asli.
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+    return [order[i:i + batch_size] for i in range(0, len(order), batch_size)]
+
+class PooledEmbeddings(Embeddings):
+    def __init__(self, model_name=EMBED_MODEL, workers=EMBED_WORKERS, threads=None,
+                 batch_size=EMBED_BATCH, backend="torch", normalize=True, onnx_path=None):
+        if backend not in ("torch", "onnx"):
+            raise ValueError(f"Backend embedding tidak dikenal: {backend}")
+        self.workers = max(1, workers)
+        self.threads = threads or max(1, (os.cpu_count() or 1) // self.workers)
+        self.batch_size = batch_size
+        self.backend = backend
+        # nama untuk namespace CachedEmbeddings; vektor ONNX disimpan terpisah
+        self.model_name = model_name if backend == "torch" else f"{model_name}@onnx"
+        self.encode_kwargs = {"normalize_embeddings": normalize}
+        self._initargs = (backend, model_name, self.threads, normalize, onnx_path)
+        self._pool = None
+        self.total_chunks = 0
+        self.total_seconds = 0.0
+
+    def _executor(self):
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers, initializer=_init_worker, initargs=self._initargs,
+            )
+        return self._pool
+
+    def embed_documents(self, texts):
+        texts = list(texts)
+        if not texts:
+            return []
+        t0 = time.perf_counter()
+        buckets = length_buckets(texts, self.batch_size)
+        ex = self._executor()
+        futures = [ex.submit(_encode_batch, [texts[i] for i in idx]) for idx in buckets]
+
+        out = [None] * len(texts)
+        for idx, fut in zip(buckets, futures):
+            for i, vec in zip(idx, fut.result()):
+                out[i] = vec.tolist()
+
+        elapsed = time.perf_counter() - t0
+        self.total_chunks += len(texts)
+        self.total_seconds += elapsed
+        print(f"  [EMBED] {len(texts)} chunk dalam {elapsed:.1f} s "
+              f"({len(texts) / max(elapsed, 1e-9):.1f} chunk/s)")
+        return out
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+    def stats(self):
+        return {
+            "chunks": self.total_chunks,
+            "seconds": self.total_seconds,
+            "chunks_per_sec": self.total_chunks / max(self.total_seconds, 1e-9),
+            "workers": self.workers,
+            "threads": self.threads,
+            "batch_size": self.batch_size,
+            "backend": self.backend,
+        }
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
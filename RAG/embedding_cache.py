@@ -0,0 +1,224 @@
+import os
+import json
+import hashlib
+import threading
+from contextlib import contextmanager
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+try:
+    import fcntl
+except ImportError:   # Windows
+    fcntl = None
+    import msvcrt
+
+BASE_DIR  = os.path.dirname(os.path.abspath(__file__))
+CACHE_DIR = os.path.join(BASE_DIR, "embedding_cache")
+
+KEY_BYTES = 20  # sha1 digest
+
+# =========================
+# Penyimpanan vektor (memmap)
+# =========================
+# Satu folder per (model, normalize, dtype):
+#   keys.bin    -> digest 20 byte per baris (indeks baris = offset vektor)
+#   vectors.bin -> baris vektor berurutan, offset = baris * dim * itemsize
+#   meta.json   -> model, normalize, dim, dtype
+#   lock        -> kunci file eksklusif untuk penulis
+# Indexer, model server/Flask dan batch_answer bisa menulis bersamaan. Append
+# dilakukan di bawah kunci file, dan nomor baris dihitung dari ukuran file saat
+# kunci dipegang (bukan dari indeks di memori) agar kunci dan vektor tetap sejajar.
+class EmbeddingCache:
+    def __init__(self, model_name, normalize=True, cache_dir=CACHE_DIR, dtype="float32"):
+        self.model_name = model_name
+        self.normalize = bool(normalize)
+        self.dtype = np.dtype(dtype)
+        ns = hashlib.sha1(f"{model_name}|{self.normalize}|{self.dtype.name}".encode("utf-8")).hexdigest()[:12]
+        self.dir = os.path.join(cache_dir, ns)
+        os.makedirs(self.dir, exist_ok=True)
+
+        self.keys_path = os.path.join(self.dir, "keys.bin")
+        self.vec_path  = os.path.join(self.dir, "vectors.bin")
+        self.meta_path = os.path.join(self.dir, "meta.json")
+        self.lock_path = os.path.join(self.dir, "lock")
+
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._mm = None
+        self.dim = None
+        self.index = {}
+        self.n_rows = 0   # baris file yang sudah masuk self.index
+
+        with self._file_lock():
+            self._sync()
+
+    @property
+    def row_bytes(self):
+        return self.dim * self.dtype.itemsize
+
+    @contextmanager
+    def _file_lock(self):
+        with open(self.lock_path, "a+b") as f:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+                else:
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+    def _sync(self):
+        # Dipanggil dengan kunci file dipegang: baca kunci yang ditambahkan proses
+        # lain sejak sinkron terakhir dan kembalikan jumlah baris lengkap di file.
+        if self.dim is None:
+            if not os.path.exists(self.meta_path):
+                return 0
+            with open(self.meta_path, "r", encoding="utf-8") as f:
+                self.dim = json.load(f)["dim"]
+
+        n_keys = os.path.getsize(self.keys_path) // KEY_BYTES if os.path.exists(self.keys_path) else 0
+        n_vecs = os.path.getsize(self.vec_path) // self.row_bytes if os.path.exists(self.vec_path) else 0
+        n = min(n_keys, n_vecs)
+        if n_keys != n or n_vecs != n:
+            # sisa tulisan yang terputus: potong ke baris lengkap terakhir
+            # (aman karena tidak ada penulis lain selama kunci dipegang)
+            with open(self.keys_path, "a+b") as f:
+                f.truncate(n * KEY_BYTES)
+            with open(self.vec_path, "a+b") as f:
+                f.truncate(n * self.row_bytes)
+
+        if n > self.n_rows:
+            with open(self.keys_path, "rb") as f:
+                f.seek(self.n_rows * KEY_BYTES)
+                raw = f.read((n - self.n_rows) * KEY_BYTES)
+            for i in range(n - self.n_rows):
+                self.index.setdefault(raw[i * KEY_BYTES:(i + 1) * KEY_BYTES], self.n_rows + i)
+            self.n_rows = n
+            self._mm = None
+        return n
+
+    def _vectors(self):
+        if self._mm is None and self.n_rows:
+            self._mm = np.memmap(self.vec_path, dtype=self.dtype, mode="r",
+                                 shape=(self.n_rows, self.dim))
+        return self._mm
+
+    def key(self, text, kind="passage"):
+        return hashlib.sha1(
+            f"{self.model_name}\x1f{self.normalize}\x1f{kind}\x1f{text}".encode("utf-8")
+        ).digest()
+
+    def get_many(self, texts, kind="passage"):
+        out = []
+        with self._lock:
+            mm = self._vectors()
+            for t in texts:
+                row = self.index.get(self.key(t, kind))
+                if row is None:
+                    self.misses += 1
+                    out.append(None)
+                else:
+                    self.hits += 1
+                    out.append(np.asarray(mm[row], dtype=np.float32))
+        return out
+
+    def put_many(self, texts, vectors, kind="passage"):
+        vectors = np.asarray(vectors, dtype=self.dtype)
+        if vectors.ndim != 2 or len(vectors) != len(texts):
+            raise ValueError("Jumlah teks dan vektor tidak sama")
+
+        with self._lock, self._file_lock():
+            start = self._sync()
+            if self.dim is None:
+                self.dim = int(vectors.shape[1])
+                with open(self.meta_path, "w", encoding="utf-8") as f:
+                    json.dump({"model": self.model_name, "normalize": self.normalize,
+                               "dim": self.dim, "dtype": self.dtype.name}, f)
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Dimensi vektor {vectors.shape[1]} != {self.dim}")
+
+            new_keys, new_rows, seen = [], [], set()
+            for t, v in zip(texts, vectors):
+                k = self.key(t, kind)
+                if k in self.index or k in seen:
+                    continue
+                seen.add(k)
+                new_keys.append(k)
+                new_rows.append(v)
+            if not new_keys:
+                return 0
+
+            # lepas memmap sebelum file diperpanjang (Windows tidak mengizinkan sebaliknya)
+            self._mm = None
+            with open(self.vec_path, "ab") as f:
+                f.write(np.ascontiguousarray(np.stack(new_rows)).tobytes())
+            with open(self.keys_path, "ab") as f:
+                f.write(b"".join(new_keys))
+
+            # baris = jumlah baris di file saat kunci dipegang, bukan len(self.index)
+            for i, k in enumerate(new_keys):
+                self.index[k] = start + i
+            self.n_rows = start + len(new_keys)
+            return len(new_keys)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits, "misses": self.misses, "size": len(self.index),
+            "hit_rate": (self.hits / total) if total else 0.0,
+        }
+
+# =========================
+# Wrapper Embeddings (LangChain)
+# =========================
+class CachedEmbeddings(Embeddings):
+    def __init__(self, inner, model_name=None, normalize=None, cache_dir=CACHE_DIR, dtype="float32"):
+        self.inner = inner
+        if model_name is None:
+            model_name = getattr(inner, "model_name", type(inner).__name__)
+        if normalize is None:
+            normalize = (getattr(inner, "encode_kwargs", None) or {}).get("normalize_embeddings", False)
+        self.cache = EmbeddingCache(model_name, normalize, cache_dir=cache_dir, dtype=dtype)
+
+    def embed_documents(self, texts):
+        texts = list(texts)
+        cached = self.cache.get_many(texts)
+
+        missing = list(dict.fromkeys(t for t, v in zip(texts, cached) if v is None))
+        if missing:
+            fresh = self.inner.embed_documents(missing)
+            self.cache.put_many(missing, fresh)
+            by_text = dict(zip(missing, fresh))
+            cached = [v if v is not None else by_text[t] for t, v in zip(texts, cached)]
+
+        return [np.asarray(v, dtype=np.float32).tolist() for v in cached]
+
+    def embed_query(self, text):
+        v = self.cache.get_many([text], kind="query")[0]
+        if v is None:
+            v = self.inner.embed_query(text)
+            self.cache.put_many([text], [v], kind="query")
+        return np.asarray(v, dtype=np.float32).tolist()
+
+    def embed_queries(self, texts):
+        # banyak pertanyaan sekaligus: yang belum ada di cache di-encode dalam
+        # satu panggilan batch (encoder e5 di sini tidak memakai prefix query)
+        texts = list(texts)
+        cached = self.cache.get_many(texts, kind="query")
+        missing = list(dict.fromkeys(t for t, v in zip(texts, cached) if v is None))
+        if missing:
+            fresh = self.inner.embed_documents(missing)
+            self.cache.put_many(missing, fresh, kind="query")
+            by_text = dict(zip(missing, fresh))
+            cached = [v if v is not None else by_text[t] for t, v in zip(texts, cached)]
+        return [np.asarray(v, dtype=np.float32).tolist() for v in cached]
+
+    def stats(self):
+        return self.cache.stats()
@@ -0,0 +1,327 @@
+import os
+import sys
+import json
+import time
+import argparse
+from datetime import datetime, timezone
+import torch
+from langchain_huggingface import HuggingFaceEmbeddings
+from langchain_community.vectorstores import Chroma
+
+from chunk_store import (
+    ChunkStore, ChunkStoreWriter, CORPUS_FILE, iter_stable_ids, tee_rows_to_store,
+)
+from dedup import dedup_rows, THRESHOLD as DEDUP_THRESHOLD
+from embedding_cache import CachedEmbeddings
+from embed_workers import PooledEmbeddings, EMBED_BATCH
+from lexical import build_bm25, BM25_FILE
+from retrieval import export_vectors, VECTORS_FILE
+from router import build_partitions, PARTITIONS_FILE
+from ingest import (
+    BASE_DIR, BOOKS_DIR, load_books,
+    iter_book_pages, iter_chunks, batched,
+)
+
+CHROMA_DIR    = os.path.join(BASE_DIR, "chroma_db")
+MANIFEST_FILE = "index_manifest.json"
+EMBED_MODEL   = "intfloat/multilingual-e5-large"
+ADD_BATCH     = 256
+STREAM_BATCH  = 64
+
+# =========================
+# ID chunk stabil (lihat chunk_store.iter_stable_ids)
+# =========================
+def stable_chunk_ids(book_name, chunks):
+    return [i for i, _ in iter_stable_ids(book_name, chunks)]
+
+# =========================
+# Manifest index
+# =========================
+def manifest_path(chroma_dir=CHROMA_DIR):
+    return os.path.join(chroma_dir, MANIFEST_FILE)
+
+def load_manifest(chroma_dir=CHROMA_DIR):
+    path = manifest_path(chroma_dir)
+    if not os.path.exists(path):
+        return {"version": 0, "embed_model": EMBED_MODEL, "books": {}}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def save_manifest(manifest, chroma_dir=CHROMA_DIR):
+    path = manifest_path(chroma_dir)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+# =========================
+# Upsert inkremental
+# =========================
+def load_chunks(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def has_chunks(book):
+    return os.path.exists(book.store_path) or os.path.exists(book.output_path)
+
+def book_rows(book):
+    # [(doc_id, chunk)]: chunk store hasil ingest bila ada, JSON lama sebagai cadangan
+    if os.path.exists(book.store_path):
+        with ChunkStore(book.store_path) as store:
+            return list(store.iter_rows())
+    return list(iter_stable_ids(book.name, load_chunks(book.output_path)))
+
+def chunk_metadata(book, doc_id, chunk):
+    meta = {
+        "doc_id": doc_id,
+        "book": book.name,
+        "source": book.judul or book.name,
+        "kelas": book.kelas,
+        "semester": book.semester,
+        "seq": int(chunk.get("chunk_id", 0)),
+    }
+    # file chunk lama belum punya halaman/bab/offset; Chroma tidak menerima None
+    for key in ("page", "chapter", "start", "end"):
+        if chunk.get(key) is not None:
+            meta[key] = int(chunk[key])
+    # asal duplikat yang digabung ke chunk ini (lihat dedup.py); kunci
+    # in_<field>_<nilai> dipakai build_where/partition_where
+    if chunk.get("also_in"):
+        meta["also_in"] = chunk["also_in"]
+    for key in chunk.get("provenance") or ():
+        meta[key] = True
+    return meta
+
+def _existing_metadata(db, book_name):
+    got = db.get(where={"book": book_name}, include=["metadatas"])
+    return dict(zip(got["ids"], got["metadatas"]))
+
+def _sync_batch(db, book, rows, existing):
+    # rows: [(doc_id, chunk)]. Chunk baru di-embed; chunk lama yang hanya
+    # berubah metadata (mis. urutan/halaman) cukup di-update tanpa embed ulang.
+    fresh, stale = [], {}
+    for doc_id, c in rows:
+        meta = chunk_metadata(book, doc_id, c)
+        if doc_id not in existing:
+            fresh.append((doc_id, c, meta))
+        elif existing[doc_id] != meta:
+            stale[doc_id] = meta
+
+    if fresh:
+        db.add_texts(
+            texts=[c["content"] for _, c, _ in fresh],
+            metadatas=[m for _, _, m in fresh],
+            ids=[i for i, _, _ in fresh],
+        )
+    if stale:
+        db._collection.update(ids=list(stale), metadatas=list(stale.values()))
+    return len(fresh), len(stale)
+
+def index_book(db, book, rows, add_batch=ADD_BATCH):
+    # rows: [(doc_id, chunk)] hasil iter_stable_ids (setelah dedup, bila aktif)
+    ids = [i for i, _ in rows]
+    existing = _existing_metadata(db, book.name)
+    wanted = set(ids)
+
+    gone = sorted(set(existing) - wanted)
+    if gone:
+        db.delete(ids=gone)
+
+    added = updated = 0
+    for start in range(0, len(rows), add_batch):
+        a, u = _sync_batch(db, book, rows[start:start + add_batch], existing)
+        added, updated = added + a, updated + u
+        if a:
+            print(f"  {book.name}: {min(start + add_batch, len(rows))}/{len(rows)} diperiksa, {added} di-embed")
+
+    return ids, {"added": added, "updated": updated, "deleted": len(gone),
+                 "kept": len(wanted) - added}
+
+def stream_index_book(db, book, batch_size=STREAM_BATCH):
+    # halaman -> bersih -> chunk -> embed -> Chroma, per batch berukuran tetap.
+    # Yang disimpan di memori hanya ID (dan metadata lama), bukan teks seluruh buku.
+    existing = _existing_metadata(db, book.name)
+    pages = iter_book_pages(book)
+    rows = tee_rows_to_store(iter_stable_ids(book.name, iter_chunks(pages, book)), book.store_path, book)
+
+    ids, added, updated = [], 0, 0
+    for batch in batched(rows, batch_size):
+        ids.extend(i for i, _ in batch)
+        a, u = _sync_batch(db, book, batch, existing)
+        added, updated = added + a, updated + u
+        print(f"  {book.name}: {len(ids)} chunk diproses, {added} baru")
+
+    gone = sorted(set(existing) - set(ids))
+    if gone:
+        db.delete(ids=gone)
+    return ids, {"added": added, "updated": updated, "deleted": len(gone),
+                 "kept": len(set(ids)) - added}
+
+def make_embeddings(workers=0, threads=None, batch_size=EMBED_BATCH, backend="torch"):
+    # workers=0 -> satu proses (perilaku lama, GPU bila ada);
+    # workers>0 -> pool proses CPU dengan batch terurut panjang (embed_workers.py)
+    if workers > 0:
+        inner = PooledEmbeddings(EMBED_MODEL, workers=workers, threads=threads,
+                                 batch_size=batch_size, backend=backend)
+    elif backend == "onnx":
+        from onnx_encoder import OnnxEmbeddings
+        inner = OnnxEmbeddings(threads=threads, batch_size=batch_size)
+    else:
+        inner = HuggingFaceEmbeddings(
+            model_name=EMBED_MODEL,
+            model_kwargs={"device": "cuda" if torch.cuda.is_available() else "cpu"},
+            encode_kwargs={"normalize_embeddings": True, "batch_size": batch_size}
+        )
+    return CachedEmbeddings(inner)
+
+def open_db(chroma_dir=CHROMA_DIR, embedding_function=None):
+    if embedding_function is None:
+        embedding_function = make_embeddings()
+    return Chroma(persist_directory=chroma_dir, embedding_function=embedding_function)
+
+def dedup_books(books, books_dir=BOOKS_DIR, threshold=DEDUP_THRESHOLD):
+    # Dedup butuh pandangan seluruh korpus, walaupun yang di-index hanya sebagian buku
+    scope = {b.name: b for b in load_books(None, books_dir)}
+    scope.update({b.name: b for b in books})
+
+    rows_by_book = {}
+    for name, book in scope.items():
+        if not has_chunks(book):
+            print(f"[WARN] chunk {name} belum ada, {name} tidak ikut dedup")
+            continue
+        rows_by_book[name] = book_rows(book)
+
+    book_fields = {name: {"kelas": b.kelas, "semester": b.semester} for name, b in scope.items()}
+    kept, report = dedup_rows(rows_by_book, threshold, book_fields)
+    reduction = 1 - report["after"] / max(report["before"], 1)
+    print(f"[DEDUP] {report['before']} -> {report['after']} chunk (-{reduction:.1%}), "
+          f"{report['clusters']} klaster, Jaccard >= {threshold}")
+    for name, n in report["dropped_per_book"].items():
+        print(f"  {name}: {n} chunk digabung ke buku lain")
+    return kept, report
+
+def write_corpus_store(manifest, chroma_dir=CHROMA_DIR, books_dir=BOOKS_DIR, kept_rows=None):
+    # Satu chunk store berisi persis chunk yang ada di index (setelah dedup),
+    # dipakai sisi query untuk mengambil teks/metadata per doc_id tanpa JSON.
+    path = os.path.join(chroma_dir, CORPUS_FILE)
+    books = load_books(list(manifest["books"]), books_dir)
+    with ChunkStoreWriter(path) as w:
+        for book in books:
+            wanted = set(manifest["books"][book.name]["ids"])
+            rows = kept_rows.get(book.name) if kept_rows else None
+            for doc_id, chunk in rows if rows is not None else book_rows(book):
+                if doc_id in wanted:
+                    w.add(doc_id, chunk, book)
+                    wanted.discard(doc_id)
+    print(f"[INFO] Corpus store: {len(w.ids)} chunk -> {path}")
+    return path
+
+def run_index(books, chroma_dir=CHROMA_DIR, reset=False, stream=False, batch_size=STREAM_BATCH,
+              dedup=True, books_dir=BOOKS_DIR, embeddings=None):
+    db = open_db(chroma_dir, embeddings)
+    pooled = getattr(db.embeddings, "inner", None)
+    # pool butuh batch besar per panggilan add_texts agar semua worker terisi
+    add_batch = ADD_BATCH
+    if isinstance(pooled, PooledEmbeddings):
+        add_batch = max(ADD_BATCH, pooled.workers * pooled.batch_size * 4)
+    manifest = load_manifest(chroma_dir)
+
+    if reset:
+        print("[INFO] Reset: menghapus koleksi lama...")
+        db.delete_collection()
+        db = open_db(chroma_dir, db.embeddings)
+        manifest["books"] = {}
+    elif not manifest["books"] and db.get(include=[], limit=1)["ids"]:
+        print("[WARN] Koleksi berisi data tanpa manifest (hasil skrip lama). "
+              "Jalankan dengan --reset agar tidak ada chunk ganda.")
+
+    kept_rows = None
+    if dedup and not stream:
+        kept_rows, manifest["dedup"] = dedup_books(books, books_dir)
+
+    changed = False
+    for book in books:
+        if not has_chunks(book):
+            # dedup_books juga melewatinya; buku lain tetap di-index
+            print(f"[ERROR] File chunk {book.name} tidak ada, buku dilewati (jalankan chunking dulu)")
+            continue
+        t0 = time.perf_counter()
+        if stream:
+            ids, stats = stream_index_book(db, book, batch_size)
+        elif kept_rows is not None:
+            ids, stats = index_book(db, book, kept_rows[book.name], add_batch)
+        else:
+            ids, stats = index_book(db, book, book_rows(book), add_batch)
+        manifest["books"][book.name] = {
+            "chunk_file": book.output,
+            "ids": ids,
+        }
+        changed = changed or stats["added"] or stats["deleted"] or stats["updated"]
+        if stream:
+            # simpan manifest per buku agar progres tidak hilang jika proses berhenti
+            save_manifest(manifest, chroma_dir)
+        print(f"[INDEX] {book.name}: +{stats['added']} -{stats['deleted']} ~{stats['updated']} ={stats['kept']} "
+              f"({time.perf_counter() - t0:.1f} s)")
+
+    if changed or not os.path.exists(manifest_path(chroma_dir)):
+        manifest["version"] = manifest.get("version", 0) + 1
+    manifest["embed_model"] = EMBED_MODEL
+    manifest["updated_at"] = datetime.now(timezone.utc).isoformat(timespec="seconds")
+    manifest["total_chunks"] = sum(len(b["ids"]) for b in manifest["books"].values())
+    if changed or not os.path.exists(os.path.join(chroma_dir, CORPUS_FILE)) \
+            or not os.path.exists(os.path.join(chroma_dir, VECTORS_FILE)) \
+            or not os.path.exists(os.path.join(chroma_dir, BM25_FILE)) \
+            or not os.path.exists(os.path.join(chroma_dir, PARTITIONS_FILE)):
+        write_corpus_store(manifest, chroma_dir, books_dir, kept_rows)
+        # vektor sejajar corpus.chunks untuk backend retrieval numpy
+        export_vectors(db, chroma_dir)
+        # indeks lexical atas chunk ID yang sama untuk retrieval hybrid
+        build_bm25(chroma_dir)
+        # centroid + leksikon era per buku untuk routing pertanyaan
+        eras = {b.name: b.era for b in load_books(list(manifest["books"]), books_dir)}
+        build_partitions(chroma_dir, eras)
+    manifest["corpus_store"] = CORPUS_FILE
+    manifest["vectors"] = VECTORS_FILE
+    manifest["bm25"] = BM25_FILE
+    manifest["partitions"] = PARTITIONS_FILE
+    save_manifest(manifest, chroma_dir)
+    if isinstance(db.embeddings, CachedEmbeddings):
+        st = db.embeddings.stats()
+        print(f"[CACHE] embedding hit={st['hits']} miss={st['misses']} (hit rate {st['hit_rate']:.1%})")
+    if isinstance(pooled, PooledEmbeddings):
+        st = pooled.stats()
+        print(f"[EMBED] {st['chunks']} chunk di-embed dalam {st['seconds']:.1f} s = {st['chunks_per_sec']:.1f} chunk/s "
+              f"({st['workers']} worker x {st['threads']} thread, batch {st['batch_size']}, {st['backend']})")
+        pooled.close()
+    print(f"[INFO] Manifest v{manifest['version']} ({manifest['total_chunks']} chunk) -> {manifest_path(chroma_dir)}")
+    return manifest
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Upsert inkremental chunk ke Chroma")
+    parser.add_argument("--book", action="append", help="nama buku (boleh berulang); default semua yang enabled")
+    parser.add_argument("--books-dir", default=BOOKS_DIR)
+    parser.add_argument("--chroma-dir", default=CHROMA_DIR)
+    parser.add_argument("--reset", action="store_true", help="hapus koleksi lama lalu bangun ulang")
+    parser.add_argument("--stream", action="store_true",
+                        help="langsung dari PDF: halaman->chunk->embed->Chroma per batch (memori tetap)")
+    parser.add_argument("--batch-size", type=int, default=STREAM_BATCH)
+    parser.add_argument("--no-dedup", action="store_true",
+                        help="jangan gabungkan chunk hampir-sama antar buku (mode --stream selalu tanpa dedup)")
+    parser.add_argument("--embed-workers", type=int, default=0,
+                        help="jumlah proses embedding CPU (0 = satu proses, perilaku lama)")
+    parser.add_argument("--embed-threads", type=int, default=None,
+                        help="thread per proses embedding (default: jumlah CPU / worker)")
+    parser.add_argument("--embed-batch", type=int, default=EMBED_BATCH, help="jumlah teks per forward pass")
+    parser.add_argument("--backend", choices=["torch", "onnx"], default="torch",
+                        help="onnx butuh hasil ekspor: python onnx_encoder.py")
+    args = parser.parse_args(argv)
+
+    books = load_books(args.book, args.books_dir)
+    embeddings = make_embeddings(args.embed_workers, args.embed_threads, args.embed_batch, args.backend)
+    run_index(books, chroma_dir=args.chroma_dir, reset=args.reset,
+              stream=args.stream, batch_size=args.batch_size,
+              dedup=not args.no_dedup, books_dir=args.books_dir, embeddings=embeddings)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
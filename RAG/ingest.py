@@ -0,0 +1,281 @@
+import os
+import sys
+import json
+import time
+import argparse
+import tomllib
+from itertools import islice
+from dataclasses import dataclass, field
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from PyPDF2 import PdfReader
+from tqdm import tqdm
+
+from cleaning import rules_for, detect_chapter
+from chunk_store import iter_stable_ids, write_chunk_store, store_path_for
+
+BASE_DIR  = os.path.dirname(os.path.abspath(__file__))
+BOOKS_DIR = os.path.join(BASE_DIR, "books")
+
+# Jumlah halaman PDF per tugas worker (PDF besar dipecah ke beberapa worker)
+PAGES_PER_TASK = 24
+
+@dataclass
+class BookConfig:
+    name: str
+    pdf: str
+    output: str
+    judul_besar: list = field(default_factory=list)
+    hapus_footer_halaman: list = field(default_factory=list)
+    hapus_pdf_halaman: list = field(default_factory=list)
+    footer_patterns: list = field(default_factory=list)
+    hapus_titik_singkatan: bool = False
+    judul: str = ""
+    kelas: int = 0
+    semester: int = 0  # 0 = buku satu tahun penuh
+    chunk_size: int = 250
+    chunk_overlap: int = 60
+    enabled: bool = True
+    era: list = field(default_factory=list)  # kata kunci era/topik untuk router.py
+
+    @property
+    def pdf_path(self):
+        return os.path.normpath(os.path.join(BASE_DIR, self.pdf))
+
+    @property
+    def output_path(self):
+        return os.path.normpath(os.path.join(BASE_DIR, self.output))
+
+    @property
+    def store_path(self):
+        # chunk store biner (chunk_store.py) di samping file JSON
+        return store_path_for(self.output_path)
+
+# =========================
+# Config buku (TOML/YAML)
+# =========================
+def load_book_config(path) -> BookConfig:
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".toml":
+        with open(path, "rb") as f:
+            data = tomllib.load(f)
+    elif ext in (".yaml", ".yml"):
+        import yaml
+        with open(path, "r", encoding="utf-8") as f:
+            data = yaml.safe_load(f) or {}
+    else:
+        raise ValueError(f"Format config tidak dikenal: {path}")
+
+    data.setdefault("name", os.path.splitext(os.path.basename(path))[0])
+    unknown = set(data) - set(BookConfig.__dataclass_fields__)
+    if unknown:
+        raise ValueError(f"Key tidak dikenal di {path}: {sorted(unknown)}")
+    return BookConfig(**data)
+
+def load_books(names=None, books_dir=BOOKS_DIR):
+    books = []
+    for fname in sorted(os.listdir(books_dir)):
+        if os.path.splitext(fname)[1].lower() in (".toml", ".yaml", ".yml"):
+            books.append(load_book_config(os.path.join(books_dir, fname)))
+
+    if not names:
+        return [b for b in books if b.enabled]
+
+    by_name = {b.name: b for b in books}
+    missing = [n for n in names if n not in by_name]
+    if missing:
+        raise ValueError(f"Buku tidak ditemukan di {books_dir}: {missing}")
+    return [by_name[n] for n in names]
+
+# =========================
+# Pembersihan teks
+# =========================
+def clean_page(page_num, text, book: BookConfig):
+    # aturan buku dikompilasi sekali per proses (lihat cleaning.py)
+    return rules_for(book).clean_page(page_num, text)
+
+# =========================
+# Ekstraksi PDF
+# =========================
+def list_pdf_files(data_dir):
+    if os.path.isfile(data_dir):
+        return [data_dir]
+    if os.path.isdir(data_dir):
+        return sorted(
+            os.path.join(data_dir, f)
+            for f in os.listdir(data_dir)
+            if f.lower().endswith(".pdf")
+        )
+    raise ValueError(f"Path tidak valid: {data_dir}")
+
+def count_pages(pdf_path):
+    return len(PdfReader(pdf_path).pages)
+
+def extract_page_range(book: BookConfig, pdf_path, start, end):
+    # start/end 1-based, inklusif-eksklusif; dipanggil di worker.
+    # Halaman yang dibuang tetap dilaporkan bila memuat penanda bab,
+    # karena halaman pembuka bab biasanya termasuk hapus_pdf_halaman.
+    reader = PdfReader(pdf_path)
+    pages = []
+    for page_num in range(start, min(end, len(reader.pages) + 1)):
+        raw = reader.pages[page_num - 1].extract_text()
+        cleaned = clean_page(page_num, raw, book)
+        chapter = detect_chapter(raw)
+        if cleaned or chapter:
+            pages.append({"page": page_num, "text": cleaned, "chapter": chapter})
+    return pages
+
+def fill_chapters(pages):
+    # Bab diteruskan ke halaman berikutnya sampai ada penanda bab baru
+    chapter = 0
+    for p in pages:
+        if p["chapter"]:
+            chapter = p["chapter"]
+        if p["text"]:
+            yield {"page": p["page"], "text": p["text"], "chapter": chapter}
+
+def iter_book_pages(book: BookConfig, window=PAGES_PER_TASK):
+    # Reader dibuka ulang per jendela halaman agar cache objek PyPDF2 tidak menumpuk
+    def raw_pages():
+        for pdf_path in list_pdf_files(book.pdf_path):
+            n_pages = count_pages(pdf_path)
+            for start in range(1, n_pages + 1, window):
+                yield from extract_page_range(book, pdf_path, start, start + window)
+    return fill_chapters(raw_pages())
+
+def extract_text_from_pdfs(data_dir, book: BookConfig):
+    all_pages = []
+    for pdf_path in list_pdf_files(data_dir):
+        print(f"Membaca {os.path.basename(pdf_path)} ...")
+        all_pages.extend(extract_page_range(book, pdf_path, 1, count_pages(pdf_path) + 1))
+    return list(fill_chapters(all_pages))
+
+# =========================
+# Chunking & simpan
+# =========================
+def iter_chunks(pages, book: BookConfig):
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=book.chunk_size,
+        chunk_overlap=book.chunk_overlap,
+        separators=["\n\n", "\n", " "],
+    )
+
+    chunk_id = 1
+    for page in pages:
+        text = page["text"]
+        cursor = 0
+        for chunk in splitter.split_text(text):
+            # offset karakter chunk di dalam teks halaman yang sudah dibersihkan
+            start = text.find(chunk, cursor)
+            if start >= 0:
+                cursor = start + 1
+            yield {
+                "chunk_id": chunk_id,
+                "content": chunk,
+                "book": book.name,
+                "kelas": book.kelas,
+                "semester": book.semester,
+                "page": page["page"],
+                "chapter": page["chapter"],
+                "start": start,
+                "end": start + len(chunk) if start >= 0 else -1,
+            }
+            chunk_id += 1
+
+def chunk_texts(pages, book: BookConfig, show_progress=True):
+    pages = tqdm(pages, desc="Chunking", disable=not show_progress)
+    return list(iter_chunks(pages, book))
+
+def save_chunks_to_json(chunks, output_file):
+    with open(output_file, "w", encoding="utf-8") as f:
+        json.dump(chunks, f, ensure_ascii=False, indent=2)
+
+def batched(iterable, n):
+    it = iter(iterable)
+    while batch := list(islice(it, n)):
+        yield batch
+
+def chunk_and_save(book: BookConfig, pages, write_json=False):
+    chunks = chunk_texts(fill_chapters(pages), book, show_progress=False)
+    write_chunk_store(book.store_path, iter_stable_ids(book.name, chunks), book)
+    if write_json:
+        save_chunks_to_json(chunks, book.output_path)
+    return len(chunks)
+
+# =========================
+# Orkestrasi paralel
+# =========================
+def plan_page_tasks(book: BookConfig, pages_per_task=PAGES_PER_TASK):
+    tasks = []
+    for pdf_path in list_pdf_files(book.pdf_path):
+        n_pages = count_pages(pdf_path)
+        for start in range(1, n_pages + 1, pages_per_task):
+            tasks.append((pdf_path, start, start + pages_per_task))
+    return tasks
+
+def run_books(books, workers=None, pages_per_task=PAGES_PER_TASK, write_json=False):
+    t_all = time.perf_counter()
+    state = {}
+    pending = {}
+
+    with ProcessPoolExecutor(max_workers=workers) as ex:
+        # Semua potongan halaman dari semua buku masuk ke pool yang sama
+        for book in books:
+            tasks = plan_page_tasks(book, pages_per_task)
+            state[book.name] = {
+                "book": book, "t0": time.perf_counter(),
+                "parts": [None] * len(tasks), "left": len(tasks),
+            }
+            print(f"[INFO] {book.name}: {len(tasks)} tugas halaman")
+            for idx, (pdf_path, start, end) in enumerate(tasks):
+                fut = ex.submit(extract_page_range, book, pdf_path, start, end)
+                pending[fut] = ("pages", book.name, idx)
+
+        results = {}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                kind, name, idx = pending.pop(fut)
+                st = state[name]
+                if kind == "pages":
+                    st["parts"][idx] = fut.result()
+                    st["left"] -= 1
+                    if st["left"] == 0:
+                        # urutan halaman dipertahankan sesuai urutan tugas
+                        pages = [p for part in st["parts"] for p in part]
+                        st["n_pages"] = sum(1 for p in pages if p["text"])
+                        st["parts"] = None
+                        chunk_fut = ex.submit(chunk_and_save, st["book"], pages, write_json)
+                        pending[chunk_fut] = ("chunks", name, None)
+                else:
+                    elapsed = time.perf_counter() - st["t0"]
+                    results[name] = {"pages": st["n_pages"], "chunks": fut.result(), "seconds": elapsed}
+                    print(f"[TIMING] {name}: {elapsed:.1f} s | halaman={st['n_pages']} "
+                          f"| chunk={results[name]['chunks']} -> {os.path.basename(st['book'].store_path)}")
+
+    wall = time.perf_counter() - t_all
+    total = sum(r["seconds"] for r in results.values())
+    print(f"[TIMING] Total wall-clock: {wall:.1f} s (jumlah per buku: {total:.1f} s)")
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ekstraksi + chunking semua buku secara paralel")
+    parser.add_argument("--book", action="append", help="nama buku (boleh berulang); default semua yang enabled")
+    parser.add_argument("--books-dir", default=BOOKS_DIR)
+    parser.add_argument("--workers", type=int, default=None, help="jumlah proses (default: jumlah CPU)")
+    parser.add_argument("--pages-per-task", type=int, default=PAGES_PER_TASK)
+    parser.add_argument("--json", action="store_true",
+                        help="tulis juga clean_chunks*.json (format lama) selain chunk store .chunks")
+    args = parser.parse_args(argv)
+
+    books = load_books(args.book, args.books_dir)
+    if not books:
+        print("Tidak ada buku untuk diproses.")
+        return 1
+    print(f"Memproses {len(books)} buku: {', '.join(b.name for b in books)}")
+    run_books(books, workers=args.workers, pages_per_task=args.pages_per_task, write_json=args.json)
+    print("Selesai!")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,183 @@
+import os
+import re
+import numpy as np
+from collections import Counter, defaultdict
+from langchain_core.documents import Document
+
+from chunk_store import ChunkStore, CORPUS_FILE
+from retrieval import where_mask, partition_where
+
+BM25_FILE = "corpus_bm25.npz"
+BM25_K1   = 1.2
+BM25_B    = 0.75
+RRF_K     = 60
+
+_TOKEN = re.compile(r'\w+')
+# entitas di pertanyaan yang sudah dinormalisasi (normalize_query): akronim
+# ditulis kapital penuh (BPUPKI, G30S/PKI), tahun 4 digit
+_ENTITY = re.compile(r'\b(?:[A-Z][A-Z0-9]+|[0-9]+[A-Z][A-Z0-9]*|1[0-9]{3}|20[0-9]{2})\b')
+# kata tanya/pengisi yang boleh ada di pertanyaan entitas murni ("Apa itu BPUPKI?")
+_QUESTION_WORDS = {
+    "apa", "itu", "apakah", "siapa", "kapan", "dimana", "mana", "yang", "adalah",
+    "jelaskan", "sebutkan", "tentang", "pengertian", "arti", "maksud", "dari", "dengan",
+    "di", "ke", "pada", "dan", "atau", "tahun", "peristiwa",
+}
+
+def tokenize(text):
+    return _TOKEN.findall((text or "").lower())
+
+def entity_terms(question):
+    return {t for m in _ENTITY.findall(question or "") for t in tokenize(m)}
+
+def is_entity_query(question):
+    # semua kata bermakna adalah entitas -> cukup dijawab indeks lexical
+    entities = entity_terms(question)
+    rest = [t for t in tokenize(question) if t not in entities and t not in _QUESTION_WORDS]
+    return bool(entities) and not rest
+
+# =========================
+# Bangun indeks BM25 (dipanggil indexer setelah corpus.chunks ditulis)
+# =========================
+# Posting disimpan dalam format CSR: untuk term ke-t, baris dokumen ada di
+# docs[ptr[t]:ptr[t+1]] dengan bobot BM25 yang sudah dihitung penuh
+# (idf * tf-saturasi), sehingga skor query = jumlah bobot per term.
+def build_bm25(chroma_dir, k1=BM25_K1, b=BM25_B):
+    postings = defaultdict(list)
+    with ChunkStore(os.path.join(chroma_dir, CORPUS_FILE)) as store:
+        n = len(store)
+        doc_len = np.zeros(n, dtype=np.float32)
+        for row in range(n):
+            tf = Counter(tokenize(store.text(row)))
+            doc_len[row] = sum(tf.values())
+            for term, count in tf.items():
+                postings[term].append((row, count))
+
+    avgdl = float(doc_len.mean()) if n else 0.0
+    terms = sorted(postings)
+    ptr = np.zeros(len(terms) + 1, dtype=np.int64)
+    docs, weights = [], []
+    for t, term in enumerate(terms):
+        plist = postings[term]
+        idf = np.log(1.0 + (n - len(plist) + 0.5) / (len(plist) + 0.5))
+        rows = np.fromiter((r for r, _ in plist), dtype=np.int32, count=len(plist))
+        tf = np.fromiter((c for _, c in plist), dtype=np.float32, count=len(plist))
+        norm = k1 * (1.0 - b + b * doc_len[rows] / max(avgdl, 1e-9))
+        docs.append(rows)
+        weights.append((idf * tf * (k1 + 1.0) / (tf + norm)).astype(np.float32))
+        ptr[t + 1] = ptr[t] + len(plist)
+
+    path = os.path.join(chroma_dir, BM25_FILE)
+    tmp = path + ".tmp.npz"
+    np.savez(
+        tmp, terms=np.array(terms, dtype=str), ptr=ptr,
+        docs=np.concatenate(docs) if docs else np.zeros(0, np.int32),
+        weights=np.concatenate(weights) if weights else np.zeros(0, np.float32),
+        n_docs=np.array([n]),
+    )
+    os.replace(tmp, path)
+    print(f"[INFO] Indeks BM25: {len(terms)} term, {int(ptr[-1])} posting, {n} chunk -> {path}")
+    return path
+
+# =========================
+# Pencarian lexical
+# =========================
+class LexicalIndex:
+    name = "bm25"
+
+    def __init__(self, chroma_dir):
+        self.store = ChunkStore(os.path.join(chroma_dir, CORPUS_FILE))
+        data = np.load(os.path.join(chroma_dir, BM25_FILE))
+        if int(data["n_docs"][0]) != len(self.store):
+            raise ValueError(f"{BM25_FILE} tidak sejajar dengan {CORPUS_FILE}; jalankan ulang indexer.py")
+        self.vocab = {t: i for i, t in enumerate(data["terms"].tolist())}
+        self.ptr = data["ptr"]
+        self.docs = data["docs"]
+        self.weights = data["weights"]
+
+    def scores(self, query, require=()):
+        # skor BM25 semua chunk + jumlah term wajib (require) yang muncul
+        scores = np.zeros(len(self.store), dtype=np.float32)
+        matched = np.zeros(len(self.store), dtype=np.int32)
+        for term in set(tokenize(query)):
+            t = self.vocab.get(term)
+            if t is None:
+                continue
+            s, e = self.ptr[t], self.ptr[t + 1]
+            rows = self.docs[s:e]
+            scores[rows] += self.weights[s:e]   # baris unik per term
+            if term in require:
+                matched[rows] += 1
+        return scores, matched
+
+    def search(self, query, k=20, filter=None, require=()):
+        # [(doc_id, skor BM25)]; require = term yang wajib muncul semuanya
+        require = set(require)
+        scores, matched = self.scores(query, require)
+        ok = scores > 0
+        if require:
+            ok &= matched == len(require)
+        mask = where_mask(self.store, filter)
+        if mask is not None:
+            ok &= mask
+        candidates = np.flatnonzero(ok)
+        if not len(candidates):
+            return []
+        top = candidates[np.argsort(-scores[candidates], kind="stable")[:k]]
+        return [(self.store.doc_id(int(r)), float(scores[r])) for r in top]
+
+    def documents(self, hits):
+        # hidrasi dari chunk store; skor = BM25 relatif terhadap hit teratas (0..1)
+        if not hits:
+            return []
+        best = hits[0][1] or 1.0
+        out = []
+        for doc_id, score in hits:
+            row = self.store.row_of(doc_id)
+            meta = {**self.store.metadata(row), "retrieval": self.name}
+            out.append((Document(page_content=self.store.text(row), metadata=meta), score / best))
+        return out
+
+def rrf_fuse(*rankings, k=RRF_K):
+    # rankings: daftar doc_id terurut; skor = sum 1 / (k + peringkat)
+    fused = defaultdict(float)
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            fused[doc_id] += 1.0 / (k + rank)
+    return sorted(fused, key=fused.get, reverse=True)
+
+def hybrid_search(question, retriever, lexical, k=20, dense_k=8, lexical_k=20, filter=None, embed=None,
+                  threshold=None, partitions=None):
+    # Mengembalikan ([(Document, relevance)] urut RRF, mode).
+    # mode "entity": pertanyaan entitas murni dijawab indeks lexical saja
+    # (tanpa embed pertanyaan); skornya BM25 relatif, bukan cosine.
+    # embed: fungsi teks -> vektor (mis. lewat cache); default encoder retriever.
+    # threshold: relevance minimum kandidat non-entitas; yang di bawahnya
+    # tidak ikut digabung dan teksnya tidak diambil.
+    # partitions: buku hasil router.py; None = seluruh korpus.
+    lexical_filter = partition_where(filter, partitions)
+    entities = entity_terms(question)
+    if is_entity_query(question):
+        hits = lexical.search(question, k=k, filter=lexical_filter, require=entities)
+        if hits:
+            return lexical.documents(hits), "entity"
+
+    vector = (embed or retriever.embedding.embed_query)(question)
+    if threshold is None:
+        dense = retriever.search_by_vector(vector, k=dense_k, filter=filter, partitions=partitions)
+    else:
+        dense = retriever.range_search(vector, threshold, max_count=dense_k, filter=filter,
+                                       partitions=partitions)
+    hits = lexical.search(question, k=lexical_k, filter=lexical_filter)
+
+    # kandidat yang hanya ditemukan BM25 tetap diberi relevance cosine yang
+    # sebanding dengan jalur dense, agar threshold COS_ABS tetap berlaku;
+    # skor dihitung dulu, teks hanya diambil untuk yang lolos
+    by_id = {d.metadata.get("doc_id"): (d, s) for d, s in dense}
+    missing = [doc_id for doc_id, _ in hits if doc_id not in by_id]
+    for d, s in retriever.fetch(missing, vector, threshold=threshold):
+        by_id[d.metadata.get("doc_id")] = (d, s)
+
+    dense_ids = [d.metadata.get("doc_id") for d, _ in dense]
+    lexical_ids = [doc_id for doc_id, _ in hits if doc_id in by_id]
+    fused = rrf_fuse(dense_ids, lexical_ids)[:k]
+    return [by_id[i] for i in fused], "hybrid"
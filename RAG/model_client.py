@@ -0,0 +1,181 @@
+import os
+import json
+
+from scheduler import InferenceScheduler, QueueFull, NotReady, DeadlineExceeded, REQUEST_TIMEOUT
+
+# kosong = model dimuat di proses ini; mis. http://127.0.0.1:8765 = pakai model_server.py
+MODEL_SERVER = os.getenv("RAG_MODEL_SERVER", "")
+POOL_SIZE    = 16   # koneksi keep-alive ke model server per proses web
+LOADING_RETRY_AFTER = 10   # detik; saran Retry-After selama model dimuat di background
+
+class ModelServerError(Exception):
+    pass
+
+class ModelLoadError(ModelServerError):
+    # komponen wajib gagal dimuat: bukan kondisi sementara, jadi bukan 503
+    pass
+
+# =========================
+# Model di proses yang sama (default; juga dipakai model_server.py)
+# =========================
+# Pipeline RAG + antrean inferensi. query_rag_mistral hanya di-import di sini,
+# jadi proses web yang memakai RemoteModels tidak memuat model. Model dimuat di
+# background saat start (RAG_MODEL_LOADING=background) atau saat pertanyaan pertama.
+class LocalModels:
+    def __init__(self, scheduler=None):
+        import query_rag_mistral as rag
+        self.rag = rag
+        # worker menunggu model siap sebelum mulai melayani job
+        self.scheduler = scheduler or InferenceScheduler(prepare=self._load)
+        if rag.MODEL_LOADING == "background":
+            rag.start_loading()
+
+    def _failed(self, failed):
+        names = ", ".join(f"{n} ({err})" for n, err in failed.items())
+        return ModelLoadError(f"komponen gagal dimuat: {names}")
+
+    def _load(self):
+        try:
+            self.rag.load_models()
+        except Exception as e:
+            raise self._failed(self.rag.readiness()["failed"] or {"model": e}) from e
+
+    def _check_ready(self):
+        # komponen wajib gagal -> error yang menyebut komponennya (500/502);
+        # selama muat background pertanyaan ditolak cepat (503) alih-alih menunggu
+        # sampai lewat RAG_REQUEST_TIMEOUT; mode lazy tetap memuat di job pertama
+        status = self.rag.readiness()
+        if status["failed"]:
+            raise self._failed(status["failed"])
+        if self.rag.MODEL_LOADING == "background" and not status["ready"]:
+            raise NotReady(LOADING_RETRY_AFTER)
+
+    def answer(self, question, filters=None):
+        self._check_ready()
+        job = self.scheduler.submit(self.rag.get_chatbot_response_with_metrics, question, filters=filters)
+        result = job.result()
+        result.update(job.timing())
+        return result
+
+    def answer_stream(self, question, filters=None):
+        # submit langsung (QueueFull dilempar di sini, sebelum respons dimulai);
+        # event dibaca dari generator yang dikembalikan
+        self._check_ready()
+        job = self.scheduler.submit(self.rag.stream_chatbot_response, question, filters=filters, stream=True)
+
+        def events():
+            try:
+                for event, data in job.events():
+                    if event == "done":
+                        data.update(job.timing())
+                    yield event, data
+            finally:
+                job.cancel()   # generator ditutup sebelum selesai = klien terputus
+        return events()
+
+    def cache_entry(self, key):
+        cache = self.rag.get_answer_cache()
+        return cache.get(key) if cache is not None else None
+
+    def invalidate_cache(self, key):
+        # None = cache jawaban tidak aktif
+        cache = self.rag.get_answer_cache()
+        return cache.invalidate(key) if cache is not None else None
+
+    def readiness(self):
+        return self.rag.readiness()
+
+    def stats(self):
+        return {"scheduler": self.scheduler.stats()}
+
+# =========================
+# Klien model server (HTTP lokal, koneksi keep-alive di-pool)
+# =========================
+# Bentuk hasil dan exception sama dengan LocalModels: 503 -> QueueFull,
+# 504 -> DeadlineExceeded, sehingga app.py tidak perlu tahu modelnya di mana.
+class RemoteModels:
+    def __init__(self, url=MODEL_SERVER, pool_size=POOL_SIZE, timeout=REQUEST_TIMEOUT + 5):
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.requests = requests
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+
+    def _check(self, resp):
+        if resp.status_code == 503:
+            retry = resp.headers.get("Retry-After", "1")
+            resp.close()
+            raise QueueFull(int(retry) if retry.isdigit() else 1)
+        if resp.status_code == 504:
+            resp.close()
+            raise DeadlineExceeded("model server: batas waktu habis")
+        if resp.status_code >= 400:
+            msg = resp.text[:200]
+            resp.close()
+            raise ModelServerError(f"model server {resp.status_code}: {msg}")
+        return resp
+
+    def _request(self, method, path, **kwargs):
+        try:
+            return self.session.request(method, f"{self.url}{path}", timeout=self.timeout, **kwargs)
+        except self.requests.RequestException as e:
+            raise ModelServerError(f"model server tidak terjangkau: {e}") from e
+
+    def _post(self, path, payload=None, stream=False):
+        return self._check(self._request("POST", path, json=payload or {}, stream=stream))
+
+    def answer(self, question, filters=None):
+        return self._post("/answer", {"question": question, "filters": filters}).json()
+
+    def answer_stream(self, question, filters=None):
+        resp = self._post("/answer_stream", {"question": question, "filters": filters}, stream=True)
+
+        def events():
+            try:
+                for line in resp.iter_lines():
+                    if not line:
+                        continue
+                    rec = json.loads(line)
+                    if rec["event"] == "error":
+                        if rec["data"].get("kind") == "deadline":
+                            raise DeadlineExceeded(rec["data"]["message"])
+                        raise ModelServerError(rec["data"]["message"])
+                    yield rec["event"], rec["data"]
+            finally:
+                # koneksi ditutup sebelum "done" -> server membatalkan job
+                resp.close()
+        return events()
+
+    def cache_entry(self, key):
+        resp = self._request("GET", f"/answer_cache/{key}")
+        if resp.status_code == 404:
+            return None
+        return self._check(resp).json()
+
+    def invalidate_cache(self, key):
+        return self._post(f"/answer_cache/{key}/invalidate").json()["invalidated"]
+
+    def readiness(self):
+        # /ready di model server menjawab 503 selama memuat; isinya tetap status komponen
+        try:
+            return self.session.get(f"{self.url}/ready", timeout=5).json()
+        except Exception as e:
+            return {"ready": False, "failed": {}, "error": f"model server tidak terjangkau: {e}", "components": {}}
+
+    def stats(self):
+        return self._check(self._request("GET", "/stats")).json()
+
+def ready_status(status):
+    # kode HTTP untuk /ready: 200 siap, 500 komponen wajib gagal, 503 masih dimuat
+    if status["ready"]:
+        return 200
+    return 500 if status.get("failed") else 503
+
+def connect(url=MODEL_SERVER):
+    if url:
+        print(f"[INFO] Memakai model server {url}")
+        return RemoteModels(url)
+    return LocalModels()
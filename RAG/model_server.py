@@ -0,0 +1,135 @@
+import sys
+import json
+import argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from scheduler import QueueFull, DeadlineExceeded
+from model_client import LocalModels, ready_status
+
+HOST = "127.0.0.1"
+PORT = 8765
+
+# =========================
+# Model server: satu proses memuat e5 + Chroma + GGUF
+# =========================
+# Worker web (Flask/gunicorn/waitress) cukup memakai model_client.RemoteModels
+# (RAG_MODEL_SERVER=http://127.0.0.1:8765) sehingga berapa pun jumlah worker,
+# model hanya dimuat sekali. Semua permintaan tetap lewat satu antrean inferensi.
+#
+#   POST /answer                 {"question", "filters"} -> hasil (JSON)
+#   POST /answer_stream          {"question", "filters"} -> NDJSON {"event", "data"} per baris
+#   GET  /answer_cache/<key>     entri cache jawaban (404 bila tidak ada)
+#   POST /answer_cache/<key>/invalidate
+#   GET  /ready                  status muat tiap komponen (503 selama memuat, 500 bila gagal)
+#   GET  /stats
+class ModelHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"   # keep-alive untuk pool koneksi klien
+    models = None
+
+    def log_message(self, fmt, *args):
+        pass   # log per permintaan sudah dicetak pipeline ([SCHED], [TIMING], ...)
+
+    def _json(self, status, data, headers=None):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _chunk(self, data):
+        line = (json.dumps(data, ensure_ascii=False) + "\n").encode("utf-8")
+        self.wfile.write(f"{len(line):X}\r\n".encode("ascii") + line + b"\r\n")
+        self.wfile.flush()
+
+    def do_GET(self):
+        try:
+            self._get(self.path.strip("/").split("/"))
+        except Exception as e:
+            print(f"[WARN] {self.path} gagal: {type(e).__name__}: {e}")
+            self._json(500, {"error": f"{type(e).__name__}: {e}"})
+
+    def _get(self, parts):
+        if parts == ["ready"]:
+            ready = self.models.readiness()
+            return self._json(ready_status(ready), ready)
+        if parts == ["stats"]:
+            return self._json(200, self.models.stats())
+        if len(parts) == 2 and parts[0] == "answer_cache":
+            entry = self.models.cache_entry(parts[1])
+            return self._json(200, entry) if entry is not None else self._json(404, {"error": "not found"})
+        self._json(404, {"error": "not found"})
+
+    def do_POST(self):
+        parts = self.path.strip("/").split("/")
+        try:
+            payload = self._body()
+            if len(parts) == 3 and parts[0] == "answer_cache" and parts[2] == "invalidate":
+                return self._json(200, {"invalidated": self.models.invalidate_cache(parts[1])})
+            if parts not in (["answer"], ["answer_stream"]):
+                return self._json(404, {"error": "not found"})
+
+            question, filters = payload.get("question", ""), payload.get("filters")
+            if parts == ["answer"]:
+                return self._json(200, self.models.answer(question, filters))
+            events = self.models.answer_stream(question, filters)
+        except QueueFull as e:
+            return self._json(503, {"error": str(e), "retry_after": e.retry_after},
+                              {"Retry-After": str(e.retry_after)})
+        except DeadlineExceeded as e:
+            return self._json(504, {"error": str(e)})
+        except Exception as e:
+            # komponen gagal dimuat, error llama.cpp, body bukan JSON, ...: tetap
+            # kirim respons agar koneksi keep-alive utuh dan klien dapat ModelServerError
+            print(f"[WARN] {self.path} gagal: {type(e).__name__}: {e}")
+            return self._json(500, {"error": f"{type(e).__name__}: {e}"})
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            try:
+                for event, data in events:
+                    self._chunk({"event": event, "data": data})
+            except DeadlineExceeded as e:
+                self._chunk({"event": "error", "data": {"kind": "deadline", "message": str(e)}})
+            except (BrokenPipeError, ConnectionResetError):
+                raise
+            except Exception as e:
+                print(f"[WARN] Stream gagal: {e}")
+                self._chunk({"event": "error", "data": {"kind": "error", "message": str(e)}})
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # klien web terputus: menutup generator membatalkan job di scheduler
+            self.close_connection = True
+        finally:
+            events.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Model server RAG (embedding + retrieval + LLM) untuk worker web")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    args = parser.parse_args(argv)
+
+    # model dimuat di background; /ready bisa dipantau sejak server mendengarkan
+    ModelHandler.models = LocalModels()
+    server = ThreadingHTTPServer((args.host, args.port), ModelHandler)
+    server.daemon_threads = True
+    print(f"[INFO] Model server mendengarkan di http://{args.host}:{args.port} (cek /ready)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
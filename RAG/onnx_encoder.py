@@ -0,0 +1,207 @@
+import os
+import sys
+import time
+import argparse
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+BASE_DIR    = os.path.dirname(os.path.abspath(__file__))
+EMBED_MODEL = "intfloat/multilingual-e5-large"
+ONNX_DIR    = os.path.join(BASE_DIR, "onnx_models", "multilingual-e5-large")
+ONNX_FP32   = "model.onnx"
+ONNX_INT8   = "model.int8.onnx"
+MAX_LENGTH  = 512
+
+# Backend encoder pertanyaan (RAG_QUERY_ENCODER): torch | onnx | onnx-int8
+QUERY_BACKENDS = ("torch", "onnx", "onnx-int8")
+PARITY_TOL     = 0.98   # cosine minimum vektor ONNX vs PyTorch per pertanyaan
+
+# =========================
+# Ekspor model ke ONNX
+# =========================
+def export_onnx(model_name=EMBED_MODEL, out_dir=ONNX_DIR):
+    import torch
+    from transformers import AutoTokenizer, AutoModel
+
+    os.makedirs(out_dir, exist_ok=True)
+    path = os.path.join(out_dir, ONNX_FP32)
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModel.from_pretrained(model_name).eval()
+    model.config.return_dict = False
+
+    dummy = tokenizer(["query: contoh kalimat"], return_tensors="pt")
+    print(f"[INFO] Ekspor {model_name} -> {path}")
+    with torch.no_grad():
+        # model > 2 GB: torch otomatis menyimpan bobot sebagai external data
+        torch.onnx.export(
+            model,
+            (dummy["input_ids"], dummy["attention_mask"]),
+            path,
+            input_names=["input_ids", "attention_mask"],
+            output_names=["last_hidden_state"],
+            dynamic_axes={
+                "input_ids": {0: "batch", 1: "seq"},
+                "attention_mask": {0: "batch", 1: "seq"},
+                "last_hidden_state": {0: "batch", 1: "seq"},
+            },
+            opset_version=14,
+        )
+    tokenizer.save_pretrained(out_dir)
+    return path
+
+def quantize_onnx(out_dir=ONNX_DIR):
+    # Kuantisasi dinamis int8 (bobot MatMul/Gather), aktivasi tetap float;
+    # ukuran model turun ~4x dan tidak perlu data kalibrasi.
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    src = os.path.join(out_dir, ONNX_FP32)
+    dst = os.path.join(out_dir, ONNX_INT8)
+    if not os.path.exists(src):
+        raise FileNotFoundError(f"{src} belum ada, jalankan: python onnx_encoder.py export")
+    print(f"[INFO] Kuantisasi int8 {src} -> {dst}")
+    quantize_dynamic(src, dst, weight_type=QuantType.QInt8)
+    return dst
+
+# =========================
+# Encoder onnxruntime (mean pooling seperti sentence-transformers e5)
+# =========================
+class OnnxEncoder:
+    def __init__(self, model_path=None, tokenizer_dir=ONNX_DIR, threads=None, max_length=MAX_LENGTH):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        model_path = model_path or os.path.join(ONNX_DIR, ONNX_FP32)
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            opts.intra_op_num_threads = threads
+            opts.inter_op_num_threads = 1
+        self.model_path = model_path
+        self.session = ort.InferenceSession(model_path, opts, providers=["CPUExecutionProvider"])
+        self.tokenizer = AutoTokenizer.from_pretrained(tokenizer_dir)
+        self.max_length = max_length
+
+    def encode(self, texts, normalize=True, batch_size=32):
+        out = []
+        for start in range(0, len(texts), batch_size):
+            enc = self.tokenizer(
+                list(texts[start:start + batch_size]), padding=True, truncation=True,
+                max_length=self.max_length, return_tensors="np",
+            )
+            mask = enc["attention_mask"].astype(np.int64)
+            hidden = self.session.run(None, {
+                "input_ids": enc["input_ids"].astype(np.int64),
+                "attention_mask": mask,
+            })[0]
+            m = mask[..., None].astype(np.float32)
+            emb = (hidden * m).sum(axis=1) / np.clip(m.sum(axis=1), 1e-9, None)
+            if normalize:
+                emb /= np.clip(np.linalg.norm(emb, axis=1, keepdims=True), 1e-12, None)
+            out.append(emb.astype(np.float32))
+        return np.concatenate(out) if out else np.empty((0, 0), np.float32)
+
+class OnnxEmbeddings(Embeddings):
+    def __init__(self, model_path=None, tokenizer_dir=ONNX_DIR, threads=None,
+                 normalize=True, batch_size=32, tag="onnx"):
+        self.encoder = OnnxEncoder(model_path, tokenizer_dir, threads=threads)
+        # nama berbeda agar cache embedding tidak mencampur vektor torch dan ONNX
+        self.model_name = f"{EMBED_MODEL}@{tag}"
+        self.encode_kwargs = {"normalize_embeddings": normalize}
+        self.batch_size = batch_size
+
+    def embed_documents(self, texts):
+        return self.encoder.encode(list(texts), self.encode_kwargs["normalize_embeddings"],
+                                   self.batch_size).tolist()
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+def query_encoder(backend="torch", threads=None):
+    # Encoder untuk pertanyaan online; dokumen di Chroma tetap dari PyTorch
+    if backend == "onnx":
+        return OnnxEmbeddings(threads=threads)
+    if backend == "onnx-int8":
+        return OnnxEmbeddings(os.path.join(ONNX_DIR, ONNX_INT8), threads=threads, tag="onnx-int8")
+    if backend != "torch":
+        raise ValueError(f"RAG_QUERY_ENCODER tidak dikenal: {backend} (pilih {', '.join(QUERY_BACKENDS)})")
+    import torch
+    from langchain_huggingface import HuggingFaceEmbeddings
+    return HuggingFaceEmbeddings(
+        model_name=EMBED_MODEL,
+        model_kwargs={"device": "cuda" if torch.cuda.is_available() else "cpu"},
+        encode_kwargs={"normalize_embeddings": True}
+    )
+
+# =========================
+# Uji kesetaraan vektor ONNX vs PyTorch
+# =========================
+def load_questions(path=None, db_uri=None, limit=None):
+    if path:
+        with open(path, "r", encoding="utf-8") as f:
+            questions = [line.strip() for line in f if line.strip()]
+    else:
+        from sqlalchemy import create_engine, text
+        engine = create_engine(db_uri)
+        with engine.connect() as conn:
+            questions = [r[0] for r in conn.execute(text("SELECT DISTINCT question FROM queries")) if r[0]]
+    return questions[:limit] if limit else questions
+
+def _timed_embed(encoder, questions):
+    vecs, times = [], []
+    for q in questions:
+        t0 = time.perf_counter()
+        vecs.append(encoder.embed_query(q))
+        times.append(time.perf_counter() - t0)
+    return np.asarray(vecs, dtype=np.float32), np.asarray(times)
+
+def parity_check(questions, backend="onnx-int8", tol=PARITY_TOL, threads=None):
+    ref_vecs, ref_t = _timed_embed(query_encoder("torch"), questions)
+    alt_vecs, alt_t = _timed_embed(query_encoder(backend, threads), questions)
+
+    cos = (ref_vecs * alt_vecs).sum(axis=1) / (
+        np.linalg.norm(ref_vecs, axis=1) * np.linalg.norm(alt_vecs, axis=1))
+    bad = [(q, c) for q, c in zip(questions, cos) if c < tol]
+
+    print(f"[PARITY] {backend} vs torch pada {len(questions)} pertanyaan")
+    print(f"  cosine min={cos.min():.5f} rata-rata={cos.mean():.5f} (toleransi >= {tol})")
+    print(f"  latensi median torch={np.median(ref_t) * 1000:.1f} ms | {backend}={np.median(alt_t) * 1000:.1f} ms")
+    for q, c in bad[:10]:
+        print(f"  [FAIL] cos={c:.5f} | {q}")
+    return {"n": len(questions), "min": float(cos.min()), "mean": float(cos.mean()), "failed": len(bad)}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ekspor, kuantisasi, dan uji kesetaraan encoder ONNX")
+    sub = parser.add_subparsers(dest="cmd")
+
+    p = sub.add_parser("export", help="ekspor model PyTorch ke ONNX (fp32)")
+    p.add_argument("--model", default=EMBED_MODEL)
+    p.add_argument("--out-dir", default=ONNX_DIR)
+
+    p = sub.add_parser("quantize", help="buat versi int8 dari hasil ekspor")
+    p.add_argument("--out-dir", default=ONNX_DIR)
+
+    p = sub.add_parser("parity", help="bandingkan vektor ONNX dengan PyTorch pada pertanyaan tersimpan")
+    p.add_argument("--backend", choices=QUERY_BACKENDS[1:], default="onnx-int8")
+    p.add_argument("--questions", help="file teks, satu pertanyaan per baris")
+    p.add_argument("--db-uri", help="ambil dari tabel queries, mis. mysql+pymysql://root:@localhost/ragdb")
+    p.add_argument("--limit", type=int, default=None)
+    p.add_argument("--tol", type=float, default=PARITY_TOL)
+    p.add_argument("--threads", type=int, default=None)
+
+    args = parser.parse_args(argv)
+    if args.cmd in (None, "export"):
+        export_onnx(getattr(args, "model", EMBED_MODEL), getattr(args, "out_dir", ONNX_DIR))
+    elif args.cmd == "quantize":
+        quantize_onnx(args.out_dir)
+    else:
+        if not (args.questions or args.db_uri):
+            parser.error("parity butuh --questions atau --db-uri")
+        questions = load_questions(args.questions, args.db_uri, args.limit)
+        if not questions:
+            print("[WARN] Tidak ada pertanyaan untuk diuji.")
+            return 1
+        return 1 if parity_check(questions, args.backend, args.tol, args.threads)["failed"] else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,95 @@
+import os
+import pickle
+import hashlib
+
+BASE_DIR         = os.path.dirname(os.path.abspath(__file__))
+PREFIX_STATE_DIR = os.path.join(BASE_DIR, "kv_cache")
+
+def _common_prefix(a, b):
+    n = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        n += 1
+    return n
+
+# =========================
+# State KV untuk prefix prompt yang konstan
+# =========================
+# System prompt + blok aturan selalu sama di setiap pertanyaan. Token prefix
+# itu di-prefill sekali, state llama.cpp-nya disimpan (memori + opsional disk),
+# lalu dipulihkan sebelum tiap panggilan LLM. Llama.generate sendiri mencocokkan
+# prefix token dengan isi KV, jadi yang di-prefill ulang hanya konteks + pertanyaan.
+class PrefixState:
+    def __init__(self, llm, build_messages, prefix_text, state_dir=PREFIX_STATE_DIR, save=True):
+        # build_messages(context, question) -> messages chat; prefix_text ikut kunci file state
+        self.llm = llm
+        key = hashlib.sha1("\x1f".join([
+            os.path.basename(llm.model_path), str(llm.n_ctx()), str(llm.chat_format), prefix_text,
+        ]).encode("utf-8")).hexdigest()[:16]
+        self.path = os.path.join(state_dir, f"prefix_{key}.state") if save else None
+        self.state = self._load()
+        if self.state is None:
+            self.state = self._build(build_messages)
+            self._save()
+        self.tokens = list(self.state.input_ids[:self.state.n_tokens])
+        self.restored = 0
+        self.reused = 0
+        self.saved_tokens = 0
+        self.requests = 0
+        print(f"[KV] Prefix prompt {len(self.tokens)} token siap")
+
+    def _build(self, build_messages):
+        # Format chat (mistral-instruct, BOS, dst.) ditentukan llama_cpp; prefix
+        # token diambil dari dua prompt contoh yang hanya beda konteks/pertanyaan.
+        probes = []
+        for context, question in (("a", "b?"), ("Teks lain sama sekali.", "Pertanyaan lain?")):
+            self.llm.create_chat_completion(messages=build_messages(context, question), max_tokens=1)
+            probes.append(list(self.llm.input_ids))
+        tokens = probes[0][:_common_prefix(*probes)]
+        self.llm.reset()
+        self.llm.eval(tokens)
+        return self.llm.save_state()
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return None
+        try:
+            with open(self.path, "rb") as f:
+                state = pickle.load(f)
+        except Exception as e:
+            print(f"[WARN] State prefix {self.path} tidak terbaca ({e}), dibuat ulang")
+            return None
+        print(f"[KV] State prefix dimuat dari {self.path}")
+        return state
+
+    def _save(self):
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "wb") as f:
+            pickle.dump(self.state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self.path)
+        print(f"[KV] State prefix disimpan -> {self.path}")
+
+    def prepare(self):
+        # Panggil tepat sebelum create_chat_completion. KV yang sudah diawali
+        # prefix (sisa pertanyaan sebelumnya) dipakai apa adanya; load_state
+        # hanya bila isinya berbeda, karena menyalin state tidak gratis.
+        if list(self.llm.input_ids[:len(self.tokens)]) == self.tokens:
+            self.reused += 1
+        else:
+            self.llm.load_state(self.state)
+            self.restored += 1
+
+    def saved(self):
+        # dipanggil setelah completion: token prompt yang tidak di-prefill ulang
+        n = _common_prefix(self.tokens, self.llm.input_ids)
+        self.requests += 1
+        self.saved_tokens += n
+        return n
+
+    def stats(self):
+        return {"prefix_tokens": len(self.tokens), "restored": self.restored, "reused": self.reused,
+                "saved_tokens": self.saved_tokens, "requests": self.requests}
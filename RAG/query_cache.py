@@ -0,0 +1,152 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+import diskcache
+
+BASE_DIR        = os.path.dirname(os.path.abspath(__file__))
+QUERY_CACHE_DIR = os.path.join(BASE_DIR, "query_cache")
+
+MEM_ITEMS       = 2048                  # entri per tier memori (LRU)
+DISK_SIZE_LIMIT = 256 * 1024 * 1024     # byte per tier disk
+VECTOR_TTL      = 7 * 24 * 3600         # vektor pertanyaan: hanya bergantung pada encoder
+RESULT_TTL      = 24 * 3600             # hasil retrieval: juga bergantung pada isi index
+
+# =========================
+# Cache dua tingkat: LRU di memori -> diskcache
+# =========================
+class TieredCache:
+    def __init__(self, name, cache_dir=QUERY_CACHE_DIR, max_items=MEM_ITEMS,
+                 ttl=RESULT_TTL, size_limit=DISK_SIZE_LIMIT):
+        self.name = name
+        self.max_items = max_items
+        self.ttl = ttl
+        self._mem = OrderedDict()   # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.disk = diskcache.Cache(os.path.join(cache_dir, name), size_limit=size_limit,
+                                    eviction_policy="least-recently-used")
+        self.mem_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _remember(self, key, value, expires_at):
+        self._mem[key] = (expires_at, value)
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.max_items:
+            self._mem.popitem(last=False)
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            item = self._mem.get(key)
+            if item is not None:
+                if item[0] > now:
+                    self._mem.move_to_end(key)
+                    self.mem_hits += 1
+                    return item[1]
+                del self._mem[key]
+
+        value, expires_at = self.disk.get(key, default=None, expire_time=True)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            # entri disk dinaikkan ke memori dengan sisa umur yang sama
+            self._remember(key, value, expires_at or now + self.ttl)
+        return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._remember(key, value, time.time() + self.ttl)
+        self.disk.set(key, value, expire=self.ttl)
+
+    def clear(self):
+        with self._lock:
+            self._mem.clear()
+        self.disk.clear()
+
+    def stats(self):
+        total = self.mem_hits + self.disk_hits + self.misses
+        return {
+            "mem_hits": self.mem_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.mem_hits + self.disk_hits) / total if total else 0.0,
+            "mem_size": len(self._mem),
+            "disk_size": len(self.disk),
+        }
+
+# =========================
+# Invalidation per versi manifest index
+# =========================
+class IndexVersion:
+    # Membaca index_manifest.json hanya bila mtime berubah (stat per pertanyaan)
+    def __init__(self, chroma_dir, manifest_file="index_manifest.json"):
+        self.path = os.path.join(chroma_dir, manifest_file)
+        self._mtime = None
+        self._version = "none"
+
+    def current(self):
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return "none"
+        if mtime != self._mtime:
+            with open(self.path, "r", encoding="utf-8") as f:
+                m = json.load(f)
+            self._version = f"{m.get('version', 0)}|{m.get('embed_model', '')}|{m.get('updated_at', '')}"
+            self._mtime = mtime
+        return self._version
+
+def cache_key(*parts):
+    raw = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+class QueryCache:
+    # vectors : pertanyaan asli -> (pertanyaan ternormalisasi, vektor pertanyaan)
+    # results : (pertanyaan ternormalisasi, MAX_CANDIDATES, COS_ABS, filter, mode, versi index)
+    #           -> [(doc_id, skor)] kandidat yang lolos threshold
+    # Vektor adalah fungsi deterministik dari teks ternormalisasi + encoder, jadi
+    # kunci hasil memakai teks tersebut (jalur entitas BM25 tidak perlu embed).
+    def __init__(self, chroma_dir, encoder_name, cache_dir=QUERY_CACHE_DIR):
+        self.encoder_name = encoder_name
+        self.index_version = IndexVersion(chroma_dir)
+        self.vectors = TieredCache("vectors", cache_dir, ttl=VECTOR_TTL)
+        self.results = TieredCache("results", cache_dir, ttl=RESULT_TTL)
+        self._seen_version = self.results.disk.get("__index_version__")
+
+    def _check_version(self):
+        version = self.index_version.current()
+        if version != self._seen_version:
+            if self._seen_version is not None:
+                print(f"[CACHE] Index berubah ({self._seen_version} -> {version}), cache hasil dikosongkan")
+            self.results.clear()
+            self.results.disk.set("__index_version__", version)
+            self._seen_version = version
+        return version
+
+    def get_query(self, question):
+        return self.vectors.get(cache_key("q", self.encoder_name, question))
+
+    def put_query(self, question, normalized, vector):
+        # vector boleh None (jalur entitas BM25 belum butuh embedding)
+        value = (normalized, None if vector is None else list(vector))
+        self.vectors.set(cache_key("q", self.encoder_name, question), value)
+
+    def results_key(self, normalized, **params):
+        return cache_key("r", self.encoder_name, self._check_version(), normalized, params)
+
+    def get_results(self, key):
+        return self.results.get(key)
+
+    def put_results(self, key, mode, docs_scores):
+        hits = [(d.metadata.get("doc_id"), float(s)) for d, s in docs_scores]
+        if any(doc_id is None for doc_id, _ in hits):
+            return  # koleksi lama tanpa doc_id tidak bisa dihidrasi ulang
+        self.results.set(key, {"mode": mode, "hits": hits})
+
+    def stats(self):
+        return {"vectors": self.vectors.stats(), "results": self.results.stats()}
@@ -1,9 +1,16 @@
-import os, re, time, unicodedata
-import torch
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_community.vectorstores import Chroma
-from llama_cpp import Llama
+import os, re, time, hashlib, threading, unicodedata
 from pathlib import Path
+from embedding_cache import CachedEmbeddings
+from onnx_encoder import query_encoder
+from retrieval import make_backend, RETRIEVAL_BACKEND
+from lexical import LexicalIndex, hybrid_search
+from query_cache import QueryCache
+from answer_cache import AnswerCache
+from router import Router
+from reranker import Reranker
+from context_compress import compress_context, SentenceEmbedder
+from prefix_state import PrefixState
+from dedup import PROVENANCE_FIELDS, provenance_key
 
 CUDA_BIN  = r"C:\Program Files\NVIDIA GPU Computing Toolkit\CUDA\v12.4\bin"
 LLAMA_LIB = "../.venv/Lib/site-packages/llama_cpp/lib"
@@ -16,9 +23,34 @@ CHROMA_DIR  = r"E:\Coding\Python\RAG\Mistral_Lokal\Projek\RAG\chroma_db"
 EMBED_MODEL = "intfloat/multilingual-e5-large"
 GGUF_PATH   = "../../models/ministral_8b/Ministral-8B-Instruct-2410-Q5_K_M.gguf"
 
-TOP_K       = 20
+MAX_CANDIDATES = 8  # kandidat maksimal yang lolos COS_ABS (range search)
+DENSE_K     = 8     # kandidat dense per pertanyaan pada mode hybrid
 COS_ABS     = 0.75
-FINAL_TOPK  = 3
+
+# torch | onnx | onnx-int8 (lihat onnx_encoder.py; uji dulu dengan "parity")
+QUERY_ENCODER = os.getenv("RAG_QUERY_ENCODER", "torch")
+# cache jawaban semantik (lihat answer_cache.py); 0 untuk mematikan
+ANSWER_CACHE = os.getenv("RAG_ANSWER_CACHE", "1") == "1"
+# dense | hybrid (BM25 + dense, digabung dengan RRF; lihat lexical.py)
+RETRIEVAL_MODE = os.getenv("RAG_RETRIEVAL_MODE", "dense")
+# reranker cross-encoder int8 di CPU (lihat reranker.py); 1 untuk mengaktifkan
+RERANK = os.getenv("RAG_RERANK", "0") == "1"
+# urutan konteks lebih akurat dengan reranker -> prompt cukup 2 chunk
+FINAL_TOPK = int(os.getenv("RAG_FINAL_TOPK", "2" if RERANK else "3"))
+# kompresi konteks per kalimat sebelum prompt (lihat context_compress.py); 0 untuk mematikan
+COMPRESS = os.getenv("RAG_COMPRESS", "1") == "1"
+# gabungkan chunk bersebelahan tanpa overlap + lengkapi kalimat terpotong; 0 untuk mematikan
+MERGE_ADJACENT = os.getenv("RAG_MERGE_ADJACENT", "1") == "1"
+NEIGHBOR_TOKENS = 40   # token tambahan maksimal dari chunk tetangga per pertanyaan
+# routing pertanyaan ke partisi buku (lihat router.py); 0 untuk selalu cari penuh.
+# Hanya berlaku di backend numpy: di Chroma partisi cuma filter metadata di indeks HNSW yang sama
+ROUTING = os.getenv("RAG_ROUTING", "1") == "1"
+# state KV prefix prompt (system + aturan) dipakai ulang antar pertanyaan (lihat prefix_state.py)
+PREFIX_CACHE = os.getenv("RAG_PREFIX_CACHE", "1") == "1"
+# simpan state prefix ke disk (kv_cache/) agar start berikutnya tidak prefill ulang
+PREFIX_SAVE = os.getenv("RAG_PREFIX_SAVE", "1") == "1"
+# background: model dimuat di thread saat start (start_loading); lazy: saat pertanyaan pertama
+MODEL_LOADING = os.getenv("RAG_MODEL_LOADING", "background")
 
 SHOW_SCORES = True
 
@@ -29,28 +61,208 @@ def strip_parens(text: str) -> str:
     clean = re.sub(r'\s{2,}', ' ', clean)
     return clean.strip()
 
+_ECHO_QWORD = re.compile(r'^\s*(?:apa|kapan|mengapa|siapa|bagaimana)[^?]+\?\s*', re.I)
+
+def clean_answer(raw: str, question: str) -> str:
+    # pembersihan jawaban LLM: tanpa kurung, tanpa gema pertanyaan di awal
+    answer = strip_parens(raw.strip()) or NOT_FOUND
+    answer = _ECHO_QWORD.sub('', answer)
+    answer = re.sub(rf'^\s*{re.escape(question.strip())}\s*', '', answer, flags=re.I).strip()
+    return answer or NOT_FOUND
+
+class StreamCleaner:
+    # clean_answer versi inkremental untuk token streaming: teks di dalam kurung
+    # dibuang saat datang, spasi dirapatkan, dan awal jawaban ditahan selama
+    # masih mungkin berupa gema pertanyaan. Hasil akhir tetap clean_answer().
+    def __init__(self, question: str):
+        self.question = question.strip().lower()
+        self.head = ""
+        self.started = False
+        self.depth = 0
+        self.space = False
+        self.emitted = False
+
+    def _strip(self, text):
+        out = []
+        for ch in text:
+            if ch == "(":
+                self.depth += 1
+                self.space = True
+            elif ch == ")" and self.depth:
+                self.depth -= 1
+            elif self.depth:
+                continue
+            elif ch.isspace():
+                self.space = True
+            else:
+                if self.space and (out or self.emitted):
+                    out.append(" ")
+                self.space = False
+                out.append(ch)
+        piece = "".join(out)
+        self.emitted = self.emitted or bool(piece)
+        return piece
+
+    def _maybe_echo(self):
+        h = self.head.lstrip().lower()
+        if "?" in h or len(h) > len(self.question) + 40:
+            return False
+        return bool(re.match(r'(?:apa|kapan|mengapa|siapa|bagaimana)\b', h)) \
+            or self.question.startswith(h) or h.startswith(self.question)
+
+    def feed(self, token: str) -> str:
+        if self.started:
+            return self._strip(token)
+        self.head += token
+        if self._maybe_echo():
+            return ""
+        return self.finish()
+
+    def finish(self) -> str:
+        if self.started:
+            return ""
+        self.started = True
+        head = _ECHO_QWORD.sub('', self.head.lstrip())
+        head = re.sub(rf'^\s*{re.escape(self.question)}\s*', '', head, flags=re.I)
+        return self._strip(head)
+
 def _doc_key(d):
+    # dedup berdasarkan isi: teks sama dari dua buku (atau berulang dalam satu
+    # buku) cukup muncul sekali di konteks, juga saat index dibuat --stream /
+    # --no-dedup. doc_id tetap dipakai untuk identitas dan log (_source_info).
     content = (getattr(d, "page_content", "") or "").strip()
     return hash(content)
 
-def _print_docs(title: str, docs, scores=None):
+def _source_info(d):
+    meta = getattr(d, "metadata", None) or {}
+    return {
+        "doc_id": meta.get("doc_id"),
+        "source": meta.get("source") or meta.get("book"),
+        "page": meta.get("page"),
+        "chapter": meta.get("chapter"),
+    }
+
+def build_where(filters):
+    # filters: {"kelas": 11} atau {"kelas": [10, 11], "semester": 1} -> where Chroma.
+    # kelas/semester/buku juga cocok lewat in_<field>_<nilai>: chunk perwakilan
+    # hasil dedup yang isinya juga ada di buku/kelas/semester tersebut
+    clauses = []
+    for key, val in (filters or {}).items():
+        if val is None or val == "" or val == []:
+            continue
+        vals = list(val) if isinstance(val, (list, tuple, set)) else [val]
+        clause = {key: {"$in": vals}} if isinstance(val, (list, tuple, set)) else {key: val}
+        if key in PROVENANCE_FIELDS:
+            clause = {"$or": [clause] + [{provenance_key(key, v): True} for v in vals]}
+        clauses.append(clause)
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+def _score_fields(score, mode):
+    # mode "entity": skor BM25 relatif (0..1), tidak sebanding dengan cosine/COS_ABS
+    # sehingga dicatat di kolom terpisah, bukan sebagai cos
+    if mode == "entity":
+        return {"cos": None, "bm25": float(score), "score_kind": "bm25"}
+    return {"cos": float(score), "bm25": None, "score_kind": "cosine"}
+
+def _print_docs(title: str, docs, scores=None, label="cos"):
     print(f"\n==== {title} (total {len(docs)}) ====")
     for i, d in enumerate(docs, 1):
         head = f"[{i:02d}]"
         if SHOW_SCORES and scores is not None:
-            head += f"  cos={scores[i-1]:.4f}"
+            head += f"  {label}={scores[i-1]:.4f}"
+        info = _source_info(d)
+        if info["source"]:
+            head += f"  {info['source']} hal.{info['page']} bab {info['chapter']}"
         print(head)
         print(d.page_content)
         print("-" * 80)
 
-def _build_prompt(context: str, question: str) -> list:
-    system_content = (
-        "Kamu asisten RAG sejarah Indonesia. Jawab hanya dari konteks. "
-        "Tanpa tanda kurung, tanpa emoji, tanpa meta-komentar. "
-        "Jika tidak ada di konteks, tulis persis: Tidak ditemukan dalam dokumen"
-    )
-    user_prompt = f"""
-    Kamu adalah asisten sejarah Indonesia yang menjawab pertanyaan berdasarkan konteks yang diberikan.
+# =========================
+# Perakitan konteks: gabung chunk bersebelahan
+# =========================
+_SENT_TAIL = re.compile(r'[.!?]["”)]?$')
+_SENT_STOP = re.compile(r'[.!?]["”)]?(?=\s|$)')
+
+def _overlap(a, b):
+    # jumlah karakter awal chunk b yang sudah ada di akhir chunk a (overlap
+    # splitter); -1 bila ada jeda (beda halaman/tanpa overlap)
+    ma, mb = a.metadata, b.metadata
+    if ma.get("page") == mb.get("page") and ma.get("end", -1) >= 0 and mb.get("start", -1) >= 0:
+        cut = ma["end"] - mb["start"]
+        return min(cut, len(b.page_content)) if cut >= 0 else -1
+    # chunk lama tanpa offset: cari sufiks a == prefiks b terpanjang
+    ta, tb = a.page_content, b.page_content
+    for n in range(min(len(ta), len(tb)), 9, -1):
+        if ta.endswith(tb[:n]):
+            return n
+    return -1
+
+def _join(text, a, b):
+    # text (berakhir dengan chunk a) + chunk b tanpa teks ganda
+    n = _overlap(a, b)
+    return text + b.page_content[n:] if n >= 0 else f"{text} {b.page_content}"
+
+def _is_adjacent(a, b):
+    ma, mb = a.metadata, b.metadata
+    return (ma.get("book") is not None and ma.get("book") == mb.get("book")
+            and ma.get("seq") is not None and mb.get("seq") == ma["seq"] + 1)
+
+def assemble_context(docs):
+    # Mengembalikan [(teks span, [rank chunk])] urut rank terbaik. Chunk terpilih
+    # yang berurutan (book + seq) digabung jadi satu span tanpa overlap; span
+    # yang terpotong di tengah kalimat dilengkapi dari chunk tetangga selama
+    # masih dalam NEIGHBOR_TOKENS.
+    ranked = sorted(enumerate(docs, start=1), key=lambda x: (str(x[1].metadata.get("book")),
+                                                               x[1].metadata.get("seq", 0)))
+    spans = []
+    for rank, d in ranked:
+        if spans and _is_adjacent(spans[-1][-1][1], d):
+            spans[-1].append((rank, d))
+        else:
+            spans.append([(rank, d)])
+
+    budget = NEIGHBOR_TOKENS
+    out = []
+    for span in sorted(spans, key=lambda sp: min(r for r, _ in sp)):
+        text = span[0][1].page_content
+        for (_, a), (_, b) in zip(span, span[1:]):
+            text = _join(text, a, b)
+
+        first, last = span[0][1], span[-1][1]
+        if budget > 0 and not _SENT_TAIL.search(text):
+            nxt = retriever.neighbor(last, 1)
+            if nxt is not None:
+                extra = _join("", last, nxt)
+                stop = _SENT_STOP.search(extra)
+                if stop and _count_tokens(extra[:stop.end()]) <= budget:
+                    budget -= _count_tokens(extra[:stop.end()])
+                    text += extra[:stop.end()]
+        if budget > 0 and text[:1].islower():
+            prev = retriever.neighbor(first, -1)
+            if prev is not None:
+                n = _overlap(prev, first)
+                head = prev.page_content[:len(prev.page_content) - n] if n >= 0 else prev.page_content + " "
+                stops = list(_SENT_STOP.finditer(head))
+                tail = head[stops[-1].end():].lstrip() if stops else ""
+                if tail and _count_tokens(tail) <= budget:
+                    budget -= _count_tokens(tail)
+                    text = tail + text
+        out.append((text, [r for r, _ in span]))
+    return out
+
+def _count_tokens(text: str) -> int:
+    return len(llm.tokenize(text.encode("utf-8"), add_bos=False))
+
+# Prompt = prefix konstan (system + aturan, lihat prefix_state.py) + konteks + pertanyaan.
+# Teksnya sama persis dengan prompt lama; hanya dipecah agar prefix bisa di-cache.
+SYSTEM_PROMPT = (
+    "Kamu asisten RAG sejarah Indonesia. Jawab hanya dari konteks. "
+    "Tanpa tanda kurung, tanpa emoji, tanpa meta-komentar. "
+    "Jika tidak ada di konteks, tulis persis: Tidak ditemukan dalam dokumen"
+)
+RULES_PROMPT = """Kamu adalah asisten sejarah Indonesia yang menjawab pertanyaan berdasarkan konteks yang diberikan.
 
     ### Aturan:
     1. Berikan jawaban sesuai keinginan **User**.
@@ -63,15 +275,17 @@ def _build_prompt(context: str, question: str) -> list:
        "Tidak ditemukan dalam dokumen"
 
     ### Konteks:
-    {context}
+    """
+
+def _build_prompt(context: str, question: str) -> list:
+    user_prompt = f"""{RULES_PROMPT}{context}
 
     ### Pertanyaan:
     {question}
 
-    ### Jawaban:
-    """.strip()
+    ### Jawaban:""".strip()
     return [
-        {"role": "system", "content": system_content},
+        {"role": "system", "content": SYSTEM_PROMPT},
         {"role": "user",   "content": user_prompt}
     ]
 
@@ -129,52 +343,352 @@ def normalize_query(question: str) -> str:
     print(f"[DEBUG] Original: '{question}' -> Normalized: '{normalized}'")
     return normalized
 
-print("[INFO] Loading embedding model (untuk Chroma)...")
-embedding_model = HuggingFaceEmbeddings(
-    model_name=EMBED_MODEL,
-    model_kwargs={"device": "cuda" if torch.cuda.is_available() else "cpu"},
-    encode_kwargs={"normalize_embeddings": True}
-)
+# =========================
+# Lifecycle model: dimuat lazy / di background, lalu warm-up
+# =========================
+# Import modul ini tidak memuat apa pun. Komponen dimuat berurutan oleh
+# load_models() (dari start_loading() atau pertanyaan pertama) dan status tiap
+# komponen (pending/loading/ready/off/failed + waktu muat) bisa dibaca readiness().
+# Komponen opsional (reranker, warm-up) yang gagal dicatat lalu dimatikan ("off"),
+# jadi LLM tetap dimuat dan pertanyaan tetap dijawab tanpa komponen itu.
+embedding_model = sentence_embedder = db = retriever = lexical = router = None
+query_cache = answer_cache = reranker = llm = prefix_state = None
+
+COMPONENTS = ("cache", "embedding", "retrieval", "reranker", "llm", "warmup")
+OPTIONAL_COMPONENTS = ("reranker", "warmup")
+_status = {name: {"state": "pending", "load_ms": None, "error": None} for name in COMPONENTS}
+_load_lock = threading.RLock()
+
+def _load_cache():
+    global query_cache, answer_cache
+    # cache pertanyaan -> vektor dan hasil retrieval (LRU memori + diskcache)
+    query_cache = QueryCache(CHROMA_DIR, encoder_name=QUERY_ENCODER)
+    answer_cache = AnswerCache() if ANSWER_CACHE else None
+
+def _load_embedding():
+    global embedding_model, sentence_embedder
+    print(f"[INFO] Loading embedding model (untuk Chroma, backend {QUERY_ENCODER})...")
+    embedding_model = CachedEmbeddings(query_encoder(QUERY_ENCODER))
+    # kalimat konteks (kompresi) tidak lewat cache embedding disk milik chunk korpus
+    sentence_embedder = SentenceEmbedder(embedding_model.inner.embed_documents)
+
+def _load_retrieval():
+    global db, retriever, lexical, router
+    from langchain_community.vectorstores import Chroma
+
+    print("[INFO] Loading ChromaDB...")
+    db = Chroma(persist_directory=CHROMA_DIR, embedding_function=embedding_model)
+    # chroma | numpy (RAG_RETRIEVAL_BACKEND); numpy butuh corpus.chunks + corpus_vectors.npy dari indexer.py
+    retriever = make_backend(RETRIEVAL_BACKEND, db, embedding_model, CHROMA_DIR)
+    lexical = LexicalIndex(CHROMA_DIR) if RETRIEVAL_MODE == "hybrid" else None
+    router = None
+    if ROUTING and not retriever.partitioned:
+        print(f"[INFO] Routing dilewati: backend {retriever.name} tidak mencari per partisi "
+              f"(pakai RAG_RETRIEVAL_BACKEND=numpy)")
+    elif ROUTING:
+        try:
+            router = Router(CHROMA_DIR)
+        except FileNotFoundError:
+            print("[WARN] corpus_partitions.npz belum ada, routing dimatikan (jalankan ulang indexer.py)")
+    print(f"[INFO] Backend retrieval: {retriever.name} | mode {RETRIEVAL_MODE} | routing {'on' if router else 'off'}")
+
+def _load_reranker():
+    global reranker
+    if not RERANK:
+        return "off"
+    reranker = Reranker()
+
+def _load_llm():
+    global llm, prefix_state
+    from llama_cpp import Llama
+
+    print("[INFO] Loading Mistral LLM (GGUF)...")
+    llm = Llama(
+        model_path=GGUF_PATH,
+        n_ctx=2048,
+        n_threads=os.cpu_count() or 8,
+        n_batch=256,
+        n_gpu_layers=-1,
+        f16_kv=True,
+        use_mmap=True,
+        use_mlock=False,
+        verbose=True,
+        cache=None,
+        chat_format="mistral-instruct",
+        seed=42
+    )
+    prefix_state = PrefixState(llm, _build_prompt, SYSTEM_PROMPT + RULES_PROMPT, save=PREFIX_SAVE) if PREFIX_CACHE else None
+
+def _warm_up():
+    # satu embedding, satu pencarian, satu generasi pendek: kernel/graph ONNX,
+    # mmap index dan buffer GPU sudah panas sebelum pertanyaan pertama.
+    # Langsung ke model (bukan CachedEmbeddings) agar cache tidak terisi contoh.
+    vector = embedding_model.inner.embed_query("Kapan proklamasi kemerdekaan Indonesia dibacakan?")
+    retriever.range_search(vector, COS_ABS, max_count=1)
+    if prefix_state is not None:
+        prefix_state.prepare()
+    llm.create_chat_completion(
+        messages=_build_prompt("Proklamasi kemerdekaan Indonesia dibacakan pada 17 Agustus 1945.",
+                               "Kapan proklamasi dibacakan?"),
+        max_tokens=4, temperature=0.0,
+    )
 
-print("[INFO] Loading ChromaDB...")
-db = Chroma(persist_directory=CHROMA_DIR, embedding_function=embedding_model)
-
-print("[INFO] Loading Mistral LLM (GGUF)...")
-llm = Llama(
-    model_path=GGUF_PATH,
-    n_ctx=2048,
-    n_threads=os.cpu_count() or 8,
-    n_batch=256,
-    n_gpu_layers=-1,
-    f16_kv=True,
-    use_mmap=True,
-    use_mlock=False,
-    verbose=True,
-    cache=None,
-    chat_format="mistral-instruct",
-    seed=42
-)
-print("[INFO] Semua model berhasil dimuat!\n")
+_LOADERS = {"cache": _load_cache, "embedding": _load_embedding, "retrieval": _load_retrieval,
+            "reranker": _load_reranker, "llm": _load_llm, "warmup": _warm_up}
+
+def _ensure(name):
+    with _load_lock:
+        st = _status[name]
+        if st["state"] in ("ready", "off"):
+            return
+        if st["state"] == "failed":
+            raise RuntimeError(f"komponen {name} gagal dimuat: {st['error']}")
+        st["state"] = "loading"
+        t = time.perf_counter()
+        try:
+            state = _LOADERS[name]() or "ready"
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            if name in OPTIONAL_COMPONENTS:
+                st.update(state="off", error=error, load_ms=(time.perf_counter() - t) * 1000)
+                print(f"[WARN] Komponen opsional {name} gagal dimuat, dimatikan: {error}")
+                return
+            st.update(state="failed", error=error)
+            print(f"[WARN] Komponen {name} gagal dimuat: {error}")
+            raise
+        st.update(state=state, load_ms=(time.perf_counter() - t) * 1000)
+        print(f"[INFO] Komponen {name}: {state} ({st['load_ms']:.0f} ms)")
+
+def load_models():
+    # idempoten; dipanggil otomatis oleh fungsi jawaban
+    for name in COMPONENTS:
+        _ensure(name)
+
+def get_answer_cache():
+    # untuk halaman admin: cukup komponen cache, tanpa menunggu LLM
+    _ensure("cache")
+    return answer_cache
+
+def start_loading():
+    # muat semua komponen di thread background (mis. saat Flask/model server start)
+    def run():
+        t = time.perf_counter()
+        try:
+            load_models()
+            print(f"[INFO] Semua model berhasil dimuat + warm-up ({(time.perf_counter() - t):.1f} s)\n")
+        except Exception:
+            pass   # status "failed" sudah tercatat; terlihat di readiness()
+    thread = threading.Thread(target=run, name="model-loader", daemon=True)
+    thread.start()
+    return thread
+
+def readiness():
+    # failed = komponen wajib yang gagal; tidak akan siap tanpa restart
+    components = {name: dict(st) for name, st in _status.items()}
+    ready = all(st["state"] in ("ready", "off") for st in components.values())
+    failed = {n: st["error"] for n, st in components.items() if st["state"] == "failed"}
+    return {"ready": ready, "failed": failed,
+            "loading": MODEL_LOADING, "components": components}
+
+def answer_context_version():
+    # jawaban tersimpan hanya sah untuk index + pembentukan prompt yang sama
+    prompt = hashlib.sha1((SYSTEM_PROMPT + RULES_PROMPT).encode("utf-8")).hexdigest()[:8]
+    return (f"{query_cache.index_version.current()}|compress={int(COMPRESS)}|merge={int(MERGE_ADJACENT)}"
+            f"|topk={FINAL_TOPK}|prompt={prompt}|{os.path.basename(GGUF_PATH)}")
+
+def search_candidates(normalized_question, where, embed, partitions=None):
+    # Mengembalikan ([(Document, skor)], mode) dari partisi terpilih (None = semua buku)
+    if lexical is not None:
+        return hybrid_search(normalized_question, retriever, lexical,
+                             k=MAX_CANDIDATES, dense_k=DENSE_K, filter=where, embed=embed,
+                             threshold=COS_ABS, partitions=partitions)
+    # hanya chunk dengan relevance >= COS_ABS yang diambil dan dihidrasi
+    docs_scores = retriever.range_search(embed(normalized_question), COS_ABS, max_count=MAX_CANDIDATES,
+                                         filter=where, partitions=partitions)
+    return docs_scores, "dense"
+
+def results_key(normalized_question, where):
+    return query_cache.results_key(
+        normalized_question, max_candidates=MAX_CANDIDATES, cos_abs=COS_ABS, where=where,
+        mode=RETRIEVAL_MODE, dense_k=DENSE_K, backend=retriever.name, routing=router is not None,
+    )
 
-def get_chatbot_response_with_metrics(question: str):
+def cached_results(key):
+    # ([(Document, skor)], mode) dari cache hasil, atau None bila tidak ada/tidak lengkap
+    cached = query_cache.get_results(key)
+    if cached is None:
+        return None
+    docs = retriever.documents([doc_id for doc_id, _ in cached["hits"]])
+    docs_scores = [(docs[i], s) for i, s in cached["hits"] if i in docs]
+    if len(docs_scores) != len(cached["hits"]):
+        return None
+    return docs_scores, cached["mode"]
+
+def route_question(normalized_question, where, embed):
+    if router is None or where is not None:
+        # filter kelas/semester dari pengguna sudah membatasi buku
+        return None, "off"
+    return router.route(normalized_question, embed)
+
+def retrieve(question: str, where=None):
+    # Mengembalikan (pertanyaan ternormalisasi, [(Document, skor)], mode, sumber, vektor atau None)
+    cached_q = query_cache.get_query(question)
+    normalized_question, vector = cached_q if cached_q else (normalize_query(question), None)
+
+    def embed(text):
+        nonlocal vector
+        if vector is None:
+            vector = embedding_model.embed_query(text)
+        return vector
+
+    key = results_key(normalized_question, where)
+    cached = cached_results(key)
+    if cached is not None:
+        if not cached_q:
+            query_cache.put_query(question, normalized_question, vector)
+        return normalized_question, cached[0], cached[1], "cache", vector
+
+    partitions, route = route_question(normalized_question, where, embed)
+    docs_scores, mode = search_candidates(normalized_question, where, embed, partitions)
+    if partitions and not docs_scores:
+        # routing keliru/terlalu sempit -> ulangi di seluruh korpus
+        docs_scores, mode = search_candidates(normalized_question, where, embed, None)
+        route += " -> fallback penuh"
+    print(f"[ROUTE] {', '.join(partitions) if partitions else 'semua buku'} ({route})")
+
+    query_cache.put_results(key, mode, docs_scores)
+    if not cached_q or (cached_q[1] is None and vector is not None):
+        query_cache.put_query(question, normalized_question, vector)
+    return normalized_question, docs_scores, mode, "search", vector
+
+def get_chatbot_response_with_metrics(question: str, filters=None):
+    load_models()
     t0 = time.perf_counter()
     print(f"\n[INPUT] Pertanyaan: {question}")
 
-    normalized_question = normalize_query(question)
-
-    print(f"[RETRIEVAL] query_text (normalized): '{normalized_question}'")
-    docs_scores = db.similarity_search_with_relevance_scores(normalized_question, k=TOP_K)
+    where = build_where(filters)
+    t_ret = time.perf_counter()
+    normalized_question, docs_scores, mode, origin, vector = retrieve(question, where)
+    print(f"[RETRIEVAL] query_text (normalized): '{normalized_question}' | filter={where}")
+    print(f"[RETRIEVAL] {retriever.name}/{mode} ({origin}): {len(docs_scores)} dokumen dalam "
+          f"{(time.perf_counter() - t_ret) * 1000:.2f} ms")
+    return answer_with_context(question, normalized_question, docs_scores, mode, vector, t0)
+
+def get_chatbot_responses_batch(questions, filters=None):
+    # Banyak pertanyaan sekaligus (mis. kunci jawaban guru): normalisasi + embed
+    # dalam satu forward pass, skor semua pertanyaan dalam satu perkalian matriks,
+    # lalu generasi LLM berurutan. Hasil per pertanyaan sama dengan
+    # get_chatbot_response_with_metrics.
+    load_models()
+    t0 = time.perf_counter()
+    questions = list(questions)
+    where = build_where(filters)
+    print(f"\n[BATCH] {len(questions)} pertanyaan | filter={where}")
+
+    cached_qs = [query_cache.get_query(q) for q in questions]
+    normalized = [c[0] if c else normalize_query(q) for q, c in zip(questions, cached_qs)]
+    vectors = [c[1] if c else None for c in cached_qs]
+    need = [i for i, v in enumerate(vectors) if v is None]
+    if need:
+        for i, v in zip(need, embedding_model.embed_queries([normalized[i] for i in need])):
+            vectors[i] = v
+    for q, n, v, c in zip(questions, normalized, vectors, cached_qs):
+        if not c or c[1] is None:
+            query_cache.put_query(q, n, v)
+    t_embed = time.perf_counter()
+
+    retrieved = [None] * len(questions)
+    keys = [results_key(n, where) for n in normalized]
+    pending = []
+    for i, key in enumerate(keys):
+        retrieved[i] = cached_results(key)
+        if retrieved[i] is None:
+            pending.append(i)
+
+    routes = {i: route_question(normalized[i], where, lambda _t, v=vectors[i]: v)[0] for i in pending}
+    if lexical is None and pending:
+        batch = retriever.range_search_batch([vectors[i] for i in pending], COS_ABS, max_count=MAX_CANDIDATES,
+                                             filter=where, partitions=[routes[i] for i in pending])
+        for i, docs_scores in zip(pending, batch):
+            retrieved[i] = (docs_scores, "dense")
+    else:
+        for i in pending:
+            retrieved[i] = search_candidates(normalized[i], where, lambda _t, v=vectors[i]: v, routes[i])
+    for i in pending:
+        if routes[i] and not retrieved[i][0]:
+            retrieved[i] = search_candidates(normalized[i], where, lambda _t, v=vectors[i]: v, None)
+        query_cache.put_results(keys[i], retrieved[i][1], retrieved[i][0])
+    t_ret = time.perf_counter()
+    print(f"[BATCH] embed {len(need)} pertanyaan: {(t_embed - t0) * 1000:.1f} ms | retrieval "
+          f"{len(pending)} (cache {len(questions) - len(pending)}): {(t_ret - t_embed) * 1000:.1f} ms")
+
+    results = []
+    for q, n, v, (docs_scores, mode) in zip(questions, normalized, vectors, retrieved):
+        print(f"\n[INPUT] Pertanyaan: {q}")
+        results.append(answer_with_context(q, n, docs_scores, mode, v, time.perf_counter()))
+    print(f"[BATCH] {len(questions)} pertanyaan selesai dalam {time.perf_counter() - t0:.1f} s")
+    return results
+
+def answer_with_context(question, normalized_question, docs_scores, mode, vector, t0):
+    # Threshold -> dedup -> konteks akhir -> cache jawaban / LLM -> dict hasil
+    steps = _answer_steps(question, normalized_question, docs_scores, mode, vector, t0)
+    while True:
+        try:
+            next(steps)
+        except StopIteration as done:
+            return done.value
+
+def stream_chatbot_response(question: str, filters=None):
+    # Generator event untuk endpoint streaming: ("token", potongan jawaban) selama
+    # LLM berjalan, lalu ("done", hasil) dengan bentuk yang sama seperti
+    # get_chatbot_response_with_metrics + ttft_ms (waktu sampai potongan pertama).
+    load_models()
+    t0 = time.perf_counter()
+    print(f"\n[INPUT] Pertanyaan (stream): {question}")
+    where = build_where(filters)
+    normalized_question, docs_scores, mode, origin, vector = retrieve(question, where)
+    print(f"[RETRIEVAL] {retriever.name}/{mode} ({origin}): {len(docs_scores)} dokumen")
+
+    first = None
+    steps = _answer_steps(question, normalized_question, docs_scores, mode, vector, t0, stream=True)
+    try:
+        while True:
+            try:
+                piece = next(steps)
+            except StopIteration as done:
+                result = done.value
+                break
+            if first is None:
+                first = time.perf_counter()
+            yield "token", piece
+    finally:
+        steps.close()   # dibatalkan di tengah jalan -> generasi llama.cpp ikut berhenti
+    if first is None:
+        # jawaban dari cache / tidak ditemukan: dikirim utuh sekali
+        first = time.perf_counter()
+        yield "token", result["answer"]
+    result["ttft_ms"] = (first - t0) * 1000
+    print(f"[TIMING] TTFT {result['ttft_ms']:.0f} ms")
+    yield "done", result
+
+def _answer_steps(question, normalized_question, docs_scores, mode, vector, t0, stream=False):
+    # generator: yield potongan jawaban hanya bila stream=True; nilai return = dict hasil
     if not docs_scores:
-        print("[INFO] 0 dokumen dari similarity_search_with_relevance_scores.")
+        print(f"[INFO] 0 dokumen dari backend {retriever.name}.")
         return {"answer": NOT_FOUND, "chosen": [], "candidates": []}
 
-    kept = [(d, float(s)) for (d, s) in docs_scores if float(s) >= COS_ABS]
-    print(f"[INFO] Chroma relevance: thr={COS_ABS:.2f} | kept={len(kept)}/{len(docs_scores)}")
+    if mode == "entity":
+        # semua hit sudah memuat seluruh entitas pertanyaan; skor = BM25 relatif
+        kept = [(d, float(s)) for (d, s) in docs_scores]
+    else:
+        kept = [(d, float(s)) for (d, s) in docs_scores if float(s) >= COS_ABS]
+    print(f"[INFO] Relevance ({retriever.name}/{mode}): thr={COS_ABS:.2f} | kept={len(kept)}/{len(docs_scores)}")
     if not kept:
         print("[INFO] 0 dokumen >= threshold. Stop.")
         return {"answer": NOT_FOUND, "chosen": [], "candidates": []}
 
-    kept.sort(key=lambda x: x[1], reverse=True)
+    if mode == "dense":
+        kept.sort(key=lambda x: x[1], reverse=True)
 
     seen = set()
     unique_kept = []
@@ -186,24 +700,50 @@ def get_chatbot_response_with_metrics(question: str):
         unique_kept.append((d, s))
     kept = unique_kept
 
+    order = "cosine" if mode == "dense" else "RRF/BM25"
+    if reranker is not None and mode != "entity":
+        # hit entitas sudah memuat semua istilah pertanyaan; rerank tidak perlu
+        kept, applied, info = reranker.rerank(normalized_question, kept, FINAL_TOPK)
+        print(f"[RERANK] {info}")
+        if applied:
+            order = "reranker"
+
     kept_docs   = [d for d, _ in kept]
     kept_scores = [s for _, s in kept]
 
-    _print_docs("KEPT (>= threshold, urut cosine)", kept_docs, scores=kept_scores)
+    label = "bm25" if mode == "entity" else "cos"
+    _print_docs(f"KEPT (>= threshold, urut {order})", kept_docs, scores=kept_scores, label=label)
 
     final_docs   = kept_docs[:min(FINAL_TOPK, len(kept_docs))]
     final_scores = kept_scores[:min(FINAL_TOPK, len(kept_scores))]
-    _print_docs("KONTEKS AKHIR (TOP 3 berdasar cosine)", final_docs, scores=final_scores)
-
-    ctx_blocks = []
+    _print_docs(f"KONTEKS AKHIR (TOP {FINAL_TOPK})", final_docs, scores=final_scores, label=label)
+
+    if MERGE_ADJACENT:
+        spans = assemble_context(final_docs)
+        raw_tokens = sum(_count_tokens(d.page_content) for d in final_docs)
+        print(f"[CONTEXT] {len(final_docs)} chunk -> {len(spans)} span | token {raw_tokens} -> "
+              f"{sum(_count_tokens(t) for t, _ in spans)}")
+    else:
+        spans = [(d.page_content, [rank]) for rank, d in enumerate(final_docs, start=1)]
+    ctx_texts = [t for t, _ in spans]
+    compress_stats = None
+    if COMPRESS and ctx_texts:
+        if vector is None:
+            vector = embedding_model.embed_query(normalized_question)
+            query_cache.put_query(question, normalized_question, vector)
+        ctx_texts, compress_stats = compress_context(vector, ctx_texts, sentence_embedder.embed_documents,
+                                                     count_tokens=_count_tokens)
+        print(f"[COMPRESS] kalimat {compress_stats['kept']}/{compress_stats['sentences']} | token konteks "
+              f"{compress_stats['tokens_before']} -> {compress_stats['tokens_after']} "
+              f"(hemat {compress_stats['tokens_saved']})")
+
+    ctx_blocks = [f"[{','.join(map(str, sorted(ranks)))}]\n{text}" for text, (_, ranks) in zip(ctx_texts, spans) if text]
     chosen_rows = []
     for rank, (d, s) in enumerate(zip(final_docs, final_scores), start=1):
-        ctx_blocks.append(f"[{rank}]\n{d.page_content}")
         chosen_rows.append({
             "rank": rank,
-            "source": None,
-            "page": None,
-            "cos": float(s),
+            **_source_info(d),
+            **_score_fields(s, mode),
             "preview": d.page_content
         })
     context_str = "\n\n---\n\n".join(ctx_blocks) if ctx_blocks else ""
@@ -211,16 +751,50 @@ def get_chatbot_response_with_metrics(question: str):
     if not context_str:
         return {"answer": NOT_FOUND, "chosen": [], "candidates": []}
 
-    messages = _build_prompt(context_str, normalized_question)
-    response = llm.create_chat_completion(
-        messages=messages,
-        max_tokens=160, temperature=0.0, top_k=40, top_p=0.9, repeat_penalty=1.2,
-    )
-    answer = strip_parens(response["choices"][0]["message"]["content"].strip()) or NOT_FOUND
-    answer = re.sub(r'^\s*(?:apa|kapan|mengapa|siapa|bagaimana)[^?]+\?\s*', '', answer, flags=re.I)
-    answer = re.sub(rf'^\s*{re.escape(question.strip())}\s*', '', answer, flags=re.I).strip()
-    if not answer:
-        answer = NOT_FOUND
+    # Cache jawaban: pertanyaan mirip + konteks akhir identik -> jawaban lama
+    context_ids = [_source_info(d)["doc_id"] for d in final_docs]
+    cache_entry = None
+    if answer_cache is not None and all(context_ids):
+        if vector is None:
+            vector = embedding_model.embed_query(normalized_question)
+            query_cache.put_query(question, normalized_question, vector)
+        cache_entry = answer_cache.lookup(vector, normalized_question, context_ids, answer_context_version())
+
+    prefill_saved = 0
+    if cache_entry is not None:
+        answer = cache_entry["answer"]
+        answer_key = cache_entry["key"]
+        print(f"[CACHE] answer hit key={answer_key} sim={cache_entry['similarity']:.4f} "
+              f"| '{cache_entry['question']}'")
+    else:
+        messages = _build_prompt(context_str, normalized_question)
+        params = dict(max_tokens=160, temperature=0.0, top_k=40, top_p=0.9, repeat_penalty=1.2)
+        if prefix_state is not None:
+            prefix_state.prepare()
+        if stream:
+            cleaner = StreamCleaner(question)
+            raw = []
+            for chunk in llm.create_chat_completion(messages=messages, stream=True, **params):
+                token = chunk["choices"][0]["delta"].get("content") or ""
+                raw.append(token)
+                piece = cleaner.feed(token)
+                if piece:
+                    yield piece
+            piece = cleaner.finish()
+            if piece:
+                yield piece
+            raw_answer = "".join(raw)
+        else:
+            response = llm.create_chat_completion(messages=messages, **params)
+            raw_answer = response["choices"][0]["message"]["content"]
+        answer = clean_answer(raw_answer, question)
+        if prefix_state is not None:
+            prefill_saved = prefix_state.saved()
+            print(f"[KV] prefill hemat {prefill_saved} token (prefix prompt)")
+        answer_key = None
+        if answer_cache is not None and vector is not None and all(context_ids):
+            answer_key = answer_cache.add(vector, normalized_question, context_ids, answer,
+                                          answer_context_version())
 
     final_keys = { _doc_key(d): i+1 for i, d in enumerate(final_docs) }
 
@@ -230,24 +804,47 @@ def get_chatbot_response_with_metrics(question: str):
         top_rank = final_keys.get(k)
         candidates.append({
             "rank": pos,
-            "source": None,
-            "page": None,
-            "cos": float(s),
+            **_source_info(d),
+            **_score_fields(s, mode),
             "preview": d.page_content,
             "chosen": top_rank is not None,
             "top_rank": top_rank
         })
 
     print("[OUTPUT] Jawaban:", answer)
+    st = embedding_model.stats()
+    print(f"[CACHE] embedding hit={st['hits']} miss={st['misses']} (hit rate {st['hit_rate']:.1%})")
+    for tier, st in query_cache.stats().items():
+        print(f"[CACHE] {tier}: mem={st['mem_hits']} disk={st['disk_hits']} miss={st['misses']} "
+              f"(hit rate {st['hit_rate']:.1%})")
+    if router is not None:
+        st = router.stats()
+        print(f"[ROUTE] routed={st['routed']} penuh={st['full']} ({st['routed_rate']:.1%} pertanyaan dirouting)")
+    if reranker is not None:
+        st = reranker.stats()
+        print(f"[RERANK] rerank={st['reranked']} dilewati={st['skipped']} lewat budget={st['over_budget']} "
+              f"| cache skor hit rate {st['cache']['hit_rate']:.1%}")
+    if prefix_state is not None:
+        st = prefix_state.stats()
+        print(f"[KV] prefix {st['prefix_tokens']} token | dipakai ulang={st['reused']} dipulihkan={st['restored']} "
+              f"| total prefill hemat {st['saved_tokens']} token / {st['requests']} panggilan")
+    if answer_cache is not None:
+        st = answer_cache.stats()
+        print(f"[CACHE] answer hit={st['hits']} miss={st['misses']} entri={st['size']} (hit rate {st['hit_rate']:.1%})")
     print(f"[RUNTIME] Total: {(time.perf_counter()-t0)*1000:.2f} ms")
 
     return {
         "answer": answer,
         "chosen": chosen_rows,
-        "candidates": candidates
+        "candidates": candidates,
+        "cache_hit": cache_entry is not None,
+        "answer_cache_key": answer_key,
+        "tokens_saved": compress_stats["tokens_saved"] if compress_stats else 0,
+        "prefill_saved": prefill_saved,
     }
 
 if __name__ == "__main__":
+    load_models()
     while True:
         q = input("\nMasukkan pertanyaan (atau ketik 'exit'): ")
         if q.lower() == "exit":
@@ -258,4 +855,5 @@ if __name__ == "__main__":
         print("=> Jawaban:", res["answer"])
         print("=> Chosen:")
         for r in res["chosen"]:
-            print(f"   - rank={r['rank']} cos={r['cos']:.4f}")
+            score = r["cos"] if r["score_kind"] == "cosine" else r["bm25"]
+            print(f"   - rank={r['rank']} {r['score_kind']}={score:.4f}")
@@ -0,0 +1,155 @@
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+from query_cache import TieredCache, cache_key, QUERY_CACHE_DIR
+
+BASE_DIR     = os.path.dirname(os.path.abspath(__file__))
+RERANK_MODEL = "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1"   # multilingual, 118M parameter
+RERANK_DIR   = os.path.join(BASE_DIR, "onnx_models", "mmarco-mMiniLMv2-L12")
+RERANK_FP32  = "model.onnx"
+RERANK_INT8  = "model.int8.onnx"
+
+RERANK_BUDGET_MS  = 150     # batas waktu rerank per pertanyaan
+RERANK_MARGIN     = 0.05    # selisih relevance kandidat ke-N dan ke-(N+1) yang sudah meyakinkan
+RERANK_BATCH      = 4       # pasangan per forward pass; budget dicek di antara batch
+RERANK_MAX_LENGTH = 256
+RERANK_TTL        = 30 * 24 * 3600  # doc_id berbasis isi: skor tidak basi saat index berubah
+
+# =========================
+# Ekspor + kuantisasi (sekali, seperti onnx_encoder.py)
+# =========================
+def export_reranker(model_name=RERANK_MODEL, out_dir=RERANK_DIR):
+    import torch
+    from transformers import AutoTokenizer, AutoModelForSequenceClassification
+
+    os.makedirs(out_dir, exist_ok=True)
+    path = os.path.join(out_dir, RERANK_FP32)
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModelForSequenceClassification.from_pretrained(model_name).eval()
+    model.config.return_dict = False
+
+    dummy = tokenizer(["contoh pertanyaan"], ["contoh dokumen"], return_tensors="pt")
+    print(f"[INFO] Ekspor {model_name} -> {path}")
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            (dummy["input_ids"], dummy["attention_mask"]),
+            path,
+            input_names=["input_ids", "attention_mask"],
+            output_names=["logits"],
+            dynamic_axes={
+                "input_ids": {0: "batch", 1: "seq"},
+                "attention_mask": {0: "batch", 1: "seq"},
+                "logits": {0: "batch"},
+            },
+            opset_version=14,
+        )
+    tokenizer.save_pretrained(out_dir)
+    return path
+
+def quantize_reranker(out_dir=RERANK_DIR):
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    src = os.path.join(out_dir, RERANK_FP32)
+    dst = os.path.join(out_dir, RERANK_INT8)
+    if not os.path.exists(src):
+        raise FileNotFoundError(f"{src} belum ada, jalankan: python reranker.py export")
+    print(f"[INFO] Kuantisasi int8 {src} -> {dst}")
+    quantize_dynamic(src, dst, weight_type=QuantType.QInt8)
+    return dst
+
+# =========================
+# Reranker cross-encoder int8 (CPU) dengan budget latensi
+# =========================
+class Reranker:
+    def __init__(self, model_path=None, tokenizer_dir=RERANK_DIR, threads=None,
+                 budget_ms=RERANK_BUDGET_MS, margin=RERANK_MARGIN, cache_dir=QUERY_CACHE_DIR):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        model_path = model_path or os.path.join(RERANK_DIR, RERANK_INT8)
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            opts.intra_op_num_threads = threads
+            opts.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(model_path, opts, providers=["CPUExecutionProvider"])
+        self.tokenizer = AutoTokenizer.from_pretrained(tokenizer_dir)
+        self.tag = os.path.basename(model_path)
+        self.budget_ms = budget_ms
+        self.margin = margin
+        # (pertanyaan, doc_id) -> skor; doc_id adalah hash isi chunk
+        self.cache = TieredCache("rerank", cache_dir, ttl=RERANK_TTL)
+        self.reranked = 0
+        self.skipped = 0
+        self.over_budget = 0
+
+    def score(self, query, texts):
+        enc = self.tokenizer(
+            [query] * len(texts), list(texts), padding=True, truncation="only_second",
+            max_length=RERANK_MAX_LENGTH, return_tensors="np",
+        )
+        logits = self.session.run(None, {
+            "input_ids": enc["input_ids"].astype(np.int64),
+            "attention_mask": enc["attention_mask"].astype(np.int64),
+        })[0]
+        return logits[:, 0].astype(np.float32)
+
+    def rerank(self, query, docs_scores, top_n):
+        # Mengembalikan ([(Document, skor awal)] urutan baru, diurutkan ulang?, keterangan).
+        # Kandidat diskor urut dari atas; bila budget habis, yang belum diskor
+        # tetap di belakang dengan urutan lama.
+        if len(docs_scores) <= top_n:
+            self.skipped += 1
+            return docs_scores, False, f"dilewati (kandidat <= {top_n})"
+        ranked = sorted((s for _, s in docs_scores), reverse=True)
+        gap = ranked[top_n - 1] - ranked[top_n]
+        if gap >= self.margin:
+            self.skipped += 1
+            return docs_scores, False, f"dilewati (margin {gap:.3f})"
+
+        t0 = time.perf_counter()
+        keys = [cache_key("rr", self.tag, query, d.metadata.get("doc_id") or d.page_content)
+                for d, _ in docs_scores]
+        scores = [self.cache.get(k) for k in keys]
+        cached = sum(s is not None for s in scores)
+        todo = [i for i, s in enumerate(scores) if s is None]
+        for start in range(0, len(todo), RERANK_BATCH):
+            if (time.perf_counter() - t0) * 1000 > self.budget_ms:
+                self.over_budget += 1
+                break
+            idx = todo[start:start + RERANK_BATCH]
+            for i, s in zip(idx, self.score(query, [docs_scores[i][0].page_content for i in idx])):
+                scores[i] = float(s)
+                self.cache.set(keys[i], float(s))
+
+        # skor cross-encoder hanya dibandingkan dengan sesamanya: kandidat yang
+        # sudah punya skor diurutkan ulang, sisanya tetap di belakang
+        done = [i for i, s in enumerate(scores) if s is not None]
+        rest = [i for i, s in enumerate(scores) if s is None]
+        order = sorted(done, key=lambda i: scores[i], reverse=True) + rest
+        self.reranked += bool(done)
+        ms = (time.perf_counter() - t0) * 1000
+        return [docs_scores[i] for i in order], bool(done), (f"{len(done)}/{len(docs_scores)} diskor "
+                                                             f"(cache {cached}) {ms:.1f} ms")
+
+    def stats(self):
+        return {"reranked": self.reranked, "skipped": self.skipped, "over_budget": self.over_budget,
+                "cache": self.cache.stats()}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ekspor/kuantisasi reranker cross-encoder ke ONNX")
+    parser.add_argument("command", nargs="?", default="export", choices=["export", "quantize"])
+    parser.add_argument("--model", default=RERANK_MODEL)
+    args = parser.parse_args(argv)
+    if args.command == "export":
+        export_reranker(args.model)
+    else:
+        quantize_reranker()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
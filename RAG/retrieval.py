@@ -0,0 +1,462 @@
+import os
+import sys
+import time
+import argparse
+import numpy as np
+from langchain_core.documents import Document
+
+from chunk_store import ChunkStore, CORPUS_FILE
+from dedup import provenance_key
+
+VECTORS_FILE = "corpus_vectors.npy"
+EXPORT_BATCH = 2048
+
+# chroma | numpy (RAG_RETRIEVAL_BACKEND); dtype vektor numpy: float32 | float16
+RETRIEVAL_BACKEND = os.getenv("RAG_RETRIEVAL_BACKEND", "chroma")
+VECTOR_DTYPE      = os.getenv("RAG_VECTOR_DTYPE", "float32")
+
+# =========================
+# Interface backend
+# =========================
+# search() mengembalikan [(Document, relevance)] seperti
+# Chroma.similarity_search_with_relevance_scores, sehingga threshold COS_ABS
+# berlaku sama untuk semua backend.
+class RetrievalBackend:
+    name = "base"
+    # True bila pencarian per partisi benar-benar lebih murah dari pencarian
+    # penuh (hanya rentang baris buku yang dihitung); router.py hanya aktif di sini
+    partitioned = False
+
+    def __init__(self, embedding):
+        self.embedding = embedding
+
+    def search(self, query, k=20, filter=None):
+        return self.search_by_vector(self.embedding.embed_query(query), k=k, filter=filter)
+
+    def search_by_vector(self, vector, k=20, filter=None, partitions=None):
+        raise NotImplementedError
+
+    def range_search(self, vector, threshold, max_count=10, filter=None, partitions=None):
+        # [(Document, relevance)] dengan relevance >= threshold, maksimal max_count,
+        # urut menurun; hanya chunk yang lolos yang teksnya diambil.
+        # partitions: nama buku yang dicari (hasil router.py); None = seluruh korpus
+        raise NotImplementedError
+
+    def range_search_batch(self, vectors, threshold, max_count=10, filter=None, partitions=None):
+        # range_search untuk banyak pertanyaan; partitions sejajar vectors (None per
+        # pertanyaan = seluruh korpus). Default: satu per satu
+        partitions = partitions or [None] * len(vectors)
+        return [self.range_search(v, threshold, max_count, filter, p) for v, p in zip(vectors, partitions)]
+
+    def fetch(self, doc_ids, vector, threshold=None):
+        # [(Document, relevance)] untuk doc_id tertentu (kandidat dari jalur lain);
+        # bila threshold diberikan, hanya yang lolos yang dihidrasi
+        raise NotImplementedError
+
+    def documents(self, doc_ids):
+        # {doc_id: Document} tanpa menghitung skor (hidrasi hasil dari cache)
+        raise NotImplementedError
+
+    def neighbor(self, doc, step=1):
+        # chunk sebelum/sesudah doc di buku yang sama (seq + step), atau None
+        # bila tidak ada (awal/akhir buku, atau digabung dedup ke buku lain)
+        raise NotImplementedError
+
+class ChromaBackend(RetrievalBackend):
+    # partitions di sini hanya filter metadata book $in pada satu koleksi HNSW:
+    # biaya tetap sebanding seluruh korpus, jadi routing tidak dipakai (partitioned = False)
+    name = "chroma"
+
+    def __init__(self, db, embedding=None):
+        super().__init__(embedding or db.embeddings)
+        self.db = db
+
+    def search(self, query, k=20, filter=None):
+        return self.db.similarity_search_with_relevance_scores(query, k=k, filter=filter)
+
+    def search_by_vector(self, vector, k=20, filter=None, partitions=None):
+        # skor dari jarak L2 Chroma, dikonversi sama seperti jalur search()
+        docs = self.db.similarity_search_by_vector_with_relevance_scores(
+            vector, k=k, filter=partition_where(filter, partitions))
+        return [(d, self.db._select_relevance_score_fn()(dist)) for d, dist in docs]
+
+    def range_search(self, vector, threshold, max_count=10, filter=None, partitions=None):
+        # query HNSW hanya meminta jarak; teks/metadata diambil untuk yang lolos saja.
+        # Satu koleksi untuk semua buku: partisi hanya menjadi filter metadata
+        res = self.db._collection.query(
+            query_embeddings=[list(map(float, vector))], n_results=max_count,
+            where=partition_where(filter, partitions), include=["distances"],
+        )
+        score_fn = self.db._select_relevance_score_fn()
+        keep = []
+        for doc_id, dist in zip(res["ids"][0], res["distances"][0]):
+            rel = score_fn(dist)
+            if rel < threshold:
+                break   # hasil Chroma sudah urut jarak
+            keep.append((doc_id, rel))
+        docs = self.documents([i for i, _ in keep])
+        return [(docs[i], float(r)) for i, r in keep if i in docs]
+
+    def range_search_batch(self, vectors, threshold, max_count=10, filter=None, partitions=None):
+        # satu query Chroma per kelompok partisi yang sama, hidrasi sekali untuk semua
+        partitions = partitions or [None] * len(vectors)
+        groups = {}
+        for i, p in enumerate(partitions):
+            groups.setdefault(tuple(p) if p else None, []).append(i)
+        score_fn = self.db._select_relevance_score_fn()
+        keep = [[] for _ in vectors]
+        for parts, idx in groups.items():
+            res = self.db._collection.query(
+                query_embeddings=[list(map(float, vectors[i])) for i in idx], n_results=max_count,
+                where=partition_where(filter, parts), include=["distances"],
+            )
+            for i, ids, dists in zip(idx, res["ids"], res["distances"]):
+                for doc_id, dist in zip(ids, dists):
+                    rel = score_fn(dist)
+                    if rel < threshold:
+                        break
+                    keep[i].append((doc_id, rel))
+        docs = self.documents(list(dict.fromkeys(doc_id for hits in keep for doc_id, _ in hits)))
+        return [[(docs[d], float(r)) for d, r in hits if d in docs] for hits in keep]
+
+    def fetch(self, doc_ids, vector, threshold=None):
+        if not doc_ids:
+            return []
+        got = self.db._collection.get(ids=list(doc_ids), include=["embeddings"])
+        if not got["ids"]:
+            return []
+        cos = np.asarray(got["embeddings"], dtype=np.float32) @ np.asarray(vector, dtype=np.float32)
+        # skala sama dengan range_search: jarak L2 kuadrat lewat score_fn Chroma
+        score_fn = self.db._select_relevance_score_fn()
+        scores = {i: score_fn(float(2.0 - 2.0 * c)) for i, c in zip(got["ids"], cos)}
+        if threshold is not None:
+            scores = {i: r for i, r in scores.items() if r >= threshold}
+        docs = self.documents(list(scores))
+        return [(docs[i], float(scores[i])) for i in doc_ids if i in docs]
+
+    def documents(self, doc_ids):
+        got = self.db._collection.get(ids=list(doc_ids), include=["documents", "metadatas"])
+        return {i: Document(page_content=text, metadata=meta)
+                for i, text, meta in zip(got["ids"], got["documents"], got["metadatas"])}
+
+    def neighbor(self, doc, step=1):
+        meta = doc.metadata
+        if meta.get("book") is None or meta.get("seq") is None:
+            return None
+        got = self.db._collection.get(
+            where={"$and": [{"book": meta["book"]}, {"seq": int(meta["seq"]) + step}]},
+            include=["documents", "metadatas"], limit=1,
+        )
+        if not got["ids"]:
+            return None
+        return Document(page_content=got["documents"][0], metadata=got["metadatas"][0])
+
+# =========================
+# Pencarian eksak NumPy
+# =========================
+def where_mask(store, where):
+    # subset where-Chroma yang dipakai build_where/partition_where: {k: v}, {k: {"$in": [...]}},
+    # {"$and": [...]}, {"$or": [...]}, dievaluasi langsung pada tabel metadata chunk store;
+    # kunci in_<field>_<nilai> (asal duplikat, lihat dedup.py) dibaca dari store.flag_rows
+    if not where:
+        return None
+    mask = np.ones(len(store), dtype=bool)
+    for key, cond in where.items():
+        if key == "$and":
+            for sub in cond:
+                mask &= where_mask(store, sub)
+            continue
+        if key == "$or":
+            any_of = np.zeros(len(store), dtype=bool)
+            for sub in cond:
+                any_of |= where_mask(store, sub)
+            mask &= any_of
+            continue
+        if key not in store.meta.dtype.names:
+            col = np.zeros(len(store), dtype=bool)
+            col[store.flag_rows(key)] = True
+        else:
+            col = np.asarray(store.meta[key])
+        encode = (lambda v: store.books.index(v) if v in store.books else -1) if key == "book" else (lambda v: v)
+        if isinstance(cond, dict):
+            if set(cond) != {"$in"}:
+                raise ValueError(f"Operator filter tidak didukung di chunk store: {cond}")
+            mask &= np.isin(col, [encode(v) for v in cond["$in"]])
+        else:
+            mask &= col == encode(cond)
+    return mask
+
+def partition_where(where, partitions):
+    # where + batas buku hasil routing, dalam bentuk where Chroma; chunk
+    # perwakilan yang juga berasal dari buku tersebut (dedup) ikut terpilih
+    if not partitions:
+        return where
+    clause = {"$or": [{"book": {"$in": list(partitions)}}]
+                     + [{provenance_key("book", p): True} for p in partitions]}
+    return {"$and": [where, clause]} if where else clause
+
+def partition_ranges(store):
+    # {buku: (baris awal, baris akhir)}; corpus.chunks ditulis per buku sehingga
+    # tiap buku menempati rentang baris yang kontigu
+    book = np.asarray(store.meta["book"])
+    if not len(book):
+        return {}
+    starts = np.flatnonzero(np.r_[True, book[1:] != book[:-1]])
+    ends = np.r_[starts[1:], len(book)]
+    ranges = {}
+    for s, e in zip(starts, ends):
+        name = store.books[book[s]]
+        if name in ranges:
+            raise ValueError(f"Chunk buku {name} tidak kontigu di {CORPUS_FILE}; jalankan ulang indexer.py")
+        ranges[name] = (int(s), int(e))
+    return ranges
+
+def cos_to_relevance(cos):
+    # Chroma "l2" memberi jarak kuadrat: d = 2 - 2cos (vektor ternormalisasi);
+    # LangChain _euclidean_relevance_score_fn: relevance = 1 - d/sqrt(2)
+    return 1.0 - np.sqrt(2.0) * (1.0 - cos)
+
+def relevance_to_cos(relevance):
+    # kebalikan cos_to_relevance: threshold relevance -> threshold cosine
+    return 1.0 - (1.0 - relevance) / np.sqrt(2.0)
+
+class NumpyBackend(RetrievalBackend):
+    name = "numpy"
+    partitioned = True
+
+    def __init__(self, embedding, chroma_dir, dtype=VECTOR_DTYPE):
+        super().__init__(embedding)
+        self.store = ChunkStore(os.path.join(chroma_dir, CORPUS_FILE))
+        vectors = np.load(os.path.join(chroma_dir, VECTORS_FILE), mmap_mode="r")
+        if len(vectors) != len(self.store):
+            raise ValueError(f"{VECTORS_FILE} ({len(vectors)}) tidak sejajar dengan {CORPUS_FILE} "
+                             f"({len(self.store)}); jalankan ulang indexer.py")
+        # satu array kontigu di RAM. float16 memotong memori setengahnya, tetapi
+        # matmul float16 di NumPy tidak lewat BLAS (lebih lambat dari float32)
+        self.vectors = np.ascontiguousarray(vectors, dtype=np.dtype(dtype))
+        self.partitions = partition_ranges(self.store)
+
+    def _merged_rows(self, partitions, spans):
+        # chunk perwakilan di luar rentang partisi yang juga berasal dari buku
+        # partisi tersebut (dedup, in_book_<buku>)
+        extra = np.unique(np.concatenate(
+            [self.store.flag_rows(provenance_key("book", p)) for p in partitions] or [np.zeros(0, np.int64)]))
+        for s, e in spans:
+            extra = extra[(extra < s) | (extra >= e)]
+        return extra
+
+    def _scores(self, vector, filter=None, partitions=None):
+        # (baris, cosine); bila partitions diberikan hanya rentang baris buku
+        # tersebut yang dikalikan, sehingga biaya sebanding dengan ukuran partisi
+        q = np.asarray(vector, dtype=self.vectors.dtype)
+        if partitions:
+            spans = [self.partitions[p] for p in partitions if p in self.partitions]
+            extra = self._merged_rows(partitions, spans)
+            rows = np.concatenate([np.arange(s, e) for s, e in spans] + [extra])
+            cos = np.concatenate([self.vectors[s:e] @ q for s, e in spans] + [self.vectors[extra] @ q])
+        else:
+            rows = np.arange(len(self.vectors))
+            cos = self.vectors @ q
+        cos = cos.astype(np.float32)
+        mask = where_mask(self.store, filter)
+        if mask is not None:
+            cos[~mask[rows]] = -np.inf
+        return rows, cos
+
+    def _hydrate(self, rows, cos):
+        return [
+            (Document(page_content=self.store.text(int(r)), metadata=self.store.metadata(int(r))), float(rel))
+            for r, rel in zip(rows, cos_to_relevance(cos))
+        ]
+
+    @staticmethod
+    def _top(candidates, cos, k):
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(-cos[candidates], k - 1)[:k]]
+        return candidates[np.argsort(-cos[candidates], kind="stable")]
+
+    def search_by_vector(self, vector, k=20, filter=None, partitions=None):
+        rows, cos = self._scores(vector, filter, partitions)
+        top = self._top(np.flatnonzero(np.isfinite(cos)), cos, k) if k > 0 else np.zeros(0, np.int64)
+        return self._hydrate(rows[top], cos[top])
+
+    def range_search(self, vector, threshold, max_count=10, filter=None, partitions=None):
+        rows, cos = self._scores(vector, filter, partitions)
+        survivors = np.flatnonzero(cos >= relevance_to_cos(threshold))
+        top = self._top(survivors, cos, max_count) if max_count > 0 else np.zeros(0, np.int64)
+        return self._hydrate(rows[top], cos[top])
+
+    def range_search_batch(self, vectors, threshold, max_count=10, filter=None, partitions=None):
+        # satu perkalian matriks (N x B) untuk semua pertanyaan; partisi per
+        # pertanyaan diterapkan sebagai mask kolom, karena satu matmul penuh
+        # lebih murah daripada B perkalian kecil per partisi
+        q = np.asarray(vectors, dtype=self.vectors.dtype).reshape(len(vectors), -1)
+        cos = (self.vectors @ q.T).astype(np.float32)
+        mask = where_mask(self.store, filter)
+        if mask is not None:
+            cos[~mask] = -np.inf
+        min_cos = relevance_to_cos(threshold)
+        out = []
+        for j, parts in enumerate(partitions or [None] * len(q)):
+            col = cos[:, j]
+            if parts:
+                inside = np.zeros(len(col), dtype=bool)
+                spans = [self.partitions[p] for p in parts if p in self.partitions]
+                for s, e in spans:
+                    inside[s:e] = True
+                inside[self._merged_rows(parts, spans)] = True
+                col = np.where(inside, col, -np.inf)
+            survivors = np.flatnonzero(col >= min_cos)
+            top = self._top(survivors, col, max_count) if max_count > 0 else np.zeros(0, np.int64)
+            out.append(self._hydrate(top, col[top]))
+        return out
+
+    def fetch(self, doc_ids, vector, threshold=None):
+        rows = np.array([r for r in map(self.store.row_of, doc_ids) if r >= 0], dtype=np.int64)
+        if not len(rows):
+            return []
+        cos = (self.vectors[rows] @ np.asarray(vector, dtype=self.vectors.dtype)).astype(np.float32)
+        if threshold is not None:
+            keep = cos >= relevance_to_cos(threshold)
+            rows, cos = rows[keep], cos[keep]
+        return self._hydrate(rows, cos)
+
+    def documents(self, doc_ids):
+        out = {}
+        for doc_id in doc_ids:
+            row = self.store.row_of(doc_id)
+            if row >= 0:
+                out[doc_id] = Document(page_content=self.store.text(row), metadata=self.store.metadata(row))
+        return out
+
+    def neighbor(self, doc, step=1):
+        # corpus.chunks ditulis per buku urut seq; dedup bisa membuat lubang,
+        # jadi baris tetangga dicek ulang book + seq-nya
+        seq = doc.metadata.get("seq")
+        row = self.store.row_of(doc.metadata.get("doc_id") or "")
+        r = row + step
+        if seq is None or row < 0 or not 0 <= r < len(self.store):
+            return None
+        meta = self.store.metadata(r)
+        if meta["book"] != doc.metadata.get("book") or meta["seq"] != int(seq) + step:
+            return None
+        return Document(page_content=self.store.text(r), metadata=meta)
+
+def make_backend(name, db=None, embedding=None, chroma_dir=None, dtype=VECTOR_DTYPE):
+    if name == "chroma":
+        return ChromaBackend(db, embedding)
+    if name == "numpy":
+        return NumpyBackend(embedding or db.embeddings, chroma_dir, dtype)
+    raise ValueError(f"RAG_RETRIEVAL_BACKEND tidak dikenal: {name} (pilih chroma atau numpy)")
+
+# =========================
+# Ekspor vektor dari Chroma (dipanggil indexer)
+# =========================
+def export_vectors(db, chroma_dir):
+    # Baris ke-i vektor = baris ke-i corpus.chunks, diambil apa adanya dari Chroma
+    with ChunkStore(os.path.join(chroma_dir, CORPUS_FILE)) as store:
+        ids = [store.doc_id(row) for row in range(len(store))]
+    out = None
+    pos = {doc_id: i for i, doc_id in enumerate(ids)}
+    for start in range(0, len(ids), EXPORT_BATCH):
+        got = db._collection.get(ids=ids[start:start + EXPORT_BATCH], include=["embeddings"])
+        for doc_id, vec in zip(got["ids"], got["embeddings"]):
+            if out is None:
+                out = np.zeros((len(ids), len(vec)), dtype=np.float32)
+            out[pos[doc_id]] = vec
+    if out is None:
+        out = np.zeros((0, 0), dtype=np.float32)
+
+    path = os.path.join(chroma_dir, VECTORS_FILE)
+    tmp = path + ".tmp.npy"
+    np.save(tmp, out)
+    os.replace(tmp, path)
+    print(f"[INFO] Vektor korpus: {out.shape[0]} x {out.shape[1] if out.ndim == 2 else 0} -> {path}")
+    return path
+
+# =========================
+# Benchmark Chroma vs NumPy
+# =========================
+SCORE_TOL = 1e-3   # selisih skor maks Chroma vs NumPy (float32); float16 butuh lebih longgar
+
+def benchmark(questions, chroma_dir, k=20, dtype=VECTOR_DTYPE, repeat=3, threshold=0.75):
+    from langchain_community.vectorstores import Chroma
+    from embedding_cache import CachedEmbeddings
+    from onnx_encoder import query_encoder
+
+    embedding = CachedEmbeddings(query_encoder("torch"))
+    db = Chroma(persist_directory=chroma_dir, embedding_function=embedding)
+    backends = [ChromaBackend(db), NumpyBackend(embedding, chroma_dir, dtype)]
+    vectors = [embedding.embed_query(q) for q in questions]
+
+    times = {b.name: [] for b in backends}
+    results = {b.name: [] for b in backends}
+    for vec in vectors:
+        for b in backends:
+            best = float("inf")
+            for _ in range(repeat):
+                t0 = time.perf_counter()
+                res = b.search_by_vector(vec, k=k)
+                best = min(best, time.perf_counter() - t0)
+            times[b.name].append(best)
+            results[b.name].append(res)
+
+    # range search: NumPy harus menyimpan baris yang persis sama dengan Chroma
+    range_same, range_diff = 0, []
+    for qi, vec in enumerate(vectors):
+        ref, alt = (b.range_search(vec, threshold, max_count=k) for b in backends)
+        ref_ids = {d.metadata.get("doc_id") for d, _ in ref}
+        alt_ids = {d.metadata.get("doc_id") for d, _ in alt}
+        if ref_ids == alt_ids:
+            range_same += 1
+        else:
+            range_diff.append((questions[qi], sorted(ref_ids - alt_ids), sorted(alt_ids - ref_ids)))
+
+    overlap, top1, score_diff = [], [], []
+    for ref, alt in zip(results["chroma"], results["numpy"]):
+        ref_ids = [d.metadata.get("doc_id") for d, _ in ref]
+        alt_ids = [d.metadata.get("doc_id") for d, _ in alt]
+        overlap.append(len(set(ref_ids) & set(alt_ids)) / max(len(ref_ids), 1))
+        top1.append(bool(ref_ids) and bool(alt_ids) and ref_ids[0] == alt_ids[0])
+        ref_scores = dict(zip(ref_ids, (s for _, s in ref)))
+        score_diff.extend(abs(ref_scores[i] - s) for i, (_, s) in zip(alt_ids, alt) if i in ref_scores)
+
+    print(f"[BENCH] {len(questions)} pertanyaan, top-{k}, numpy dtype={dtype}")
+    for name, t in times.items():
+        t = np.asarray(t) * 1000
+        print(f"  {name:6s}: median {np.median(t):7.2f} ms | p95 {np.percentile(t, 95):7.2f} ms")
+    print(f"  overlap top-{k} rata-rata: {np.mean(overlap):.1%} | top-1 sama: {np.mean(top1):.1%}")
+    max_diff = max(score_diff) if score_diff else 0.0
+    print(f"  selisih skor maks: {max_diff:.5f} (toleransi {SCORE_TOL})")
+    print(f"  range search (relevance >= {threshold}): {range_same}/{len(vectors)} pertanyaan baris sama")
+    for q, only_chroma, only_numpy in range_diff[:5]:
+        print(f"    [BEDA] '{q}': hanya chroma={only_chroma} | hanya numpy={only_numpy}")
+    return {"times": times, "overlap": float(np.mean(overlap)), "top1": float(np.mean(top1)),
+            "max_score_diff": max_diff, "range_mismatch": len(range_diff)}
+
+def main(argv=None):
+    from indexer import CHROMA_DIR
+    from onnx_encoder import load_questions
+
+    parser = argparse.ArgumentParser(description="Benchmark backend retrieval (Chroma vs NumPy)")
+    parser.add_argument("--chroma-dir", default=CHROMA_DIR)
+    parser.add_argument("--questions", help="file teks, satu pertanyaan per baris")
+    parser.add_argument("--db-uri", help="ambil dari tabel queries, mis. mysql+pymysql://root:@localhost/ragdb")
+    parser.add_argument("--limit", type=int, default=None)
+    parser.add_argument("--k", type=int, default=20)
+    parser.add_argument("--dtype", choices=["float32", "float16"], default=VECTOR_DTYPE)
+    parser.add_argument("--threshold", type=float, default=0.75, help="relevance minimum range search (COS_ABS)")
+    args = parser.parse_args(argv)
+
+    if not (args.questions or args.db_uri):
+        parser.error("butuh --questions atau --db-uri")
+    questions = load_questions(args.questions, args.db_uri, args.limit)
+    res = benchmark(questions, args.chroma_dir, k=args.k, dtype=args.dtype, threshold=args.threshold)
+    tol = SCORE_TOL if args.dtype == "float32" else 1e-2
+    if res["max_score_diff"] > tol or res["range_mismatch"]:
+        print("[WARN] Backend NumPy tidak setara dengan Chroma")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
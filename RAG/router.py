@@ -0,0 +1,104 @@
+import os
+import json
+import numpy as np
+
+from chunk_store import ChunkStore, CORPUS_FILE
+from lexical import tokenize
+from retrieval import partition_ranges, VECTORS_FILE
+
+PARTITIONS_FILE = "corpus_partitions.npz"
+ROUTE_TOP_N     = 2       # partisi teratas menurut kemiripan centroid
+ROUTE_MIN_GAP   = 0.015   # selisih cosine partisi ke-N dan ke-(N+1); di bawahnya tidak yakin
+ROUTE_MAX_SHARE = 0.6     # partisi terpilih > 60% korpus -> langsung cari penuh
+
+# =========================
+# Bangun partisi (dipanggil indexer setelah corpus_vectors.npy ditulis)
+# =========================
+# Satu partisi = satu buku: rentang baris di corpus.chunks/corpus_vectors.npy,
+# centroid (rata-rata vektor chunk, dinormalisasi) dan leksikon era dari
+# config buku (key `era` di books/*.toml).
+def build_partitions(chroma_dir, eras=None):
+    eras = eras or {}
+    with ChunkStore(os.path.join(chroma_dir, CORPUS_FILE)) as store:
+        ranges = partition_ranges(store)
+    vectors = np.load(os.path.join(chroma_dir, VECTORS_FILE), mmap_mode="r")
+
+    names = list(ranges)
+    centroids = np.zeros((len(names), vectors.shape[1] if vectors.ndim == 2 else 0), dtype=np.float32)
+    for i, name in enumerate(names):
+        s, e = ranges[name]
+        c = np.asarray(vectors[s:e], dtype=np.float32).mean(axis=0)
+        centroids[i] = c / max(float(np.linalg.norm(c)), 1e-12)
+
+    path = os.path.join(chroma_dir, PARTITIONS_FILE)
+    tmp = path + ".tmp.npz"
+    np.savez(
+        tmp, names=np.array(names, dtype=str),
+        ranges=np.array([ranges[n] for n in names], dtype=np.int64).reshape(-1, 2),
+        centroids=centroids,
+        eras=np.array(json.dumps({n: list(eras.get(n, [])) for n in names}, ensure_ascii=False)),
+    )
+    os.replace(tmp, path)
+    print(f"[INFO] Partisi: {len(names)} buku -> {path}")
+    return path
+
+def _phrase(text):
+    # frasa dicocokkan per token utuh: "pra-aksara" == "pra aksara"
+    return " " + " ".join(tokenize(text)) + " "
+
+# =========================
+# Router pertanyaan -> partisi
+# =========================
+class Router:
+    def __init__(self, chroma_dir):
+        data = np.load(os.path.join(chroma_dir, PARTITIONS_FILE))
+        self.names = data["names"].tolist()
+        self.sizes = np.diff(data["ranges"], axis=1).ravel()
+        self.centroids = data["centroids"]
+        eras = json.loads(str(data["eras"]))
+        self.lexicon = {n: [_phrase(t) for t in eras.get(n, []) if tokenize(t)] for n in self.names}
+        self.routed = 0
+        self.full = 0
+
+    def _share(self, names):
+        chosen = [self.names.index(n) for n in names]
+        return float(self.sizes[chosen].sum()) / max(int(self.sizes.sum()), 1)
+
+    def route(self, question, embed=None):
+        # Mengembalikan (daftar buku atau None = cari penuh, alasan).
+        # Leksikon era dicek dulu (tanpa embedding); embed dipanggil hanya bila
+        # perlu kemiripan centroid.
+        partitions, reason = self._route(question, embed)
+        if partitions is None:
+            self.full += 1
+        else:
+            self.routed += 1
+        return partitions, reason
+
+    def _route(self, question, embed):
+        if len(self.names) <= 1:
+            return None, "satu partisi"
+
+        text = _phrase(question)
+        era_hits = [n for n in self.names if any(t in text for t in self.lexicon[n])]
+        if era_hits:
+            if self._share(era_hits) > ROUTE_MAX_SHARE:
+                return None, f"era terlalu luas ({', '.join(era_hits)})"
+            return era_hits, "era"
+
+        if embed is None or len(self.names) <= ROUTE_TOP_N:
+            return None, "tanpa era"
+        sims = self.centroids @ np.asarray(embed(question), dtype=np.float32)
+        order = np.argsort(-sims)
+        gap = float(sims[order[ROUTE_TOP_N - 1]] - sims[order[ROUTE_TOP_N]])
+        chosen = [self.names[i] for i in order[:ROUTE_TOP_N]]
+        if gap < ROUTE_MIN_GAP:
+            return None, f"centroid ragu (gap {gap:.3f})"
+        if self._share(chosen) > ROUTE_MAX_SHARE:
+            return None, "centroid terlalu luas"
+        return chosen, f"centroid (gap {gap:.3f})"
+
+    def stats(self):
+        total = self.routed + self.full
+        return {"routed": self.routed, "full": self.full,
+                "routed_rate": self.routed / total if total else 0.0}
@@ -0,0 +1,181 @@
+import os
+import math
+import time
+import queue
+import threading
+
+QUEUE_MAX       = int(os.getenv("RAG_QUEUE_MAX", "8"))             # permintaan menunggu maksimal
+REQUEST_TIMEOUT = float(os.getenv("RAG_REQUEST_TIMEOUT", "90"))    # detik sejak masuk antrean
+SERVICE_GUESS   = 5.0    # perkiraan detik per jawaban sebelum ada data (untuk Retry-After)
+SERVICE_ALPHA   = 0.2    # bobot EWMA waktu layanan
+
+class SchedulerError(Exception):
+    pass
+
+class QueueFull(SchedulerError):
+    def __init__(self, retry_after):
+        super().__init__(f"antrean penuh, coba lagi dalam {retry_after} detik")
+        self.retry_after = retry_after
+
+class NotReady(QueueFull):
+    # model masih dimuat: ditolak seperti antrean penuh (503 + Retry-After)
+    def __init__(self, retry_after):
+        super().__init__(retry_after)
+        self.args = (f"model masih dimuat, coba lagi dalam {retry_after} detik",)
+
+class DeadlineExceeded(SchedulerError):
+    pass
+
+class Cancelled(SchedulerError):
+    pass
+
+# =========================
+# Satu permintaan di antrean
+# =========================
+class Job:
+    def __init__(self, fn, args, kwargs, stream, timeout, depth):
+        self.fn, self.args, self.kwargs, self.stream = fn, args, kwargs, stream
+        self.enqueued = time.perf_counter()
+        self.deadline = self.enqueued + timeout
+        self.depth = depth        # permintaan di depannya saat masuk (termasuk yang sedang dilayani)
+        self.started = None
+        self.finished = None
+        self._cancelled = threading.Event()
+        self._events = queue.Queue()
+
+    def cancel(self):
+        # klien putus / batas waktu: worker berhenti di token berikutnya atau melewati job
+        self._cancelled.set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def _next(self):
+        try:
+            return self._events.get(timeout=max(self.deadline - time.perf_counter(), 0))
+        except queue.Empty:
+            self.cancel()
+            raise DeadlineExceeded("tidak selesai dalam batas waktu")
+
+    def result(self):
+        # untuk fn biasa: tunggu nilai kembali (atau exception dari worker)
+        kind, value = self._next()
+        if kind == "error":
+            raise value
+        return value
+
+    def events(self):
+        # untuk fn generator: item diteruskan saat dihasilkan worker
+        while True:
+            kind, value = self._next()
+            if kind == "item":
+                yield value
+            elif kind == "error":
+                raise value
+            else:
+                return
+
+    def timing(self):
+        now = time.perf_counter()
+        started = self.started or now
+        return {
+            "queue_wait_ms": (started - self.enqueued) * 1000,
+            "service_ms": ((self.finished or now) - started) * 1000 if self.started else 0.0,
+            "queue_depth": self.depth,
+        }
+
+# =========================
+# Scheduler inferensi: satu worker pemilik model, antrean terbatas
+# =========================
+# Semua panggilan pipeline RAG (embedding, Chroma, llama.cpp) berjalan berurutan
+# di satu thread worker, jadi thread Flask tidak pernah berebut model. Antrean
+# penuh -> QueueFull seketika dengan perkiraan Retry-After; job yang dibatalkan
+# atau lewat deadline saat masih antre dilewati tanpa menyentuh model.
+# prepare() (mis. load_models) dipanggil sebelum job mulai dilayani: waktu muat
+# model terhitung waktu antre, bukan waktu layanan/EWMA Retry-After.
+class InferenceScheduler:
+    def __init__(self, max_queue=QUEUE_MAX, timeout=REQUEST_TIMEOUT, prepare=None):
+        self.timeout = timeout
+        self.prepare = prepare
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._busy = False
+        self.service_s = SERVICE_GUESS
+        self.served = 0
+        self.rejected = 0
+        self.expired = 0
+        self.cancelled = 0
+        threading.Thread(target=self._worker, name="inference-worker", daemon=True).start()
+
+    def depth(self):
+        return self._queue.qsize() + int(self._busy)
+
+    def retry_after(self):
+        return max(1, math.ceil(self.service_s * (self.depth() + 1)))
+
+    def submit(self, fn, *args, stream=False, timeout=None, **kwargs):
+        job = Job(fn, args, kwargs, stream, timeout or self.timeout, self.depth())
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            self.rejected += 1
+            raise QueueFull(self.retry_after()) from None
+        return job
+
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            if self.prepare is not None:
+                try:
+                    self.prepare()
+                except Exception as e:
+                    job._events.put(("error", e))
+                    continue
+            if job.cancelled:
+                self.cancelled += 1
+                job._events.put(("error", Cancelled("dibatalkan sebelum diproses")))
+                continue
+            if time.perf_counter() > job.deadline:
+                self.expired += 1
+                job._events.put(("error", DeadlineExceeded("kedaluwarsa di antrean")))
+                continue
+            self._busy = True
+            job.started = time.perf_counter()
+            try:
+                if job.stream:
+                    self._run_stream(job)
+                else:
+                    job._events.put(("result", job.fn(*job.args, **job.kwargs)))
+                self.served += 1
+            except Cancelled as e:
+                self.cancelled += 1
+                job._events.put(("error", e))
+            except DeadlineExceeded as e:
+                self.expired += 1
+                job._events.put(("error", e))
+            except Exception as e:
+                job._events.put(("error", e))
+            finally:
+                job.finished = time.perf_counter()
+                self._busy = False
+                self.service_s += SERVICE_ALPHA * ((job.finished - job.started) - self.service_s)
+                t = job.timing()
+                print(f"[SCHED] antre {t['queue_wait_ms']:.0f} ms | layanan {t['service_ms']:.0f} ms "
+                      f"| depth {t['queue_depth']} | sisa antrean {self._queue.qsize()}")
+
+    def _run_stream(self, job):
+        it = job.fn(*job.args, **job.kwargs)
+        try:
+            for item in it:
+                if job.cancelled:
+                    raise Cancelled("klien terputus")
+                if time.perf_counter() > job.deadline:
+                    raise DeadlineExceeded("lewat batas waktu saat generasi")
+                job._events.put(("item", item))
+        finally:
+            it.close()   # menghentikan generasi llama.cpp yang sedang berjalan
+        job._events.put(("end", None))
+
+    def stats(self):
+        return {"depth": self.depth(), "served": self.served, "rejected": self.rejected,
+                "expired": self.expired, "cancelled": self.cancelled, "service_s": self.service_s}